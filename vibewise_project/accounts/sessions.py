@@ -0,0 +1,34 @@
+"""
+Session engine that coalesces writes (SESSION_ENGINE = 'accounts.sessions')
+
+With SESSION_SAVE_EVERY_REQUEST the session middleware saves on every
+request so the expiry keeps sliding. This store reads through the cache like
+cached_db, but an unmodified session is only written back once its stored
+expiry is SESSION_REFRESH_INTERVAL seconds old. Status polls therefore cost a
+cache read instead of a session-table UPDATE, and the stored expiry trails
+the cookie's by at most that interval.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+# Unix time of the last write, kept alongside the session data
+WRITTEN_AT_KEY = '_session_written_at'
+
+
+class SessionStore(CachedDBStore):
+
+    def _refresh_interval(self):
+        return getattr(settings, 'SESSION_REFRESH_INTERVAL', 900)
+
+    def _refresh_due(self):
+        written_at = self._session.get(WRITTEN_AT_KEY)
+        return written_at is None or time.time() - written_at >= self._refresh_interval()
+
+    def save(self, must_create=False):
+        if not must_create and self.session_key and not self.modified and not self._refresh_due():
+            return
+        # Written straight to the cache dict so it doesn't mark the session modified
+        self._session[WRITTEN_AT_KEY] = int(time.time())
+        super().save(must_create=must_create)
@@ -1,3 +1,37 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.test import TestCase, override_settings
+
+from accounts.sessions import SessionStore, WRITTEN_AT_KEY
+
+
+@override_settings(SESSION_REFRESH_INTERVAL=900)
+class SessionStoreTests(TestCase):
+
+    def setUp(self):
+        store = SessionStore()
+        store['user'] = 'listener'
+        store.save()
+        self.session_key = store.session_key
+
+    def test_unmodified_session_is_not_rewritten(self):
+        store = SessionStore(self.session_key)
+        store.load()
+        with self.assertNumQueries(0):
+            store.save()
+
+    def test_modified_session_is_written(self):
+        store = SessionStore(self.session_key)
+        store['theme'] = 'dark'
+        store.save()
+        self.assertEqual(SessionStore(self.session_key)['theme'], 'dark')
+
+    def test_stale_session_is_refreshed(self):
+        store = SessionStore(self.session_key)
+        written_at = store[WRITTEN_AT_KEY]
+        with mock.patch('accounts.sessions.time.time', return_value=time.time() + 901):
+            store.save()
+        decoded = Session.objects.get(session_key=self.session_key).get_decoded()
+        self.assertGreater(decoded[WRITTEN_AT_KEY], written_at)
@@ -0,0 +1,240 @@
+"""
+Asyncio-native Spotify Web API client
+
+Covers the endpoints SpotifyService uses. All clients created on the same
+event loop share one httpx connection pool and one concurrency limiter, so a
+single ASGI worker can keep many Spotify calls in flight without opening a
+connection per request. Views using the client are wrapped in
+@releases_pool, which closes the pool of the per-request loops WSGI uses.
+"""
+import asyncio
+import base64
+import functools
+import logging
+import time
+import weakref
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+from .metrics import record_spotify_call
+from .search_cache import search_cache
+
+logger = logging.getLogger(__name__)
+
+API_BASE = 'https://api.spotify.com/v1'
+TOKEN_URL = 'https://accounts.spotify.com/api/token'
+
+# Spotify accepts at most 100 URIs per add-items request
+ADD_ITEMS_CHUNK = 100
+
+_pools = weakref.WeakKeyDictionary()
+
+
+class SpotifyAPIError(Exception):
+    """Non-2xx response from Spotify"""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"Spotify API error {status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+def _config():
+    config = {
+        'MAX_CONNECTIONS': 100,
+        'MAX_KEEPALIVE': 20,
+        'MAX_CONCURRENCY': 50,
+        'TIMEOUT': 10.0,
+        'MAX_RETRIES': 2,
+    }
+    config.update(getattr(settings, 'SPOTIFY_ASYNC_CLIENT', {}))
+    return config
+
+
+class _Pool:
+    """Connection pool and concurrency limiter bound to one event loop"""
+
+    def __init__(self):
+        config = _config()
+        self.client = httpx.AsyncClient(
+            timeout=config['TIMEOUT'],
+            limits=httpx.Limits(
+                max_connections=config['MAX_CONNECTIONS'],
+                max_keepalive_connections=config['MAX_KEEPALIVE'],
+            ),
+        )
+        self.limiter = asyncio.Semaphore(config['MAX_CONCURRENCY'])
+        self.max_retries = config['MAX_RETRIES']
+
+
+def _get_pool():
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None or pool.client.is_closed:
+        pool = _pools[loop] = _Pool()
+    return pool
+
+
+async def close_pool():
+    """Close the shared pool for the running loop (e.g. on ASGI shutdown)"""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.client.aclose()
+
+
+def releases_pool(view):
+    """
+    For async views: under WSGI each request runs on its own event loop
+    (async_to_sync), so close that loop's pool when the view returns
+    instead of leaving its connections to the garbage collector
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        finally:
+            if not isinstance(request, ASGIRequest):
+                await close_pool()
+    return wrapper
+
+
+def _retry_after(response, default=1.0, limit=5.0):
+    """Seconds to wait from a Retry-After header (seconds or an HTTP date)"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return default
+    return min(max(seconds, 0.0), limit)
+
+
+def pool_stats():
+    return {
+        'event_loops': len(_pools),
+        'max_concurrency': _config()['MAX_CONCURRENCY'],
+    }
+
+
+def _error_message(response):
+    try:
+        data = response.json()
+    except ValueError:
+        return response.text
+    error = data.get('error')
+    if isinstance(error, dict):
+        return error.get('message', response.text)
+    return data.get('error_description', error or response.text)
+
+
+async def _send(method, url, **kwargs):
+    pool = _get_pool()
+    attempt = 0
+    while True:
+        async with pool.limiter:
+            start = time.perf_counter()
+            response = await pool.client.request(method, url, **kwargs)
+        record_spotify_call(method, url, response.status_code, time.perf_counter() - start)
+
+        if response.status_code == 429 and attempt < pool.max_retries:
+            # Rate limited: wait as instructed, outside the limiter
+            retry_after = _retry_after(response)
+            logger.warning("Spotify rate limited on %s, retrying in %ss", url, retry_after)
+            attempt += 1
+            await asyncio.sleep(retry_after)
+            continue
+
+        if response.status_code >= 400:
+            raise SpotifyAPIError(response.status_code, _error_message(response))
+        if response.status_code == 204 or not response.content:
+            return {}
+        return response.json()
+
+
+async def exchange_code_for_tokens(code, redirect_uri=None):
+    """Exchange an authorization code for access tokens"""
+    auth_str = f"{settings.SPOTIFY_CLIENT_ID}:{settings.SPOTIFY_CLIENT_SECRET}"
+    auth_b64 = base64.b64encode(auth_str.encode()).decode()
+    try:
+        return await _send(
+            'POST', TOKEN_URL,
+            headers={'Authorization': f'Basic {auth_b64}'},
+            data={
+                'grant_type': 'authorization_code',
+                'code': code,
+                'redirect_uri': redirect_uri or settings.SPOTIFY_REDIRECT_URI,
+            },
+        )
+    except SpotifyAPIError as e:
+        raise Exception(f"Failed to get tokens: {e.message}")
+
+
+class AsyncSpotifyClient:
+    """Per-user view over the shared pool; method names follow spotipy"""
+
+    def __init__(self, access_token):
+        self.access_token = access_token
+
+    def _headers(self):
+        return {'Authorization': f'Bearer {self.access_token}'}
+
+    async def _get(self, path, **params):
+        params = {key: value for key, value in params.items() if value is not None}
+        return await _send('GET', f'{API_BASE}{path}', headers=self._headers(), params=params)
+
+    async def _post(self, path, payload):
+        return await _send('POST', f'{API_BASE}{path}', headers=self._headers(), json=payload)
+
+    async def current_user(self):
+        return await self._get('/me')
+
+    async def current_user_top_tracks(self, limit=20, offset=0, time_range='medium_term'):
+        return await self._get('/me/top/tracks', limit=limit, offset=offset, time_range=time_range)
+
+    async def current_user_top_artists(self, limit=20, offset=0, time_range='medium_term'):
+        return await self._get('/me/top/artists', limit=limit, offset=offset, time_range=time_range)
+
+    async def user_playlist_create(self, user_id, name, public=True, description=''):
+        return await self._post(f'/users/{user_id}/playlists', {
+            'name': name,
+            'public': public,
+            'description': description,
+        })
+
+    async def playlist_add_items(self, playlist_id, items):
+        """Add track URIs in chunks; returns the last snapshot_id"""
+        result = {}
+        for i in range(0, len(items), ADD_ITEMS_CHUNK):
+            result = await self._post(
+                f'/playlists/{playlist_id}/tracks',
+                {'uris': list(items[i:i + ADD_ITEMS_CHUNK])},
+            )
+        return result
+
+    async def playlist(self, playlist_id, fields=None):
+        return await self._get(f'/playlists/{playlist_id}', fields=fields)
+
+    async def playlist_items(self, playlist_id, fields=None, limit=100, offset=0):
+        return await self._get(
+            f'/playlists/{playlist_id}/tracks',
+            fields=fields, limit=limit, offset=offset, additional_types='track',
+        )
+
+    async def search(self, q, type='track', limit=10, offset=0, market=None):
+        return await self._get('/search', q=q, type=type, limit=limit, offset=offset, market=market)
+
+    async def search_tracks(self, query, limit=5, market=None):
+        """Track search through the shared search cache (IDs and URIs only)"""
+        cached = await search_cache.aget(query, market, limit)
+        if cached is not None:
+            return cached
+        results = await self.search(query, type='track', limit=limit, market=market)
+        return await search_cache.aset(query, results['tracks']['items'], market, limit)
@@ -0,0 +1,288 @@
+"""
+Async versions of the SpotifyViewSet actions
+
+Plain Django async views (DRF 3.14 has no async support) built on
+AsyncSpotifyClient. Served under asgi.py, Spotify I/O is awaited on the
+event loop rather than holding a thread (all the project middleware is
+async-capable); under WSGI they still work but run through async_to_sync.
+Responses match the JSON the SpotifyViewSet actions return, Server-Timing
+header included.
+
+HTTP methods are checked inline: django.views.decorators.http.require_*
+only wrap coroutines from Django 5.0. The same goes for csrf_exempt, so
+views that need it set the attribute themselves.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user, login
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.middleware.csrf import CsrfViewMiddleware
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import User, UserPreferences
+from spotify_integration.models import (
+    SpotifyUser, MoodDetectionResult, SpotifyPlaylist
+)
+from .async_spotify import AsyncSpotifyClient, exchange_code_for_tokens, releases_pool
+from .idempotency import IDEMPOTENCY_HEADER, REPLAY_HEADER, arun_once
+from .metrics import record_cache
+from .pagination import PlaylistPagination
+from .response_cache import CACHE_HEADER, cache_key, get_version
+from .renderers import FastJSONRenderer
+from .serializers import spotify_playlist_rows
+from .timing import request_timer, server_timing, with_timings
+from vibewise_project.db_router import reading_from_replica
+
+logger = logging.getLogger(__name__)
+
+
+def _render(data, status=200, renderer_class=JSONRenderer):
+    return HttpResponse(
+        renderer_class().render(data),
+        status=status,
+        content_type='application/json'
+    )
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except ValueError:
+        return {}
+
+
+async def _current_user(request):
+    user = await sync_to_async(get_user)(request)
+    return user if user.is_authenticated else None
+
+
+def _csrf_failure(request):
+    """CSRF check as DRF's SessionAuthentication does it; a 403 response or None"""
+    check = CsrfViewMiddleware(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+@server_timing
+@releases_pool
+async def connect(request):
+    """Connect Spotify account"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    # Like the SpotifyViewSet action: anonymous callers (the usual case,
+    # straight from the OAuth redirect) send no token, logged-in ones must
+    if await _current_user(request) is not None:
+        failure = _csrf_failure(request)
+        if failure is not None:
+            return failure
+
+    data = _json_body(request)
+    code = data.get('code')
+    redirect_uri = data.get('redirect_uri', settings.SPOTIFY_REDIRECT_URI)
+
+    if not code:
+        return _render({'error': 'Authorization code required'}, status=400)
+
+    try:
+        timer = request_timer(request)
+        tokens = await timer.measure('token_exchange', exchange_code_for_tokens(code, redirect_uri))
+        spotify_user = await timer.measure(
+            'profile', AsyncSpotifyClient(tokens['access_token']).current_user()
+        )
+
+        email = spotify_user.get('email')
+        spotify_id = spotify_user.get('id')
+        display_name = spotify_user.get('display_name', 'Spotify User')
+
+        if not email:
+            email = f"{spotify_id}@spotify.user"
+
+        with timer.stage('save_user'):
+            user, created = await User.objects.aget_or_create(
+                email=email,
+                defaults={
+                    'username': email,
+                    'name': display_name,
+                    'spotify_id': spotify_id,
+                    'spotify_access_token': tokens['access_token'],
+                    'spotify_refresh_token': tokens.get('refresh_token', '')
+                }
+            )
+
+            if not created:
+                user.name = display_name
+                user.spotify_id = spotify_id
+                user.spotify_access_token = tokens['access_token']
+                user.spotify_refresh_token = tokens.get('refresh_token', '')
+                await user.asave()
+            else:
+                user.set_password(User.objects.make_random_password())
+                await user.asave()
+                await UserPreferences.objects.aget_or_create(user=user)
+
+        await timer.measure(
+            'login', sync_to_async(login)(request, user, backend='django.contrib.auth.backends.ModelBackend')
+        )
+
+        return _render(with_timings(request, {
+            'message': 'Spotify connected successfully',
+            'spotify_user': spotify_user,
+            'user': {
+                'id': user.id,
+                'name': user.name,
+                'email': user.email,
+                'spotify_id': user.spotify_id
+            }
+        }))
+
+    except Exception as e:
+        logger.exception("Spotify connection error")
+        return _render({'error': f'Failed to connect Spotify: {str(e)}'}, status=500)
+
+
+# Checked in the view instead
+connect.csrf_exempt = True
+
+
+@server_timing
+@releases_pool
+async def create_playlist(request):
+    """Create a mood playlist; duplicate clicks and client retries run once"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    user = await _current_user(request)
+    if user is None:
+        return _render({'error': 'Not authenticated'}, status=401)
+
+    mood = _json_body(request).get('mood')
+    idempotency_key = request.META.get(IDEMPOTENCY_HEADER, '').strip()
+
+    (status_code, data), replayed = await arun_once(
+        user.pk, idempotency_key, 'create_playlist', mood,
+        lambda: _create_playlist(request, user, mood)
+    )
+    response = _render(data, status=status_code)
+    if replayed:
+        response[REPLAY_HEADER] = 'true'
+    return response
+
+
+async def _create_playlist(request, user, mood):
+    try:
+        spotify_data = await sync_to_async(request.session.get)('spotify_auth', {})
+        access_token = spotify_data.get('access_token')
+
+        if not access_token:
+            return 401, {'error': 'Not authenticated'}
+
+        sp = AsyncSpotifyClient(access_token)
+        playlist_name = f"VibeWise - {mood.title()} Vibes"
+        timer = request_timer(request)
+
+        # Same staging as SpotifyViewSet.create_playlist, with tasks instead of threads
+        top_tracks_task = asyncio.ensure_future(timer.measure(
+            'top_tracks', sp.current_user_top_tracks(limit=30, time_range='medium_term')
+        ))
+        playlist_task = None
+        try:
+            user_profile = await timer.measure('profile', sp.current_user())
+
+            playlist_task = asyncio.ensure_future(timer.measure(
+                'create_playlist', sp.user_playlist_create(user_profile['id'], playlist_name, public=True)
+            ))
+
+            with timer.stage('save_user'):
+                await SpotifyUser.objects.aupdate_or_create(
+                    user=user,
+                    defaults={
+                        'spotify_id': user_profile['id'],
+                        'display_name': user_profile.get('display_name', ''),
+                        'email': user_profile.get('email', ''),
+                        'country': user_profile.get('country', ''),
+                        'access_token': access_token,
+                        'refresh_token': spotify_data.get('refresh_token', ''),
+                        'token_expires_at': datetime.fromtimestamp(spotify_data.get('expires_at', 0))
+                    }
+                )
+                await MoodDetectionResult.objects.acreate(user=user, mood=mood, confidence=0.85)
+
+            top_tracks, new_playlist = await asyncio.gather(top_tracks_task, playlist_task)
+        except BaseException:
+            for task in (top_tracks_task, playlist_task):
+                if task is not None:
+                    task.cancel()
+            raise
+
+        track_uris = [track['uri'] for track in top_tracks['items']]
+        if track_uris:
+            await timer.measure('add_tracks', sp.playlist_add_items(new_playlist['id'], track_uris))
+        actual_tracks = len(track_uris)
+
+        with timer.stage('save_playlist'):
+            await SpotifyPlaylist.objects.acreate(
+                user=user,
+                spotify_id=new_playlist['id'],
+                name=playlist_name,
+                spotify_url=new_playlist['external_urls']['spotify'],
+                total_tracks=actual_tracks,
+                mood=mood,
+                is_public=True
+            )
+
+        timings = timer.as_dict()
+        logger.info("Created playlist with %s tracks for user %s (%s)",
+                    actual_tracks, user.pk, timer.summary())
+
+        return 200, {
+            'success': True,
+            'message': f'Created playlist with {actual_tracks} tracks!',
+            'spotify_url': new_playlist['external_urls']['spotify'],
+            'playlist': {
+                'name': playlist_name,
+                'total_tracks': actual_tracks
+            },
+            'timings': timings
+        }
+
+    except Exception as e:
+        logger.exception("Error creating playlist")
+        return 500, {'error': str(e)}
+
+
+@server_timing
+async def playlists(request):
+    """Get user's playlists"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    user = await _current_user(request)
+    if user is None:
+        return _render({'error': 'Authentication required'}, status=401)
+
+    version = await sync_to_async(get_version)(user.pk)
+    key = cache_key('playlists', user.pk, version, request.get_full_path())
+    data = await cache.aget(key)
+    record_cache('playlists', data is not None)
+    if data is not None:
+        response = _render(with_timings(request, data), renderer_class=FastJSONRenderer)
+        response[CACHE_HEADER] = 'HIT'
+        return response
+
+    paginator = PlaylistPagination()
+    with reading_from_replica():
+        user_playlists = await sync_to_async(paginator.paginate_queryset)(
+            spotify_playlist_rows.values(SpotifyPlaylist.objects.filter(user=user)), request
+        )
+    data = paginator.get_paginated_data(spotify_playlist_rows.serialize(user_playlists))
+    await cache.aset(key, data, settings.RESPONSE_CACHE_TTL)
+    response = _render(with_timings(request, data), renderer_class=FastJSONRenderer)
+    response[CACHE_HEADER] = 'MISS'
+    return response
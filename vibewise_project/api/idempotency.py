@@ -0,0 +1,288 @@
+"""
+Duplicate-request protection for expensive write endpoints
+
+SingleFlight collapses concurrent identical calls inside a worker so they
+share one execution and its result. Idempotency keys sent by the client
+(``Idempotency-Key`` header) replay the stored response for a configurable
+window, so retries after a slow response don't redo the work.
+
+Across workers the guard is an entry in the shared cache (Redis in
+production), claimed atomically with cache.add(). Callers that find it
+claimed poll, for up to IDEMPOTENCY_WAIT seconds, until the owner stores
+the result and replay it, or give up with a 409. A failed call deletes the
+entry, and a crashed owner's claim expires after IDEMPOTENCY_LEASE seconds.
+
+Without a key only concurrent duplicates are joined: the result is stored
+under the owner's claim token, which only callers that saw the claim know,
+and the claim is removed, so a later identical request runs again.
+Anonymous callers without a session can't be told apart and aren't guarded.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAY_HEADER = 'Idempotent-Replayed'
+
+# Prefix of the cache value while the owner of a guard is running the call
+PENDING = 'pending'
+POLL_INTERVAL = 0.05
+JOINED_RESULT_TTL = 10
+IN_PROGRESS = {'error': 'The same request is still being processed; retry shortly'}
+
+
+class _Call:
+    """A single in-flight execution that followers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared) where shared is True for followers"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'waiting': sum(call.followers for call in self._calls.values()),
+            }
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop"""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, coro_fn):
+        task = self._calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        task = self._calls[key] = asyncio.ensure_future(coro_fn())
+        try:
+            return await asyncio.shield(task), False
+        finally:
+            self._calls.pop(key, None)
+
+    def stats(self):
+        return {'in_flight': len(self._calls)}
+
+
+inflight_calls = SingleFlight()
+async_inflight_calls = AsyncSingleFlight()
+
+
+def _window():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 600)
+
+
+def _lease():
+    return getattr(settings, 'IDEMPOTENCY_LEASE', 60)
+
+
+def _wait():
+    # Polling blocks a sync worker, so duplicates give up well before the lease
+    return min(getattr(settings, 'IDEMPOTENCY_WAIT', 5), _lease())
+
+
+def _cache_key(user_id, scope, idempotency_key):
+    digest = hashlib.sha256(idempotency_key.encode()).hexdigest()[:32]
+    return f'idempotency:{scope}:{user_id}:{digest}'
+
+
+def _guard(user_id, scope, idempotency_key, fingerprint):
+    """(cache key, seconds to replay the result or None, in-process flight key)"""
+    if idempotency_key:
+        return (
+            _cache_key(user_id, scope, idempotency_key), _window(),
+            (scope, user_id, 'key', idempotency_key),
+        )
+    return (
+        _cache_key(user_id, scope, f'fingerprint:{fingerprint}'), None,
+        (scope, user_id, 'fp', fingerprint),
+    )
+
+
+def _new_claim():
+    return f'{PENDING}:{uuid.uuid4().hex}'
+
+
+def _is_claim(stored):
+    return isinstance(stored, str) and stored.startswith(PENDING)
+
+
+def _joined_key(cache_key, claim):
+    return f'{cache_key}:{claim}'
+
+
+def _store(cache_key, claim, keep, status_code, data):
+    if not 200 <= status_code < 300:
+        # Let the client retry a failure
+        cache.delete(cache_key)
+    elif keep:
+        cache.set(cache_key, (status_code, data), keep)
+    else:
+        # Only for the duplicates that saw the claim; the set must come first
+        cache.set(_joined_key(cache_key, claim), (status_code, data), JOINED_RESULT_TTL)
+        cache.delete(cache_key)
+
+
+async def _astore(cache_key, claim, keep, status_code, data):
+    if not 200 <= status_code < 300:
+        await cache.adelete(cache_key)
+    elif keep:
+        await cache.aset(cache_key, (status_code, data), keep)
+    else:
+        await cache.aset(_joined_key(cache_key, claim), (status_code, data), JOINED_RESULT_TTL)
+        await cache.adelete(cache_key)
+
+
+def run_once(request, scope, fingerprint, fn):
+    """
+    Execute ``fn`` (returning a DRF Response) at most once for this user.
+
+    Concurrent calls with the same fingerprint share a single execution.
+    When the client sends an Idempotency-Key, successful responses are kept
+    for IDEMPOTENCY_KEY_TTL seconds and replayed on retries, by any worker.
+    """
+    user_id = request.user.pk if request.user.is_authenticated else request.session.session_key
+    if user_id is None:
+        return fn()
+    idempotency_key = request.META.get(IDEMPOTENCY_HEADER, '').strip()
+    cache_key, keep, flight_key = _guard(user_id, scope, idempotency_key, fingerprint)
+
+    def execute():
+        deadline = time.monotonic() + _wait()
+        claim = _new_claim()
+        seen = None
+        while True:
+            stored = cache.get(cache_key)
+            if seen is not None and stored != seen:
+                # The call we waited on is over
+                joined = cache.get(_joined_key(cache_key, seen))
+                if joined is not None:
+                    logger.info("Joined %s call of another worker for user %s", scope, user_id)
+                    return _replay(joined)
+            if stored is not None and not _is_claim(stored):
+                logger.info("Replaying %s response for user %s", scope, user_id)
+                return _replay(stored)
+            if stored is None:
+                if cache.add(cache_key, claim, _lease()):
+                    break
+                continue
+            seen = stored
+            if time.monotonic() >= deadline:
+                return Response(IN_PROGRESS, status=409)
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = fn()
+        except Exception:
+            cache.delete(cache_key)
+            raise
+        _store(cache_key, claim, keep, response.status_code, response.data)
+        return response
+
+    response, shared = inflight_calls.do(flight_key, execute)
+    if shared:
+        logger.info("Joined in-flight %s call for user %s", scope, user_id)
+        return _replay((response.status_code, response.data))
+    return response
+
+
+async def arun_once(user_id, idempotency_key, scope, fingerprint, coro_fn):
+    """
+    Async counterpart of run_once for plain Django async views.
+
+    ``coro_fn`` returns ``(status_code, data)``; the same pair is returned,
+    along with a flag telling whether it was replayed.
+    """
+    cache_key, keep, flight_key = _guard(user_id, scope, idempotency_key, fingerprint)
+
+    async def execute():
+        deadline = time.monotonic() + _wait()
+        claim = _new_claim()
+        seen = None
+        while True:
+            stored = await cache.aget(cache_key)
+            if seen is not None and stored != seen:
+                joined = await cache.aget(_joined_key(cache_key, seen))
+                if joined is not None:
+                    logger.info("Joined %s call of another worker for user %s", scope, user_id)
+                    return joined, True
+            if stored is not None and not _is_claim(stored):
+                logger.info("Replaying %s response for user %s", scope, user_id)
+                return stored, True
+            if stored is None:
+                if await cache.aadd(cache_key, claim, _lease()):
+                    break
+                continue
+            seen = stored
+            if time.monotonic() >= deadline:
+                return (409, IN_PROGRESS), False
+            await asyncio.sleep(POLL_INTERVAL)
+
+        try:
+            status_code, data = await coro_fn()
+        except Exception:
+            await cache.adelete(cache_key)
+            raise
+        await _astore(cache_key, claim, keep, status_code, data)
+        return (status_code, data), False
+
+    (result, replayed), shared = await async_inflight_calls.do(flight_key, execute)
+    return result, replayed or shared
+
+
+def _replay(stored):
+    status_code, data = stored
+    response = Response(data, status=status_code)
+    response[REPLAY_HEADER] = 'true'
+    return response
@@ -0,0 +1,248 @@
+"""
+Prometheus metrics, scraped from /metrics
+
+- vibewise_http_request_duration_seconds: latency per route (URL name),
+  method and status, recorded by MetricsMiddleware.
+- vibewise_view_stage_duration_seconds: the StageTimer stages of
+  @server_timing views (the detect pipeline, Spotify calls...).
+- vibewise_spotify_requests_total / _request_duration_seconds: every call to
+  the Spotify API per endpoint and status, 429s and urllib3 retries included.
+- vibewise_cache_requests_total: hits and misses per cache; the hit ratio is
+  rate(hit) / rate(hit + miss).
+- vibewise_db_queries_per_request: SQL queries per request and route.
+
+Recording stays off the shared paths: label children are looked up once
+and kept in a plain dict, so the hot path is one dict read and the value
+update. Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR
+(cleared before each start): every worker then writes to its own mmap
+files and the scrape sums them, whichever worker serves it.
+
+Queries are counted through a context variable, which executor threads
+don't inherit: wrap work submitted to a ThreadPoolExecutor with
+in_request_context() so its queries count towards the request.
+"""
+import contextvars
+import functools
+import os
+import time
+from urllib.parse import urlsplit
+
+import requests
+import spotipy
+import urllib3
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess,
+)
+
+from vibewise_project.middleware import HybridMiddleware
+
+REQUEST_LATENCY = Histogram(
+    'vibewise_http_request_duration_seconds', 'Request latency by route',
+    ['route', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+STAGE_LATENCY = Histogram(
+    'vibewise_view_stage_duration_seconds', 'Duration of StageTimer stages in @server_timing views',
+    ['view', 'stage'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+SPOTIFY_CALLS = Counter(
+    'vibewise_spotify_requests', 'Spotify API calls by endpoint and status',
+    ['endpoint', 'method', 'status'],
+)
+SPOTIFY_LATENCY = Histogram(
+    'vibewise_spotify_request_duration_seconds', 'Spotify API call latency',
+    ['endpoint', 'method'],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+CACHE_REQUESTS = Counter(
+    'vibewise_cache_requests', 'Cache lookups by cache and result',
+    ['cache', 'result'],
+)
+DB_QUERIES = Histogram(
+    'vibewise_db_queries_per_request', 'SQL queries run while serving a request',
+    ['route'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
+
+_children = {}
+
+
+def _child(metric, *labels):
+    # .labels() takes the metric's lock on every call; this is a dict read
+    key = (metric, labels)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*labels)
+    return child
+
+
+def record_cache(cache, hit):
+    _child(CACHE_REQUESTS, cache, 'hit' if hit else 'miss').inc()
+
+
+def observe_stages(view, durations):
+    """Record a StageTimer's ``{stage: seconds}`` for ``view``"""
+    for stage, seconds in durations.items():
+        _child(STAGE_LATENCY, view, stage).observe(seconds)
+
+
+# Spotify calls
+
+# Collections whose next path segment is an ID, e.g. /v1/playlists/{id}/tracks
+_ID_COLLECTIONS = {'playlists', 'users', 'tracks', 'artists', 'albums', 'audio-features', 'categories'}
+
+
+def spotify_endpoint(url):
+    """URL path with IDs replaced, to keep the label set small"""
+    parts = urlsplit(str(url)).path.strip('/').split('/')
+    endpoint = []
+    for i, part in enumerate(parts):
+        # Only top level collections: /v1/me/tracks/contains has no ID
+        if i >= 2 and parts[i - 1] in _ID_COLLECTIONS and parts[i - 2] in ('v1', 'browse'):
+            part = '{id}'
+        endpoint.append(part)
+    return '/' + '/'.join(endpoint)
+
+
+def record_spotify_call(method, url, status, seconds=None):
+    endpoint = spotify_endpoint(url)
+    _child(SPOTIFY_CALLS, endpoint, method, str(status)).inc()
+    if seconds is not None:
+        _child(SPOTIFY_LATENCY, endpoint, method).observe(seconds)
+
+
+def _record_spotify_response(response, *args, **kwargs):
+    # Responses that urllib3 retried (429s, 5xx) never reach the hook; count them from its history
+    retries = getattr(response.raw, 'retries', None)
+    for attempt in getattr(retries, 'history', ()):
+        if attempt.status:
+            record_spotify_call(response.request.method, attempt.url or response.url, attempt.status)
+    record_spotify_call(
+        response.request.method, response.url, response.status_code, response.elapsed.total_seconds()
+    )
+
+
+def spotify_session():
+    """
+    requests session for spotipy.Spotify(requests_session=...): spotipy's own
+    retry policy, with every call recorded
+    """
+    session = requests.Session()
+    retry = urllib3.Retry(
+        total=spotipy.Spotify.max_retries,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=spotipy.Spotify.max_retries,
+        backoff_factor=0.3,
+        status_forcelist=spotipy.Spotify.default_retry_codes,
+    )
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.hooks['response'].append(_record_spotify_response)
+    return session
+
+
+# DB queries per request
+
+_query_count = contextvars.ContextVar('db_query_count', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # connection_created fires again on reconnects
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(install_query_counter)
+
+
+def in_request_context(fn):
+    """Wrap ``fn`` for an executor so its queries count towards the current request"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unresolved>'
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """Request latency and query count per route; place it first"""
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        # A list, so queries run from sync_to_async threads count too
+        counter = [0]
+        token = _query_count.set(counter)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_count.reset(token)
+        self._record(request, response, time.perf_counter() - start, counter[0])
+        return response
+
+    async def __acall__(self, request):
+        counter = [0]
+        token = _query_count.set(counter)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_count.reset(token)
+        self._record(request, response, time.perf_counter() - start, counter[0])
+        return response
+
+    @staticmethod
+    def _record(request, response, elapsed, queries):
+        route = _route(request)
+        _child(REQUEST_LATENCY, route, request.method, str(response.status_code)).observe(elapsed)
+        _child(DB_QUERIES, route).observe(queries)
+
+
+def _registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def _scrape_allowed(request):
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', '')
+    if token and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    if request.META.get('REMOTE_ADDR') in allowed_ips:
+        return True
+    # Unprotected only in development
+    return settings.DEBUG and not token and not allowed_ips
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (METRICS_AUTH_TOKEN bearer token or METRICS_ALLOWED_IPS)"""
+    if not _scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,119 @@
+"""
+Keyset (cursor) pagination for per-user listings
+
+Pages are fetched with "WHERE user = ? AND (timestamp, id) < (cursor)
+ORDER BY timestamp DESC, id DESC LIMIT n", a range scan on a composite
+(user, -timestamp, -id) index, so a deep page costs the same as the first.
+The cursor is the opaque position of the last row served; responses keep
+their existing list key and add a ``next`` URL to follow.
+
+Unlike DRF's CursorPagination, the position includes the id, so rows with
+identical timestamps are neither skipped nor repeated and no OFFSET is used.
+"""
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination:
+    """Newest-first pagination on ``timestamp_field`` with the primary key as tie-breaker"""
+
+    timestamp_field = None
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    results_key = 'results'
+    invalid_cursor_message = 'Invalid cursor'
+    parse_timestamp = staticmethod(parse_datetime)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.GET.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, row):
+        # Model instance or values() dict
+        if isinstance(row, dict):
+            timestamp, pk = row[self.timestamp_field], row['id']
+        else:
+            timestamp, pk = getattr(row, self.timestamp_field), row.pk
+        position = f'{timestamp.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        token = request.GET.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            timestamp, pk = base64.urlsafe_b64decode(token.encode()).decode().rsplit('|', 1)
+            timestamp = self.parse_timestamp(timestamp)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if timestamp is None:
+            raise NotFound(self.invalid_cursor_message)
+        return timestamp, pk
+
+    def paginate_queryset(self, queryset, request):
+        """Rows of the requested page; call get_next_link() afterwards"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        field = self.timestamp_field
+
+        queryset = queryset.order_by(f'-{field}', '-pk')
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            timestamp, pk = cursor
+            # (timestamp, id) < (cursor): the <= bound keeps it an index range scan
+            queryset = queryset.filter(
+                Q(**{f'{field}__lte': timestamp}) & ~Q(**{field: timestamp, 'pk__gte': pk})
+            )
+
+        # One extra row tells whether there is a next page, without a COUNT
+        rows = list(queryset[:page_size + 1])
+        self.next_cursor = self.encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_data(self, data):
+        return {self.results_key: data, 'next': self.get_next_link()}
+
+
+class MoodHistoryPagination(KeysetPagination):
+    # Matches the (user, -detected_at, -id) index
+    timestamp_field = 'detected_at'
+
+
+class MoodArchivePagination(KeysetPagination):
+    """Compacted history: one MoodDailyRollup row per day and mood"""
+    timestamp_field = 'day'
+    parse_timestamp = staticmethod(parse_date)
+    cursor_query_param = 'archive_cursor'
+    archive_query_param = 'archive'
+
+    def is_archive_request(self, request):
+        return bool(request.GET.get(self.archive_query_param))
+
+    def get_start_link(self, request, raw_cursor_param):
+        """Link from the last page of raw history to the first archived day"""
+        url = remove_query_param(request.build_absolute_uri(), raw_cursor_param)
+        return replace_query_param(url, self.archive_query_param, 1)
+
+
+class PlaylistPagination(KeysetPagination):
+    # Matches the (user, -created_at, -id) index
+    timestamp_field = 'created_at'
+    page_size = 50
+    results_key = 'playlists'
@@ -0,0 +1,69 @@
+"""
+orjson-backed JSON renderer for the read-heavy list endpoints
+
+Output is byte-for-byte what rest_framework's JSONRenderer produces. orjson
+is only used where both encoders agree; everything else (indented output,
+datetimes, lazy strings, floats that Python writes in exponent notation,
+NaN...) is either handed to DRF's encoder or renders the whole response
+through JSONRenderer. Without orjson installed this is plain JSONRenderer.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+class ExactFloat(float):
+    """
+    A float whose JSON text differs between orjson and json.dumps
+    (e.g. 1e-05 vs 0.00001); its presence sends the response to JSONRenderer.
+    """
+
+
+def json_float(value):
+    """float(value), marked when only json.dumps will format it the same way"""
+    value = float(value)
+    if value == 0 or (1e-4 <= abs(value) < 1e16):
+        return value
+    # Exponent notation, NaN and infinities
+    return ExactFloat(value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer with orjson doing the encoding. Floats in the data should
+    come from json_float(); orjson writes a bare NaN as null.
+    """
+
+    def _default(self, obj):
+        if isinstance(obj, ExactFloat):
+            raise TypeError('Rendered by JSONRenderer')
+        # DRF's encoder, e.g. for datetimes (millisecond precision, 'Z' suffix)
+        return self.encoder_class().default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self._default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            )
+        except orjson.JSONEncodeError:
+            # Unsupported type, non-str key, >64-bit int, ExactFloat...
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def fast_renderer_classes():
+    """DEFAULT_RENDERER_CLASSES with JSONRenderer swapped for FastJSONRenderer"""
+    return [
+        FastJSONRenderer if renderer is JSONRenderer else renderer
+        for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+    ]
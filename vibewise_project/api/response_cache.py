@@ -0,0 +1,81 @@
+"""
+Per-user response cache for read-heavy endpoints
+
+Cached entries embed a per-user version number. Writes to a user's mood
+detections or playlists bump that version (see api.signals), which makes
+every cached response for the user unreachable at once without having to
+track or delete individual keys.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from .metrics import record_cache
+
+CACHE_HEADER = 'X-Cache'
+
+
+def _timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TTL', 300)
+
+
+def _version_key(user_id):
+    return f'respcache:version:{user_id}'
+
+
+def _fresh_version():
+    # Never reuse a number a lost (evicted) version key may have handed out
+    return int(time.time() * 1000)
+
+
+def get_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_user(user_id):
+    """Bump the user's version so all their cached responses miss"""
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _fresh_version(), None)
+
+
+def cache_key(scope, user_id, version, full_path):
+    path_hash = hashlib.md5(full_path.encode()).hexdigest()
+    return f'respcache:{scope}:{user_id}:{version}:{path_hash}'
+
+
+def cache_per_user(scope):
+    """Cache successful responses of a DRF view method per user and URL"""
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return view_method(self, request, *args, **kwargs)
+
+            user_id = request.user.pk
+            key = cache_key(scope, user_id, get_version(user_id), request.get_full_path())
+            cached = cache.get(key)
+            record_cache(scope, cached is not None)
+            if cached is not None:
+                response = Response(cached)
+                response[CACHE_HEADER] = 'HIT'
+                return response
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, _timeout())
+            response[CACHE_HEADER] = 'MISS'
+            return response
+        return wrapper
+    return decorator
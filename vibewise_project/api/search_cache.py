@@ -0,0 +1,71 @@
+"""
+Shared cache for Spotify catalog searches
+
+Top-up searches are built from a small vocabulary (mood keyword x genre),
+so many users send the exact same query. Results live in the Django cache
+(Redis in production, so every worker shares them), keyed by the
+normalised query, market and limit, and hold only track IDs and URIs.
+Eviction is left to the cache backend.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import record_cache
+
+
+def normalise_query(query):
+    return ' '.join(query.lower().split())
+
+
+class SearchResultCache:
+    """Search results in the Django cache, with hit/miss counts for this process"""
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, query, market, limit):
+        digest = hashlib.sha256(normalise_query(query).encode()).hexdigest()[:32]
+        return f"spotify_search:{(market or '').upper()}:{limit}:{digest}"
+
+    def _count(self, value):
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        record_cache('spotify_search', value is not None)
+        return value
+
+    @staticmethod
+    def _value(tracks):
+        return tuple({'id': t['id'], 'uri': t['uri']} for t in tracks if t)
+
+    def get(self, query, market=None, limit=5):
+        return self._count(cache.get(self._key(query, market, limit)))
+
+    def set(self, query, tracks, market=None, limit=5):
+        value = self._value(tracks)
+        cache.set(self._key(query, market, limit), value, self.ttl)
+        return value
+
+    async def aget(self, query, market=None, limit=5):
+        return self._count(await cache.aget(self._key(query, market, limit)))
+
+    async def aset(self, query, tracks, market=None, limit=5):
+        value = self._value(tracks)
+        await cache.aset(self._key(query, market, limit), value, self.ttl)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses}
+
+
+_config = getattr(settings, 'SPOTIFY_SEARCH_CACHE', {})
+search_cache = SearchResultCache(ttl=_config.get('TTL', 3600))
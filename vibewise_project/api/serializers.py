@@ -1,10 +1,15 @@
 """
 API Serializers for VibeWise
 """
-from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from accounts.models import User, UserPreferences
 from mood_detection.models import MoodDetectionResult
 from spotify_integration.models import SpotifyPlaylist
+from .renderers import json_float
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -28,4 +33,91 @@ class SpotifyPlaylistSerializer(serializers.ModelSerializer):
         model = SpotifyPlaylist
         fields = ('id', 'spotify_id', 'name', 'description', 'image_url', 
                  'total_tracks', 'is_public', 'created_at', 'updated_at')
-        read_only_fields = ('id', 'created_at', 'updated_at')
\ No newline at end of file
+        read_only_fields = ('id', 'created_at', 'updated_at')
+
+
+# Field types whose to_representation() leaves a database value of the
+# column's own type unchanged
+_PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+)
+
+
+def _datetime_mapper(field):
+    if (type(field) is not serializers.DateTimeField or hasattr(field, 'timezone')
+            or getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() != ISO_8601):
+        return None
+
+    def to_representation(value, tz):
+        if tz is not None:
+            value = value.astimezone(tz)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return to_representation
+
+
+def _compile_field(name, field, model):
+    """(values() column, mapper, needs_timezone) reproducing field.to_representation"""
+    if len(field.source_attrs) != 1:
+        raise ImproperlyConfigured(f'RowSerializer cannot map nested source {field.source!r}')
+    column = field.source
+
+    if isinstance(field, serializers.ChoiceField):
+        if all(isinstance(key, str) for key in field.choice_strings_to_values.values()):
+            return column, None, False
+    elif isinstance(field, _PASSTHROUGH_FIELDS):
+        return column, None, False
+    elif isinstance(field, serializers.FloatField):
+        return column, json_float, False
+    elif isinstance(field, serializers.FileField):
+        if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            return column, lambda name: name or None, False
+        # Serialized without a request, so the storage URL as-is
+        storage = model._meta.get_field(column).storage
+        return column, lambda name: storage.url(name) if name else None, False
+    else:
+        mapper = _datetime_mapper(field)
+        if mapper is not None:
+            return column, mapper, True
+    return column, field.to_representation, False
+
+
+class RowSerializer:
+    """
+    Read-only, precompiled counterpart of a ModelSerializer for list
+    responses: rows come from ``values()`` instead of model instances, and
+    each field is mapped by a plain function chosen once, giving the same
+    JSON as serializer_class(instances, many=True).data.
+    """
+
+    def __init__(self, serializer_class):
+        model = serializer_class.Meta.model
+        self.fields = [
+            (name, *_compile_field(name, field, model))
+            for name, field in serializer_class().fields.items()
+        ]
+        self.columns = tuple(column for name, column, mapper, needs_tz in self.fields)
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def serialize(self, rows):
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        mappers = [
+            (name, column, (lambda value, m=mapper: m(value, tz)) if needs_tz else mapper)
+            for name, column, mapper, needs_tz in self.fields
+        ]
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, mapper in mappers:
+                value = row[column]
+                item[name] = value if mapper is None or value is None else mapper(value)
+            data.append(item)
+        return data
+
+
+mood_detection_rows = RowSerializer(MoodDetectionSerializer)
+spotify_playlist_rows = RowSerializer(SpotifyPlaylistSerializer)
@@ -1,12 +1,35 @@
+import logging
 import cv2
 import numpy as np
 import base64
 import random
+import time
 import requests
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from spotify_integration.models import SpotifyPlaylist, SpotifyPlaylistTrack, SpotifyTrack, SpotifyUser
+from .metrics import in_request_context, record_spotify_call, spotify_session
+from .search_cache import search_cache
+from .timing import StageTimer
+
+logger = logging.getLogger(__name__)
+# Verbose per-playlist tracing; SPOTIFY_LOG_LEVEL sets its level
+spotify_logger = logging.getLogger(f'{__name__}.spotify')
+
+# Playlist mirror sync: Spotify pages playlist items 100 at a time
+PLAYLIST_PAGE_SIZE = 100
+PLAYLIST_SYNC_WORKERS = 4
+PLAYLIST_ITEM_FIELDS = (
+    'items(added_at,track(id,name,duration_ms,preview_url,popularity,'
+    'artists(name),album(name)))'
+)
 
 class MoodDetectionService:
     """Enhanced Service for detecting mood from facial images"""
@@ -29,23 +52,31 @@ class MoodDetectionService:
             'negative': ['sad', 'melancholic', 'fear', 'angry', 'disgust', 'surprised']
         }
     
-    def detect_mood_from_base64(self, image_data):
-        """Enhanced mood detection from base64 encoded image"""
+    def detect_mood_from_base64(self, image_data, timer=None):
+        """Enhanced mood detection from base64 encoded image
+        
+        Stages (b64decode, imdecode, cascade, classify) are recorded on
+        ``timer`` when a StageTimer is passed.
+        """
+        timer = timer or StageTimer()
         try:
-            image_bytes = base64.b64decode(image_data)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            with timer.stage('b64decode'):
+                image_bytes = base64.b64decode(image_data)
+            with timer.stage('imdecode'):
+                nparr = np.frombuffer(image_bytes, np.uint8)
+                image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             
             if image is None:
                 return None
             
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(
-                gray, 
-                scaleFactor=1.1, 
-                minNeighbors=5,
-                minSize=(30, 30)
-            )
+            with timer.stage('cascade'):
+                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                faces = self.face_cascade.detectMultiScale(
+                    gray, 
+                    scaleFactor=1.1, 
+                    minNeighbors=5,
+                    minSize=(30, 30)
+                )
             
             if len(faces) == 0:
                 return {'mood': 'neutral', 'confidence': 0.5}
@@ -55,7 +86,8 @@ class MoodDetectionService:
             
             face = gray[y:y+h, x:x+w]
             
-            mood, confidence = self._analyze_facial_features(face)
+            with timer.stage('classify'):
+                mood, confidence = self._analyze_facial_features(face)
             
             return {
                 'mood': mood,
@@ -63,7 +95,7 @@ class MoodDetectionService:
             }
             
         except Exception as e:
-            print(f"Error in mood detection: {e}")
+            logger.exception("Error in mood detection: %s", e)
             return None
     
     def _analyze_facial_features(self, face_image):
@@ -100,7 +132,7 @@ class SpotifyService:
         if redirect_uri is None:
             redirect_uri = self.redirect_uri
         
-        print(f"Exchanging code for tokens with redirect_uri: {redirect_uri}")
+        spotify_logger.info("Exchanging code for tokens with redirect_uri: %s", redirect_uri)
         
         auth_str = f"{self.client_id}:{self.client_secret}"
         auth_b64 = base64.b64encode(auth_str.encode()).decode()
@@ -116,13 +148,16 @@ class SpotifyService:
             'redirect_uri': redirect_uri
         }
         
+        token_url = 'https://accounts.spotify.com/api/token'
+        start = time.perf_counter()
         response = requests.post(
-            'https://accounts.spotify.com/api/token',
+            token_url,
             headers=headers,
             data=data
         )
+        record_spotify_call('POST', token_url, response.status_code, time.perf_counter() - start)
         
-        print(f"Spotify token exchange status: {response.status_code}")
+        spotify_logger.info("Spotify token exchange status: %s", response.status_code)
         
         if response.status_code == 200:
             return response.json()
@@ -133,13 +168,16 @@ class SpotifyService:
             except:
                 error_msg = response.text
             
-            print(f"Spotify error: {error_msg}")
+            spotify_logger.error("Spotify error: %s", error_msg)
             raise Exception(f"Failed to get tokens: {error_msg}")
     
     def get_user_profile(self, access_token):
         """Get Spotify user profile"""
         headers = {'Authorization': f'Bearer {access_token}'}
-        response = requests.get('https://api.spotify.com/v1/me', headers=headers)
+        profile_url = 'https://api.spotify.com/v1/me'
+        start = time.perf_counter()
+        response = requests.get(profile_url, headers=headers)
+        record_spotify_call('GET', profile_url, response.status_code, time.perf_counter() - start)
         
         if response.status_code == 200:
             return response.json()
@@ -149,7 +187,7 @@ class SpotifyService:
     def get_user_top_genres(self, access_token, limit=10):
         """Get user's top genres from their listening history"""
         try:
-            sp = spotipy.Spotify(auth=access_token)
+            sp = spotipy.Spotify(auth=access_token, requests_session=spotify_session())
             
             top_artists = sp.current_user_top_artists(limit=50, time_range='medium_term')
             
@@ -160,19 +198,19 @@ class SpotifyService:
             if genres:
                 genre_counts = Counter(genres)
                 top_genres = [genre for genre, count in genre_counts.most_common(limit)]
-                print(f"✅ User's top genres: {top_genres}")
+                spotify_logger.debug("✅ User's top genres: %s", top_genres)
                 return top_genres
             
             return ['pop', 'rock']
             
         except Exception as e:
-            print(f"Error getting top genres: {e}")
+            spotify_logger.warning("Error getting top genres: %s", e)
             return ['pop', 'rock']
     
     def get_user_top_tracks(self, access_token, limit=50):
         """Get user's ACTUAL top tracks"""
         try:
-            sp = spotipy.Spotify(auth=access_token)
+            sp = spotipy.Spotify(auth=access_token, requests_session=spotify_session())
             
             # Get from multiple time ranges for better coverage
             tracks = []
@@ -189,11 +227,11 @@ class SpotifyService:
             long_term = sp.current_user_top_tracks(limit=10, time_range='long_term')
             tracks.extend(long_term['items'])
             
-            print(f"✅ Got {len(tracks)} user top tracks")
+            spotify_logger.debug("✅ Got %s user top tracks", len(tracks))
             return tracks
             
         except Exception as e:
-            print(f"Error getting top tracks: {e}")
+            spotify_logger.warning("Error getting top tracks: %s", e)
             return []
     
     def get_audio_features_for_mood(self, mood):
@@ -228,47 +266,77 @@ class SpotifyService:
         
         return mood_features.get(mood.lower(), mood_features['neutral'])
 
-    def create_personalized_mood_playlist(self, access_token, user_id, mood, user_genres=None):
+    def search_tracks(self, sp, query, limit=5, market=None):
+        """Search the catalog for tracks, served from the shared cache when possible"""
+        cached = search_cache.get(query, market, limit)
+        if cached is not None:
+            return cached
+        
+        results = sp.search(q=query, type='track', limit=limit, market=market)
+        return search_cache.set(query, results['tracks']['items'], market, limit)
+
+    def create_personalized_mood_playlist(self, access_token, user_id, mood, user_genres=None, market=None, timer=None):
         """
         🎵 PERFECT PLAYLIST - Uses 1 year listening history + mood matching
         Works even with 403 errors by using smart fallback
-        """
-        sp = spotipy.Spotify(auth=access_token)
-        
-        print(f"\n🎵 Creating PERFECT playlist for mood: {mood}")
-        
-        # Step 1: Get user's top genres
-        if user_genres is None or len(user_genres) == 0:
-            user_genres = self.get_user_top_genres(access_token)
         
-        print(f"📊 User's top genres: {user_genres[:5]}")
-        
-        # Step 2: Get user's listening history from ALL time ranges
-        all_user_tracks = []
+        The three listening-history fetches run concurrently, and the empty
+        playlist is created while they are still in flight. Pass a StageTimer
+        to collect per-stage durations. Catalog searches use ``market``,
+        by default the country saved for the Spotify user.
+        """
+        sp = spotipy.Spotify(auth=access_token, requests_session=spotify_session())
+        timer = timer or StageTimer()
+        if market is None:
+            market = SpotifyUser.objects.filter(spotify_id=user_id).values_list('country', flat=True).first() or None
         
-        try:
-            # Recent (4 weeks)
-            recent = sp.current_user_top_tracks(limit=20, time_range='short_term')
-            all_user_tracks.extend(recent['items'])
-            print(f"✅ Got {len(recent['items'])} recent tracks")
-        except:
-            print("⚠️ Could not get recent tracks")
+        spotify_logger.info("🎵 Creating PERFECT playlist for mood: %s", mood)
         
-        try:
-            # Medium term (6 months)
-            medium = sp.current_user_top_tracks(limit=30, time_range='medium_term')
-            all_user_tracks.extend(medium['items'])
-            print(f"✅ Got {len(medium['items'])} medium-term tracks")
-        except:
-            print("⚠️ Could not get medium-term tracks")
+        history_ranges = [
+            ('recent', 20, 'short_term'),        # Recent (4 weeks)
+            ('medium-term', 30, 'medium_term'),  # Medium term (6 months)
+            ('all-time', 50, 'long_term'),       # All time favorites
+        ]
         
-        try:
-            # All time favorites
-            long_term = sp.current_user_top_tracks(limit=50, time_range='long_term')
-            all_user_tracks.extend(long_term['items'])
-            print(f"✅ Got {len(long_term['items'])} all-time favorites")
-        except:
-            print("⚠️ Could not get long-term tracks")
+        with ThreadPoolExecutor(max_workers=len(history_ranges)) as pool:
+            # Step 1: Start fetching listening history from ALL time ranges
+            history_futures = [
+                (label, pool.submit(
+                    in_request_context(timer.timed(f'top_tracks_{time_range}', sp.current_user_top_tracks)),
+                    limit=limit, time_range=time_range
+                ))
+                for label, limit, time_range in history_ranges
+            ]
+            
+            # Step 2: Get user's top genres meanwhile
+            if user_genres is None or len(user_genres) == 0:
+                with timer.stage('top_genres'):
+                    user_genres = self.get_user_top_genres(access_token)
+            
+            spotify_logger.debug("📊 User's top genres: %s", user_genres[:5])
+            
+            # Step 3: Create playlist - only needs the genres
+            primary_genre = user_genres[0] if user_genres else 'music'
+            playlist_name = f"VibeWise - {mood.title()} {primary_genre.title()} 🎵"
+            
+            with timer.stage('create_playlist'):
+                playlist = sp.user_playlist_create(
+                    user_id,
+                    playlist_name,
+                    public=True,
+                    description=f"Your {mood} vibes playlist based on 1 year of listening! Featuring {', '.join(user_genres[:2])}"
+                )
+            
+            spotify_logger.debug("✅ Created playlist: %s", playlist_name)
+            
+            all_user_tracks = []
+            for label, future in history_futures:
+                try:
+                    items = future.result()['items']
+                    all_user_tracks.extend(items)
+                    spotify_logger.debug("✅ Got %s %s tracks", len(items), label)
+                except Exception:
+                    spotify_logger.warning("⚠️ Could not get %s tracks", label)
         
         # Remove duplicates
         unique_tracks = {}
@@ -277,20 +345,7 @@ class SpotifyService:
                 unique_tracks[track['id']] = track
         
         all_user_tracks = list(unique_tracks.values())
-        print(f"✅ Total unique tracks from your history: {len(all_user_tracks)}")
-        
-        # Step 3: Create playlist
-        primary_genre = user_genres[0] if user_genres else 'music'
-        playlist_name = f"VibeWise - {mood.title()} {primary_genre.title()} 🎵"
-        
-        playlist = sp.user_playlist_create(
-            user_id,
-            playlist_name,
-            public=True,
-            description=f"Your {mood} vibes playlist based on 1 year of listening! Featuring {', '.join(user_genres[:2])}"
-        )
-        
-        print(f"✅ Created playlist: {playlist_name}")
+        spotify_logger.debug("✅ Total unique tracks from your history: %s", len(all_user_tracks))
         
         # Step 4: Map mood to track selection strategy
         mood_selection = {
@@ -317,7 +372,7 @@ class SpotifyService:
         }
         
         selection = mood_selection.get(mood.lower(), mood_selection['neutral'])
-        print(f"🎯 Strategy for {mood}: Using tracks from indices {selection['track_indices'][:5]}...")
+        spotify_logger.debug("🎯 Strategy for %s: Using tracks from indices %s...", mood, selection['track_indices'][:5])
         
         # Step 5: Select tracks from user's history based on mood
         selected_tracks = []
@@ -329,7 +384,7 @@ class SpotifyService:
                 if len(selected_tracks) >= 30:
                     break
         
-        print(f"✅ Selected {len(selected_tracks)} tracks from your listening history")
+        spotify_logger.debug("✅ Selected %s tracks from your listening history", len(selected_tracks))
         
         # Step 6: Add selected tracks to playlist
         track_uris = [track['uri'] for track in selected_tracks]
@@ -337,24 +392,26 @@ class SpotifyService:
         if track_uris:
             try:
                 # Add in chunks of 100
-                for i in range(0, len(track_uris), 100):
-                    chunk = track_uris[i:i+100]
-                    sp.playlist_add_items(playlist['id'], chunk)
+                with timer.stage('add_tracks'):
+                    for i in range(0, len(track_uris), 100):
+                        chunk = track_uris[i:i+100]
+                        sp.playlist_add_items(playlist['id'], chunk)
                 
-                print(f"✅ Successfully added {len(track_uris)} tracks to playlist")
+                spotify_logger.debug("✅ Successfully added %s tracks to playlist", len(track_uris))
                 
-                # Print some track names so you can verify
-                print(f"📝 Sample tracks in playlist:")
-                for i, track in enumerate(selected_tracks[:5]):
-                    artists = ', '.join([artist['name'] for artist in track['artists']])
-                    print(f"   {i+1}. {track['name']} - {artists}")
+                # Log some track names so you can verify
+                if spotify_logger.isEnabledFor(logging.DEBUG):
+                    spotify_logger.debug("📝 Sample tracks in playlist:")
+                    for i, track in enumerate(selected_tracks[:5]):
+                        artists = ', '.join([artist['name'] for artist in track['artists']])
+                        spotify_logger.debug("   %s. %s - %s", i + 1, track['name'], artists)
                 
             except Exception as e:
-                print(f"⚠️ Error adding tracks: {e}")
+                spotify_logger.warning("⚠️ Error adding tracks: %s", e)
         
         # Step 7: If we don't have enough tracks, search by mood + genre
         if len(track_uris) < 20:
-            print(f"⚠️ Need more tracks, searching for {mood} + {user_genres[0]} songs...")
+            spotify_logger.debug("⚠️ Need more tracks, searching for %s + %s songs...", mood, user_genres[0])
             
             # Mood to keyword mapping
             mood_keywords = {
@@ -373,41 +430,170 @@ class SpotifyService:
             keywords = mood_keywords.get(mood.lower(), ['music'])
             
             # Search for mood + genre
-            for genre in user_genres[:2]:
-                for keyword in keywords:
-                    try:
-                        query = f"{keyword} genre:{genre}"
-                        results = sp.search(q=query, type='track', limit=5)
-                        
-                        for track in results['tracks']['items']:
-                            if track['uri'] not in track_uris:
-                                track_uris.append(track['uri'])
-                                sp.playlist_add_items(playlist['id'], [track['uri']])
-                                
-                                if len(track_uris) >= 30:
-                                    break
-                        
-                        if len(track_uris) >= 30:
-                            break
+            search_uris = []
+            with timer.stage('search'):
+                for genre in user_genres[:2]:
+                    for keyword in keywords:
+                        try:
+                            query = f"{keyword} genre:{genre}"
                             
-                    except Exception as e:
-                        print(f"Search error: {e}")
-                
-                if len(track_uris) >= 30:
-                    break
+                            for track in self.search_tracks(sp, query, limit=5, market=market):
+                                if track['uri'] not in track_uris:
+                                    track_uris.append(track['uri'])
+                                    search_uris.append(track['uri'])
+                                    
+                                    if len(track_uris) >= 30:
+                                        break
+                            
+                            if len(track_uris) >= 30:
+                                break
+                                
+                        except Exception as e:
+                            spotify_logger.warning("Search error: %s", e)
+                    
+                    if len(track_uris) >= 30:
+                        break
+            
+            # One request for all search results instead of one per track
+            if search_uris:
+                try:
+                    with timer.stage('add_search_tracks'):
+                        sp.playlist_add_items(playlist['id'], search_uris)
+                except Exception as e:
+                    spotify_logger.warning("⚠️ Error adding search tracks: %s", e)
             
-            print(f"✅ Added {len(track_uris) - len(selected_tracks)} more tracks from search")
+            spotify_logger.debug("✅ Added %s more tracks from search", len(search_uris))
         
-        print(f"🎉 Final playlist has {len(track_uris)} tracks")
+        spotify_logger.info("🎉 Final playlist has %s tracks (%s)", len(track_uris), timer.summary())
         
         return playlist
     
-    def get_playlist_tracks(self, access_token, playlist_id):
-        """Get tracks from a playlist"""
-        try:
-            sp = spotipy.Spotify(auth=access_token)
-            results = sp.playlist_tracks(playlist_id)
-            return results['items']
-        except Exception as e:
-            print(f"Error getting playlist tracks: {e}")
-            return []
\ No newline at end of file
+    def sync_playlist_tracks(self, access_token, playlist, force=False):
+        """
+        Refresh the local mirror of a playlist's contents.
+        
+        Only the snapshot_id is fetched when nothing changed. Otherwise every
+        page of items is requested concurrently and the mirror is replaced.
+        Returns True when the mirror was rewritten.
+        """
+        sp = spotipy.Spotify(auth=access_token, requests_session=spotify_session())
+        meta = sp.playlist(playlist.spotify_id, fields='snapshot_id,tracks.total')
+        snapshot_id = meta['snapshot_id']
+        
+        if not force and playlist.tracks_synced_at and snapshot_id == playlist.snapshot_id:
+            return False
+        
+        total = meta['tracks']['total']
+        offsets = list(range(0, total, PLAYLIST_PAGE_SIZE))
+        
+        def fetch_page(offset):
+            return sp.playlist_items(
+                playlist.spotify_id,
+                fields=PLAYLIST_ITEM_FIELDS,
+                limit=PLAYLIST_PAGE_SIZE,
+                offset=offset,
+                additional_types=('track',)
+            )['items']
+        
+        items = []
+        if offsets:
+            with ThreadPoolExecutor(max_workers=min(PLAYLIST_SYNC_WORKERS, len(offsets))) as pool:
+                for page in pool.map(in_request_context(fetch_page), offsets):
+                    items.extend(page)
+        
+        # Local files and removed tracks have no catalog id
+        items = [item for item in items if item.get('track') and item['track'].get('id')]
+        
+        self._store_playlist_items(playlist, items, snapshot_id)
+        spotify_logger.debug("✅ Synced %s tracks for playlist %s", len(items), playlist.spotify_id)
+        return True
+    
+    def _store_playlist_items(self, playlist, items, snapshot_id):
+        """Upsert the tracks and replace the playlist's ordered references"""
+        tracks = {}
+        for item in items:
+            track = item['track']
+            # Spotify sends nulls rather than omitting fields
+            artists = [artist.get('name') or '' for artist in track.get('artists') or []]
+            tracks[track['id']] = SpotifyTrack(
+                spotify_id=track['id'],
+                name=(track.get('name') or '')[:200],
+                artist=', '.join(artists)[:200],
+                artists=artists,
+                album=((track.get('album') or {}).get('name') or '')[:200],
+                duration_ms=track.get('duration_ms') or 0,
+                preview_url=track.get('preview_url'),
+                popularity=track.get('popularity') or 0,
+            )
+        
+        with transaction.atomic():
+            SpotifyTrack.objects.bulk_create(
+                tracks.values(),
+                update_conflicts=True,
+                unique_fields=['spotify_id'],
+                update_fields=['name', 'artist', 'artists', 'album', 'duration_ms', 'preview_url', 'popularity'],
+            )
+            track_ids = dict(
+                SpotifyTrack.objects.filter(spotify_id__in=tracks).values_list('spotify_id', 'id')
+            )
+            
+            playlist.items.all().delete()
+            SpotifyPlaylistTrack.objects.bulk_create([
+                SpotifyPlaylistTrack(
+                    playlist=playlist,
+                    track_id=track_ids[item['track']['id']],
+                    position=position,
+                    added_at=parse_datetime(item['added_at']) if item.get('added_at') else None,
+                )
+                for position, item in enumerate(items)
+            ], batch_size=500)
+            
+            playlist.snapshot_id = snapshot_id
+            playlist.tracks_synced_at = timezone.now()
+            playlist.save(update_fields=['snapshot_id', 'tracks_synced_at'])
+    
+    def get_playlist_tracks(self, access_token, playlist_id, user=None):
+        """
+        Get the items of a playlist in Spotify's shape, served from the local mirror.
+        
+        A mirror older than PLAYLIST_TRACKS_MAX_AGE seconds is checked against
+        Spotify first (only the snapshot_id, unless the playlist changed).
+        Pass ``user`` to only use that user's mirrored playlists.
+        """
+        playlists = SpotifyPlaylist.objects.all() if user is None else SpotifyPlaylist.objects.filter(user=user)
+        playlist = playlists.filter(spotify_id=playlist_id).first()
+        if playlist is None:
+            # Not a VibeWise playlist, nothing mirrored locally
+            if not access_token:
+                return []
+            try:
+                sp = spotipy.Spotify(auth=access_token, requests_session=spotify_session())
+                return sp.playlist_items(playlist_id, fields=PLAYLIST_ITEM_FIELDS, additional_types=('track',))['items']
+            except Exception as e:
+                spotify_logger.warning("Error getting playlist tracks: %s", e)
+                return []
+        
+        max_age = timedelta(seconds=getattr(settings, 'PLAYLIST_TRACKS_MAX_AGE', 300))
+        stale = playlist.tracks_synced_at is None or timezone.now() - playlist.tracks_synced_at > max_age
+        if stale and access_token:
+            try:
+                self.sync_playlist_tracks(access_token, playlist)
+            except Exception as e:
+                spotify_logger.warning("Error syncing playlist tracks, serving local mirror: %s", e)
+        
+        return [
+            {
+                'added_at': item.added_at.isoformat() if item.added_at else None,
+                'track': {
+                    'id': item.track.spotify_id,
+                    'uri': f"spotify:track:{item.track.spotify_id}",
+                    'name': item.track.name,
+                    'artists': [{'name': name} for name in item.track.artists or [item.track.artist]],
+                    'album': {'name': item.track.album},
+                    'duration_ms': item.track.duration_ms,
+                    'preview_url': item.track.preview_url,
+                    'popularity': item.track.popularity,
+                },
+            }
+            for item in playlist.items.select_related('track').order_by('position')
+        ]
@@ -0,0 +1,57 @@
+"""
+Invalidate cached per-user responses when their underlying rows change
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from accounts.models import User
+from mood_detection.models import MoodDetectionResult
+from mood_detection.retention import compacting, detections_compacted
+from mood_detection.write_behind import detections_flushed
+from spotify_integration.models import (
+    MoodDetectionResult as SpotifyMoodDetectionResult, SpotifyPlaylist
+)
+from .response_cache import invalidate_user
+from .status_cache import invalidate_status
+
+
+def _invalidate(sender, instance, **kwargs):
+    # Compaction bumps each batch's users once (_invalidate_compacted)
+    if kwargs.get('raw') or compacting():
+        return
+    user_id = instance.user_id
+    # Bump after commit so a concurrent read can't re-cache pre-commit data
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+for model in (MoodDetectionResult, SpotifyMoodDetectionResult, SpotifyPlaylist):
+    post_save.connect(_invalidate, sender=model, dispatch_uid=f'respcache_save_{model._meta.label}')
+    post_delete.connect(_invalidate, sender=model, dispatch_uid=f'respcache_delete_{model._meta.label}')
+
+
+def _invalidate_flushed(sender, detections, **kwargs):
+    # Buffered detections are bulk inserted without post_save
+    for user_id in {detection.user_id for detection in detections}:
+        invalidate_user(user_id)
+
+
+detections_flushed.connect(_invalidate_flushed, dispatch_uid='respcache_detections_flushed')
+
+
+def _invalidate_compacted(sender, user_ids, **kwargs):
+    for user_id in user_ids:
+        invalidate_user(user_id)
+
+
+detections_compacted.connect(_invalidate_compacted, dispatch_uid='respcache_detections_compacted')
+
+
+def _invalidate_status(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_status(user_id))
+
+
+post_save.connect(_invalidate_status, sender=User, dispatch_uid='spotify_status_save')
+post_delete.connect(_invalidate_status, sender=User, dispatch_uid='spotify_status_delete')
@@ -0,0 +1,72 @@
+"""
+Cached answer for /api/spotify/status/
+
+The status endpoint is polled on every page load. Instead of loading the
+user through the auth middleware, it reads the user id straight from the
+session and serves a per-user snapshot from the cache. The snapshot also
+holds the session auth hash, so sessions invalidated by a password change
+are still rejected like django.contrib.auth.get_user would. Saving a User
+drops its snapshot (see api.signals).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+from accounts.models import User
+from .metrics import record_cache
+
+DISCONNECTED = {'connected': False}
+
+
+def _snapshot_key(user_id):
+    return f'spotify_status:{user_id}'
+
+
+def _build_snapshot(user):
+    if user.spotify_access_token:
+        data = {
+            'connected': True,
+            'user': {
+                'name': user.name or user.username,
+                'email': user.email,
+                'spotify_id': user.spotify_id
+            }
+        }
+    else:
+        data = DISCONNECTED
+    return {'auth_hash': user.get_session_auth_hash(), 'data': data}
+
+
+def invalidate_status(user_id):
+    cache.delete(_snapshot_key(user_id))
+
+
+def get_status(session):
+    """Status payload for the user logged in to ``session``"""
+    user_id = session.get(SESSION_KEY)
+    if user_id is None:
+        return DISCONNECTED
+
+    key = _snapshot_key(user_id)
+    snapshot = cache.get(key)
+    record_cache('spotify_status', snapshot is not None)
+    if snapshot is None:
+        user = User.objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            return DISCONNECTED
+        snapshot = _build_snapshot(user)
+        cache.set(key, snapshot, getattr(settings, 'RESPONSE_CACHE_TTL', 300))
+
+    session_hash = session.get(HASH_SESSION_KEY)
+    if not session_hash or not constant_time_compare(session_hash, snapshot['auth_hash']):
+        return DISCONNECTED
+    return snapshot['data']
+
+
+def status_etag(data):
+    body = json.dumps(data, sort_keys=True).encode()
+    return '"%s"' % hashlib.md5(body).hexdigest()
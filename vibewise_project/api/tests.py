@@ -1,3 +1,1271 @@
-from django.test import TestCase
+"""
+Regression suite for every route in api/urls.py
 
-# Create your tests here.
+Each endpoint runs against an account seeded with a realistic amount of
+history, with Spotify stubbed out (spotipy, the requests-based token
+exchange and the httpx client), so the figures only cover our own code and
+database work.
+
+- Query budgets: every endpoint asserts an upper bound on SQL queries, so an
+  N+1 or a per-row save loop fails the build.
+- Latency (tagged 'benchmark', skipped unless API_BENCHMARKS is set): read
+  endpoints are timed LATENCY_RUNS times with a cold response cache. p50/p95
+  are written to $API_LATENCY_REPORT when set, and p95 must stay under the
+  endpoint's budget. Set API_LATENCY_BUDGET_SCALE on slow machines::
+
+      API_BENCHMARKS=1 python manage.py test --tag benchmark
+"""
+import base64
+import json
+import logging
+import os
+import random
+import shutil
+import signal
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from email.utils import format_datetime
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.db import DatabaseError, OperationalError, connection, connections, router, transaction
+from django.db.backends.sqlite3 import base as sqlite_base
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from prometheus_client import REGISTRY
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from accounts.models import User, UserPreferences
+from api.async_spotify import _retry_after
+from api.idempotency import PENDING, _cache_key, run_once
+from api.metrics import _query_count, _record_spotify_response, in_request_context, spotify_endpoint
+from api.renderers import FastJSONRenderer, json_float
+from api.search_cache import SearchResultCache
+from api.serializers import (
+    MoodDetectionSerializer, SpotifyPlaylistSerializer, mood_detection_rows, spotify_playlist_rows
+)
+from api.services import SpotifyService
+from mood_detection.models import MoodDetectionResult
+from mood_detection.rollups import rebuild_rollups
+from vibewise_project.db_router import PIN_COOKIE, ReplicaRoutingMiddleware, replica_reads
+from vibewise_project.logutils import JsonFormatter, QueueListenerHandler, RateLimitFilter
+from vibewise_project.memory import install_dump_signal
+from vibewise_project.profiling import profile_writer, write_profile
+from vibewise_project.query_inspector import QueryInspectorMiddleware, fingerprint
+from vibewise_project.sqlite_backend.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from spotify_integration.models import (
+    MoodDetectionResult as SpotifyMoodDetectionResult, SpotifyPlaylist, SpotifyUser
+)
+
+MOODS = [choice for choice, label in MoodDetectionResult.MOOD_CHOICES]
+
+# Seeded volume for the account under test, plus some neighbours sharing the tables
+SEED_DETECTIONS = 2000
+SEED_PLAYLISTS = 150
+SEED_OTHER_USERS = 5
+
+LATENCY_RUNS = 30
+LATENCY_BUDGET_SCALE = float(os.environ.get('API_LATENCY_BUDGET_SCALE', 1))
+
+
+def seed_account(user, detections, playlists, rng):
+    """Bulk insert history for ``user`` spread over the last six months"""
+    now = timezone.now()
+    MoodDetectionResult.objects.bulk_create([
+        MoodDetectionResult(
+            user=user,
+            mood=rng.choice(MOODS),
+            confidence=round(rng.uniform(0.5, 0.95), 2),
+            detected_at=now - timedelta(minutes=rng.randrange(180 * 24 * 60)),
+        )
+        for _ in range(detections)
+    ], batch_size=500)
+    SpotifyMoodDetectionResult.objects.bulk_create([
+        SpotifyMoodDetectionResult(user=user, mood=rng.choice(MOODS), confidence=0.85)
+        for _ in range(playlists)
+    ], batch_size=500)
+    SpotifyPlaylist.objects.bulk_create([
+        SpotifyPlaylist(
+            user=user,
+            spotify_id=f'{user.pk}-playlist-{i}',
+            name=f'VibeWise - Playlist {i}',
+            spotify_url=f'https://open.spotify.com/playlist/{user.pk}-{i}',
+            total_tracks=30,
+            mood=rng.choice(MOODS),
+        )
+        for i in range(playlists)
+    ], batch_size=500)
+    rebuild_rollups([user.pk])
+
+
+def spotipy_stub():
+    """MagicMock standing in for spotipy.Spotify"""
+    sp = mock.MagicMock()
+    sp.current_user.return_value = {'id': 'spotify-user', 'display_name': 'Test User', 'email': 'test@example.com'}
+    sp.current_user_top_tracks.return_value = {
+        'items': [{'id': f't{i}', 'uri': f'spotify:track:t{i}'} for i in range(30)]
+    }
+    sp.user_playlist_create.side_effect = lambda user_id, name, **kwargs: {
+        'id': f'new-{sp.user_playlist_create.call_count}',
+        'external_urls': {'spotify': 'https://open.spotify.com/playlist/new'},
+    }
+    return sp
+
+
+def spotify_http_stub(request):
+    """httpx handler answering the Spotify Web API calls the async views make"""
+    path = request.url.path
+    if path == '/api/token':
+        return httpx.Response(200, json={'access_token': 'async-token', 'refresh_token': 'refresh'})
+    if path == '/v1/me':
+        return httpx.Response(200, json={'id': 'async-user', 'display_name': 'Async User', 'email': 'async@example.com'})
+    if path == '/v1/me/top/tracks':
+        return httpx.Response(200, json={'items': [{'uri': f'spotify:track:a{i}'} for i in range(30)]})
+    if path.endswith('/playlists'):
+        return httpx.Response(201, json={'id': 'async-playlist', 'external_urls': {'spotify': 'https://open.spotify.com/playlist/a'}})
+    if path.endswith('/tracks'):
+        return httpx.Response(201, json={'snapshot_id': 'snap'})
+    return httpx.Response(404, json={'error': {'message': f'Unstubbed Spotify call {path}'}})
+
+
+@contextmanager
+def stub_async_spotify():
+    original_init = httpx.AsyncClient.__init__
+
+    def init(client, *args, **kwargs):
+        kwargs['transport'] = httpx.MockTransport(spotify_http_stub)
+        original_init(client, *args, **kwargs)
+
+    with mock.patch.object(httpx.AsyncClient, '__init__', init):
+        yield
+
+
+def stub_requests_response(payload):
+    response = mock.Mock(status_code=200)
+    response.json.return_value = payload
+    return response
+
+
+class SeededAPITestCase(TestCase):
+    """Logged-in client on a seeded account with a Spotify session"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(20240101)
+        cls.user = User.objects.create_user(
+            username='listener@example.com', email='listener@example.com',
+            password='correct-horse', name='Listener', spotify_access_token='token', spotify_id='listener'
+        )
+        UserPreferences.objects.create(user=cls.user)
+        SpotifyUser.objects.create(
+            user=cls.user, spotify_id='listener', access_token='token',
+            token_expires_at=timezone.now() + timedelta(hours=1)
+        )
+        seed_account(cls.user, SEED_DETECTIONS, SEED_PLAYLISTS, rng)
+
+        for i in range(SEED_OTHER_USERS):
+            other = User.objects.create_user(username=f'other{i}@example.com', email=f'other{i}@example.com')
+            seed_account(other, SEED_DETECTIONS // 4, SEED_PLAYLISTS // 4, rng)
+
+    def setUp(self):
+        # The response and status caches outlive each test's transaction
+        cache.clear()
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['spotify_auth'] = {
+            'access_token': 'token', 'refresh_token': 'refresh',
+            'expires_at': int(time.time()) + 3600,
+        }
+        session.save()
+
+    @contextmanager
+    def assertMaxQueries(self, limit):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > limit:
+            queries = '\n'.join(query['sql'] for query in context.captured_queries)
+            self.fail(f'{executed} queries executed, budget is {limit}:\n{queries}')
+
+
+class AuthEndpointTests(SeededAPITestCase):
+
+    def test_login(self):
+        self.client.logout()
+        with self.assertMaxQueries(9):
+            response = self.client.post('/api/auth/login/', {
+                'email': 'listener@example.com', 'password': 'correct-horse'
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_rejects_bad_password(self):
+        self.client.logout()
+        response = self.client.post('/api/auth/login/', {
+            'email': 'listener@example.com', 'password': 'wrong'
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_register(self):
+        self.client.logout()
+        with self.assertMaxQueries(11):
+            response = self.client.post('/api/auth/register/', {
+                'name': 'New', 'email': 'new@example.com', 'password': 'a-long-password'
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(UserPreferences.objects.filter(user__email='new@example.com').exists())
+
+    def test_check_auth(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/auth/check_auth/')
+        self.assertTrue(response.json()['authenticated'])
+
+    def test_forgot_password(self):
+        with self.assertMaxQueries(1):
+            response = self.client.post('/api/auth/forgot_password/', {
+                'email': 'listener@example.com'
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        with self.assertMaxQueries(5):
+            response = self.client.post('/api/auth/logout/')
+        self.assertTrue(response.json()['success'])
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.spotify_access_token)
+
+
+class MoodEndpointTests(SeededAPITestCase):
+
+    @mock.patch('api.views.MoodDetectionService')
+    def test_detect(self, service):
+        service.return_value.detect_mood_from_base64.return_value = {'mood': 'happy', 'confidence': 0.9}
+        with self.assertMaxQueries(11):
+            response = self.client.post('/api/mood/detect/', {
+                'image': 'data:image/jpeg;base64,AAAA'
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.json()['detection_id'])
+        self.assertEqual(self.user.mood_totals.total_detections, SEED_DETECTIONS + 1)
+
+    @mock.patch('api.views.MoodDetectionService')
+    def test_detect_retry_with_same_id_is_stored_once(self, service):
+        service.return_value.detect_mood_from_base64.return_value = {'mood': 'sad', 'confidence': 0.7}
+        payload = {'image': 'AAAA', 'detection_id': '9a7f3c1e-5b55-4d1c-9a51-2f1f0c1d2e3f'}
+        first = self.client.post('/api/mood/detect/', payload, content_type='application/json')
+        second = self.client.post('/api/mood/detect/', payload, content_type='application/json')
+        self.assertEqual(first.json()['id'], second.json()['id'])
+
+    @mock.patch('api.views.MoodDetectionService')
+    def test_detect_reports_stage_timings(self, service):
+        service.return_value.detect_mood_from_base64.return_value = {'mood': 'happy', 'confidence': 0.9}
+        plain = self.client.post('/api/mood/detect/', {'image': 'AAAA'}, content_type='application/json')
+        stages = [entry.split(';')[0] for entry in plain['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['parse', 'save', 'total'])
+        self.assertNotIn('timings', plain.json())
+
+        debug = self.client.post('/api/mood/detect/?timings=1', {'image': 'AAAA'}, content_type='application/json')
+        self.assertEqual(list(debug.json()['timings']), ['parse', 'save', 'total'])
+
+    def test_detect_service_records_image_stages(self):
+        import cv2
+        import numpy as np
+        from api.services import MoodDetectionService
+        from api.timing import StageTimer
+
+        ok, jpeg = cv2.imencode('.jpg', np.zeros((64, 64, 3), np.uint8))
+        timer = StageTimer()
+        with mock.patch('api.services.cv2.CascadeClassifier', create=True) as cascade:
+            cascade.return_value.detectMultiScale.return_value = ()
+            result = MoodDetectionService().detect_mood_from_base64(base64.b64encode(jpeg.tobytes()), timer=timer)
+        self.assertEqual(result['mood'], 'neutral')
+        self.assertLessEqual({'b64decode', 'imdecode', 'cascade'}, set(timer.as_dict()))
+
+    def test_detect_requires_login(self):
+        self.client.logout()
+        response = self.client.post('/api/mood/detect/', {'image': 'AAAA'}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_history(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get('/api/mood/history/')
+        data = response.json()
+        self.assertEqual(len(data['results']), 20)
+        self.assertIsNotNone(data['next'])
+
+    def test_history_deep_page_costs_the_same_as_the_first(self):
+        url = '/api/mood/history/?page_size=100'
+        pages = []
+        while url:
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                data = self.client.get(url).json()
+            pages.append((len(data['results']), len(context.captured_queries)))
+            url = data['next']
+
+        self.assertEqual(sum(rows for rows, queries in pages), SEED_DETECTIONS)
+        # Every page but the last (which also checks for archived days) runs the same queries
+        self.assertEqual(len({queries for rows, queries in pages[:-1]}), 1)
+
+    def test_history_is_cached_per_user(self):
+        self.client.get('/api/mood/history/')
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/mood/history/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+
+class SpotifyEndpointTests(SeededAPITestCase):
+
+    @mock.patch('api.services.requests')
+    def test_connect(self, requests):
+        self.client.logout()
+        requests.post.return_value = stub_requests_response({'access_token': 'new-token', 'refresh_token': 'r'})
+        requests.get.return_value = stub_requests_response({
+            'id': 'listener', 'display_name': 'Listener', 'email': 'listener@example.com'
+        })
+        with self.assertMaxQueries(10):
+            response = self.client.post('/api/spotify/connect/', {'code': 'auth-code'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['id'], self.user.pk)
+
+    def test_create_playlist(self):
+        sp = spotipy_stub()
+        with mock.patch('spotipy.Spotify', return_value=sp), self.assertMaxQueries(12):
+            response = self.client.post(
+                '/api/spotify/create_playlist/', {'mood': 'happy'},
+                content_type='application/json', HTTP_IDEMPOTENCY_KEY='create-1'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['playlist']['total_tracks'], 30)
+        sp.playlist_add_items.assert_called_once()
+
+    def test_failed_save_creates_no_spotify_playlist(self):
+        sp = spotipy_stub()
+        with mock.patch('spotipy.Spotify', return_value=sp), \
+                mock.patch.object(SpotifyMoodDetectionResult.objects, 'create', side_effect=DatabaseError('disk I/O error')):
+            response = self.client.post(
+                '/api/spotify/create_playlist/', {'mood': 'happy'}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 500)
+        sp.user_playlist_create.assert_not_called()
+
+    def test_create_playlist_retry_is_replayed(self):
+        sp = spotipy_stub()
+        with mock.patch('spotipy.Spotify', return_value=sp):
+            for _ in range(2):
+                response = self.client.post(
+                    '/api/spotify/create_playlist/', {'mood': 'sad'},
+                    content_type='application/json', HTTP_IDEMPOTENCY_KEY='create-2'
+                )
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(sp.user_playlist_create.call_count, 1)
+
+    def test_create_playlist_waits_for_the_worker_running_it(self):
+        key = _cache_key(self.user.pk, 'create_playlist', 'create-3')
+        cache.set(key, PENDING)
+
+        def other_worker_finishes(seconds):
+            cache.set(key, (200, {'playlist': {'id': 'from-other-worker'}}))
+
+        sp = spotipy_stub()
+        with mock.patch('spotipy.Spotify', return_value=sp), \
+                mock.patch('api.idempotency.time.sleep', side_effect=other_worker_finishes):
+            response = self.client.post(
+                '/api/spotify/create_playlist/', {'mood': 'sad'},
+                content_type='application/json', HTTP_IDEMPOTENCY_KEY='create-3'
+            )
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.json()['playlist']['id'], 'from-other-worker')
+        sp.current_user.assert_not_called()
+
+    def test_failed_create_playlist_can_be_retried(self):
+        sp = spotipy_stub()
+        sp.current_user.side_effect = [Exception('Spotify is down'), sp.current_user.return_value]
+        with mock.patch('spotipy.Spotify', return_value=sp):
+            responses = [
+                self.client.post(
+                    '/api/spotify/create_playlist/', {'mood': 'sad'},
+                    content_type='application/json', HTTP_IDEMPOTENCY_KEY='create-4'
+                )
+                for _ in range(2)
+            ]
+        self.assertEqual([response.status_code for response in responses], [500, 200])
+        self.assertNotIn('Idempotent-Replayed', responses[1])
+
+    def test_concurrent_duplicates_run_once(self):
+        calls = []
+
+        def create():
+            calls.append(1)
+            time.sleep(0.05)
+            return Response({'playlist': {'id': 'only-one'}})
+
+        request = SimpleNamespace(user=self.user, META={})
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            responses = list(pool.map(
+                lambda _: run_once(request, 'create_playlist', 'happy', create), range(4)
+            ))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sum(response.has_header('Idempotent-Replayed') for response in responses), 3)
+        self.assertEqual({response.data['playlist']['id'] for response in responses}, {'only-one'})
+
+    def test_sequential_requests_without_a_key_run_again(self):
+        calls = []
+
+        def create():
+            calls.append(1)
+            return Response({'playlist': {'id': f'playlist-{len(calls)}'}})
+
+        request = SimpleNamespace(user=self.user, META={})
+        responses = [run_once(request, 'create_playlist', 'happy', create) for _ in range(2)]
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(any(response.has_header('Idempotent-Replayed') for response in responses))
+
+    def test_duplicate_without_a_key_joins_another_workers_call(self):
+        key = _cache_key(self.user.pk, 'create_playlist', 'fingerprint:happy')
+        claim = f'{PENDING}:other-worker'
+        cache.set(key, claim)
+
+        def other_worker_finishes(seconds):
+            cache.set(f'{key}:{claim}', (200, {'playlist': {'id': 'from-other-worker'}}))
+            cache.delete(key)
+
+        request = SimpleNamespace(user=self.user, META={})
+        create = mock.Mock()
+        with mock.patch('api.idempotency.time.sleep', side_effect=other_worker_finishes):
+            response = run_once(request, 'create_playlist', 'happy', create)
+        self.assertEqual(response.data['playlist']['id'], 'from-other-worker')
+        create.assert_not_called()
+
+    def test_duplicates_stop_waiting_before_the_lease_ends(self):
+        cache.set(_cache_key(self.user.pk, 'create_playlist', 'create-5'), f'{PENDING}:other-worker')
+        request = SimpleNamespace(user=self.user, META={'HTTP_IDEMPOTENCY_KEY': 'create-5'})
+        with self.settings(IDEMPOTENCY_WAIT=0.1, IDEMPOTENCY_LEASE=60):
+            started = time.monotonic()
+            response = run_once(request, 'create_playlist', 'sad', mock.Mock())
+        self.assertEqual(response.status_code, 409)
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_sessionless_callers_are_not_guarded(self):
+        request = SimpleNamespace(user=AnonymousUser(), session=SimpleNamespace(session_key=None), META={})
+        create = mock.Mock(return_value=Response({}))
+        for _ in range(2):
+            run_once(request, 'create_playlist', 'happy', create)
+        self.assertEqual(create.call_count, 2)
+        self.assertIsNone(cache.get(_cache_key(None, 'create_playlist', 'fingerprint:happy')))
+
+    def test_playlists(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get('/api/spotify/playlists/')
+        data = response.json()
+        self.assertEqual(len(data['playlists']), 50)
+        self.assertIsNotNone(data['next'])
+
+    def mirror_playlist(self, synced_ago):
+        playlist = SpotifyPlaylist.objects.filter(user=self.user).first()
+        SpotifyService()._store_playlist_items(playlist, [
+            {'added_at': '2024-01-01T00:00:00Z', 'track': {
+                'id': f'm{i}', 'name': f'Song {i}', 'artists': [{'name': 'Tyler, The Creator'}, {'name': 'Kali'}],
+                'album': {'name': 'Album'}, 'duration_ms': 1000, 'popularity': 50,
+            }}
+            for i in range(3)
+        ], 'snap-1')
+        SpotifyPlaylist.objects.filter(pk=playlist.pk).update(tracks_synced_at=timezone.now() - synced_ago)
+        return playlist
+
+    def test_playlist_tracks_are_read_from_the_mirror(self):
+        playlist = self.mirror_playlist(timedelta(seconds=10))
+        with mock.patch('spotipy.Spotify') as spotify, self.assertMaxQueries(3):
+            response = self.client.get(f'/api/spotify/playlists/{playlist.spotify_id}/tracks/')
+        spotify.assert_not_called()
+        data = response.json()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['items'][0]['track']['artists'], [{'name': 'Tyler, The Creator'}, {'name': 'Kali'}])
+        self.assertEqual(data['items'][0]['track']['album'], {'name': 'Album'})
+
+    def test_stale_playlist_tracks_check_the_snapshot(self):
+        playlist = self.mirror_playlist(timedelta(hours=1))
+        sp = spotipy_stub()
+        sp.playlist.return_value = {'snapshot_id': 'snap-1', 'tracks': {'total': 3}}
+        with mock.patch('spotipy.Spotify', return_value=sp):
+            response = self.client.get(f'/api/spotify/playlists/{playlist.spotify_id}/tracks/')
+        self.assertEqual(response.json()['total'], 3)
+        sp.playlist.assert_called_once()
+        sp.playlist_items.assert_not_called()
+
+    def test_changed_playlist_is_fetched_page_by_page(self):
+        playlist = self.mirror_playlist(timedelta(hours=1))
+
+        def page(playlist_id, offset, limit, **kwargs):
+            items = [
+                {'added_at': None, 'track': {
+                    'id': f'p{position}', 'name': f'Song {position}', 'artists': [{'name': 'Kali'}],
+                    'album': {'name': None} if position == 101 else {'name': 'Album'},
+                }}
+                for position in range(offset, min(offset + limit, 205))
+            ]
+            if offset == 200:
+                items.append({'added_at': None, 'track': None})  # removed track
+            return {'items': items}
+
+        sp = spotipy_stub()
+        sp.playlist.return_value = {'snapshot_id': 'snap-2', 'tracks': {'total': 206}}
+        sp.playlist_items.side_effect = page
+        with mock.patch('spotipy.Spotify', return_value=sp):
+            response = self.client.get(f'/api/spotify/playlists/{playlist.spotify_id}/tracks/')
+
+        self.assertEqual(sp.playlist_items.call_count, 3)
+        data = response.json()
+        self.assertEqual(data['total'], 205)
+        self.assertEqual([item['track']['id'] for item in data['items']], [f'p{i}' for i in range(205)])
+        self.assertEqual(data['items'][101]['track']['album'], {'name': ''})
+        playlist.refresh_from_db()
+        self.assertEqual(playlist.snapshot_id, 'snap-2')
+
+    def test_other_users_playlist_tracks_are_not_served(self):
+        other = SpotifyPlaylist.objects.exclude(user=self.user).first()
+        with mock.patch('spotipy.Spotify', return_value=spotipy_stub()) as spotify:
+            # Falls through to Spotify, which answers for its own users
+            spotify.return_value.playlist_items.return_value = {'items': []}
+            response = self.client.get(f'/api/spotify/playlists/{other.spotify_id}/tracks/')
+        self.assertEqual(response.json(), {'items': [], 'total': 0})
+
+    def test_status(self):
+        response = self.client.get('/api/spotify/status/')
+        self.assertTrue(response.json()['connected'])
+
+        with self.assertMaxQueries(0):
+            revalidated = self.client.get('/api/spotify/status/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+        weak = self.client.get('/api/spotify/status/', HTTP_IF_NONE_MATCH=f'"other", W/{response["ETag"]}')
+        self.assertEqual(weak.status_code, 304)
+        self.assertEqual(self.client.get('/api/spotify/status/', HTTP_IF_NONE_MATCH='*').status_code, 304)
+
+    def test_status_etag_must_match_exactly(self):
+        etag = self.client.get('/api/spotify/status/')['ETag']
+        for header in (etag[1:-1], f'"x{etag[1:-1]}"', f'"{etag[1:-1][:8]}"', 'garbage' + etag):
+            response = self.client.get('/api/spotify/status/', HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 200, header)
+
+    def test_status_anonymous(self):
+        self.client.logout()
+        with self.assertMaxQueries(0):
+            response = self.client.get('/api/spotify/status/')
+        self.assertEqual(response.json(), {'connected': False})
+
+    def test_logout(self):
+        with self.assertMaxQueries(5):
+            response = self.client.post('/api/spotify/logout/')
+        self.assertTrue(response.json()['success'])
+
+
+class SearchCacheTests(SeededAPITestCase):
+
+    def stub_search(self):
+        sp = spotipy_stub()
+        sp.current_user_top_tracks.return_value = {'items': []}
+        sp.search.side_effect = lambda q, **kwargs: {'tracks': {'items': [
+            {'id': f'{q}-{i}', 'uri': f'spotify:track:{q}-{i}', 'name': 'Song'} for i in range(5)
+        ]}}
+        return sp
+
+    def test_results_are_shared_through_the_django_cache(self):
+        sp = self.stub_search()
+        service = SpotifyService()
+        first = service.search_tracks(sp, 'Upbeat  genre:pop', market='gb')
+        self.assertEqual(service.search_tracks(sp, 'upbeat genre:pop', market='GB'), first)
+        self.assertEqual(sp.search.call_count, 1)
+        self.assertEqual(first[0], {'id': 'Upbeat  genre:pop-0', 'uri': 'spotify:track:Upbeat  genre:pop-0'})
+
+        # What another worker sees: the entry is in the shared cache
+        self.assertEqual(SearchResultCache(ttl=60).get('upbeat genre:pop', 'GB'), first)
+        service.search_tracks(sp, 'upbeat genre:pop', market='US')
+        self.assertEqual(sp.search.call_count, 2)
+
+    def test_playlist_searches_use_the_users_country(self):
+        SpotifyUser.objects.filter(user=self.user).update(country='GB')
+        sp = self.stub_search()
+        with mock.patch('spotipy.Spotify', return_value=sp):
+            SpotifyService().create_personalized_mood_playlist('token', 'listener', 'happy', user_genres=['pop'])
+        self.assertEqual({call.kwargs['market'] for call in sp.search.call_args_list}, {'GB'})
+
+
+class ProfileAndDashboardTests(SeededAPITestCase):
+
+    def test_profile_get(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.json()['user']['email'], 'listener@example.com')
+
+    def test_profile_put(self):
+        with self.assertMaxQueries(6):
+            response = self.client.put('/api/profile/', {
+                'name': 'Renamed', 'preferences': {'genres': ['pop']}
+            }, content_type='application/json')
+        self.assertEqual(response.json()['user']['name'], 'Renamed')
+
+    def test_dashboard_stats(self):
+        with self.assertMaxQueries(5):
+            response = self.client.get('/api/dashboard/stats/')
+        data = response.json()
+        self.assertEqual(data['total_detections'], SEED_DETECTIONS)
+        self.assertEqual(data['playlist_count'], SEED_PLAYLISTS)
+        self.assertEqual(len(data['recent_moods']), 5)
+
+    def test_dashboard_stats_cover_seven_local_days(self):
+        user = User.objects.create_user(username='week@example.com', email='week@example.com')
+        start_of_today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        for days_ago, mood in [(0, 'happy'), (6, 'sad'), (7, 'angry')]:
+            MoodDetectionResult.objects.create(
+                user=user, mood=mood, confidence=0.9, detected_at=start_of_today - timedelta(days=days_ago)
+            )
+        self.client.force_login(user)
+        moods = {row['mood'] for row in self.client.get('/api/dashboard/stats/').json()['mood_stats']}
+        self.assertEqual(moods, {'happy', 'sad'})
+
+
+class AsyncEndpointTests(SeededAPITestCase):
+
+    def test_connect(self):
+        self.client.logout()
+        # First connection: creates the user and their preferences
+        with stub_async_spotify(), self.assertMaxQueries(17):
+            response = self.client.post(
+                '/api/async/spotify/connect/', {'code': 'auth-code'}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['spotify_id'], 'async-user')
+
+    def test_connect_csrf_matches_the_drf_action(self):
+        client = Client(enforce_csrf_checks=True)
+        with stub_async_spotify():
+            response = client.post('/api/async/spotify/connect/', {'code': 'auth-code'}, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+
+            client.force_login(self.user)
+            response = client.post('/api/async/spotify/connect/', {'code': 'auth-code'}, content_type='application/json')
+            self.assertEqual(response.status_code, 403)
+
+    def test_create_playlist(self):
+        with stub_async_spotify(), self.assertMaxQueries(12):
+            response = self.client.post(
+                '/api/async/spotify/create_playlist/', {'mood': 'calm'},
+                content_type='application/json', HTTP_IDEMPOTENCY_KEY='async-1'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['playlist']['total_tracks'], 30)
+
+    def test_pool_is_closed_after_each_wsgi_request(self):
+        with stub_async_spotify(), mock.patch('api.async_spotify.close_pool') as close_pool:
+            self.client.post('/api/async/spotify/create_playlist/', {'mood': 'calm'}, content_type='application/json')
+        close_pool.assert_awaited_once()
+
+    def test_retry_after_accepts_seconds_and_dates(self):
+        soon = format_datetime(datetime.now(dt_timezone.utc) + timedelta(seconds=3), usegmt=True)
+        self.assertEqual(_retry_after(httpx.Response(429, headers={'Retry-After': '2'})), 2.0)
+        self.assertAlmostEqual(_retry_after(httpx.Response(429, headers={'Retry-After': soon})), 3.0, delta=1.1)
+        self.assertEqual(_retry_after(httpx.Response(429, headers={'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})), 0.0)
+        self.assertEqual(_retry_after(httpx.Response(429, headers={'Retry-After': 'soon'})), 1.0)
+
+    def test_project_middleware_is_async_capable(self):
+        # One sync-only middleware puts every ASGI request on a thread
+        for path in settings.MIDDLEWARE:
+            middleware = import_string(path)
+            self.assertTrue(getattr(middleware, 'async_capable', False), path)
+
+    def test_playlists(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get('/api/async/spotify/playlists/')
+        self.assertEqual(len(response.json()['playlists']), 50)
+
+    def test_playlists_report_timings(self):
+        response = self.client.get('/api/async/spotify/playlists/?timings=1')
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertIn('total', response.json()['timings'])
+        # The cached copy is stored without the debug field
+        self.assertNotIn('timings', self.client.get('/api/async/spotify/playlists/').json())
+
+
+class MetricsTests(SeededAPITestCase):
+
+    @staticmethod
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_latency_queries_and_cache_hits(self):
+        route = {'route': 'mood-history'}
+        requests_before = self.sample('vibewise_http_request_duration_seconds_count', method='GET', status='200', **route)
+        hits_before = self.sample('vibewise_cache_requests_total', cache='mood_history', result='hit')
+
+        self.client.get('/api/mood/history/')
+        self.client.get('/api/mood/history/')
+
+        self.assertEqual(self.sample(
+            'vibewise_http_request_duration_seconds_count', method='GET', status='200', **route
+        ), requests_before + 2)
+        self.assertEqual(self.sample('vibewise_cache_requests_total', cache='mood_history', result='hit'), hits_before + 1)
+        self.assertGreater(self.sample('vibewise_db_queries_per_request_sum', **route), 0)
+
+    @mock.patch('api.services.requests')
+    def test_spotify_calls_and_detect_stages(self, requests):
+        token = {'endpoint': '/api/token', 'method': 'POST', 'status': '200'}
+        stage = {'view': 'api.views.SpotifyViewSet.connect', 'stage': 'token_exchange'}
+        calls_before = self.sample('vibewise_spotify_requests_total', **token)
+        stages_before = self.sample('vibewise_view_stage_duration_seconds_count', **stage)
+
+        requests.post.return_value = stub_requests_response({'access_token': 'new-token'})
+        requests.get.return_value = stub_requests_response({'id': 'listener', 'email': 'listener@example.com'})
+        self.client.post('/api/spotify/connect/', {'code': 'auth-code'}, content_type='application/json')
+
+        self.assertEqual(self.sample('vibewise_spotify_requests_total', **token), calls_before + 1)
+        self.assertEqual(self.sample('vibewise_view_stage_duration_seconds_count', **stage), stages_before + 1)
+
+    def test_spotify_retries_are_counted(self):
+        retried = {'endpoint': '/v1/me', 'method': 'GET', 'status': '429'}
+        before = self.sample('vibewise_spotify_requests_total', **retried)
+        response = mock.Mock(status_code=200, url='https://api.spotify.com/v1/me')
+        response.request.method = 'GET'
+        response.elapsed = timedelta(milliseconds=40)
+        response.raw.retries.history = [mock.Mock(status=429, url='/v1/me')]
+        _record_spotify_response(response)
+        self.assertEqual(self.sample('vibewise_spotify_requests_total', **retried), before + 1)
+
+    def test_spotify_endpoint_labels_drop_ids(self):
+        self.assertEqual(spotify_endpoint('https://api.spotify.com/v1/playlists/37i9dQZF1DX/tracks?offset=100'),
+                         '/v1/playlists/{id}/tracks')
+        self.assertEqual(spotify_endpoint('https://api.spotify.com/v1/users/listener/playlists'), '/v1/users/{id}/playlists')
+        self.assertEqual(spotify_endpoint('https://api.spotify.com/v1/me/top/tracks'), '/v1/me/top/tracks')
+
+    def test_scrape(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(DEBUG=True):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'vibewise_http_request_duration_seconds_bucket', response.content)
+
+        with self.settings(METRICS_AUTH_TOKEN='scrape-token', DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+            self.assertEqual(response.status_code, 200)
+
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+    def test_executor_queries_count_towards_the_request(self):
+        def select(_=None):
+            # The test transaction keeps the shared in-memory tables locked
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            finally:
+                connection.close()
+
+        counter = [0]
+        token = _query_count.set(counter)
+        try:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(in_request_context(select), range(2)))
+                pool.submit(select).result()
+        finally:
+            _query_count.reset(token)
+        self.assertEqual(counter[0], 2)
+
+
+class FastSerializationTests(SeededAPITestCase):
+    """The values()-based read path renders the same bytes as ModelSerializer + JSONRenderer"""
+
+    def assertSameJSON(self, serializer_class, rows, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        self.assertEqual(FastJSONRenderer().render(rows.serialize(rows.values(queryset))), expected)
+
+    def test_mood_detections(self):
+        MoodDetectionResult.objects.bulk_create([
+            MoodDetectionResult(user=self.user, mood='happy', confidence=confidence,
+                                image=image, detected_at=timezone.now())
+            for confidence, image in [(1e-05, ''), (1e16, 'mood_images/a.jpg'), (0.0, None), (0.1 + 0.2, '')]
+        ])
+        queryset = MoodDetectionResult.objects.filter(user=self.user).order_by('-detected_at', '-id')
+        self.assertSameJSON(MoodDetectionSerializer, mood_detection_rows, queryset)
+        with timezone.override('Asia/Kolkata'):
+            self.assertSameJSON(MoodDetectionSerializer, mood_detection_rows, queryset.all()[:50])
+
+    def test_playlists(self):
+        SpotifyPlaylist.objects.create(
+            user=self.user, spotify_id='unicode', name='Line\u2028separator \u00e9\U0001f3b5',
+            description='"quoted"\n', mood='happy', is_public=False,
+        )
+        queryset = SpotifyPlaylist.objects.filter(user=self.user)
+        self.assertSameJSON(SpotifyPlaylistSerializer, spotify_playlist_rows, queryset)
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'day': timezone.localdate(), 'at': timezone.now(), 'text': 'caf\u00e9 \u2029',
+            'floats': [json_float(v) for v in (0.5, 1e-7, 2.5e20, -0.0)],
+            'nested': [{'n': 2 ** 70}, None, True],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+        for value in (float('nan'), float('inf')):
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render({'confidence': json_float(value)})
+
+
+class ProfilingTests(SeededAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profiles_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.profiles_dir)
+
+    def profiling(self, **config):
+        return self.settings(PROFILES_DIR=self.profiles_dir, PROFILING={
+            'ENABLED': True, 'SAMPLE_RATE': 0, 'INTERVAL_MS': 1, **config
+        })
+
+    def detect(self, seconds):
+        def slow_detect(*args, **kwargs):
+            time.sleep(seconds)
+            return {'mood': 'happy', 'confidence': 0.9}
+
+        with mock.patch('api.views.MoodDetectionService') as service:
+            service.return_value.detect_mood_from_base64.side_effect = slow_detect
+            response = self.client.post('/api/mood/detect/', {'image': 'AAAA'}, content_type='application/json')
+        profile_writer.wait()
+        return response
+
+    def test_slow_requests_are_profiled_and_served_to_staff(self):
+        with self.profiling(SLOW_MS=20):
+            self.detect(0.05)
+            self.detect(0)
+
+        [profile] = self.profiles_dir.iterdir()
+        self.assertRegex(profile.name, r'-mood-detect-\d+ms-')
+        self.assertIn('api.views:MoodDetectionViewSet.detect;', profile.read_text())
+
+        self.assertEqual(self.client.get('/admin/profiles/').status_code, 302)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        with self.settings(PROFILES_DIR=self.profiles_dir):
+            [entry] = self.client.get('/admin/profiles/').json()['profiles']
+            self.assertEqual(entry['route'], 'mood-detect')
+            self.assertGreaterEqual(entry['duration_ms'], 50)
+            download = self.client.get(entry['url'])
+        self.assertEqual(b''.join(download.streaming_content).decode(), profile.read_text())
+
+    def test_sampled_requests_are_profiled_whatever_their_duration(self):
+        with self.profiling(SAMPLE_RATE=1):
+            self.detect(0.01)
+        [profile] = self.profiles_dir.iterdir()
+        self.assertIn('-mood-detect-', profile.name)
+
+    def test_write_errors_are_logged_not_raised(self):
+        with self.profiling(SAMPLE_RATE=1), self.assertLogs('vibewise_project.profiling', 'ERROR'), \
+                mock.patch('vibewise_project.profiling.write_profile', side_effect=OSError('disk full')):
+            response = self.detect(0)
+        self.assertEqual(response.status_code, 200)
+
+    def test_only_the_newest_profiles_are_kept(self):
+        with self.profiling(MAX_FILES=2):
+            paths = [write_profile(Counter({'a;b': 1}), 'mood-detect', ms / 1000) for ms in (10, 20, 30)]
+        self.assertEqual(sorted(self.profiles_dir.iterdir()), sorted(paths[1:]))
+
+
+class QueryInspectorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(4):
+            User.objects.create_user(username=f'user{i}@example.com', email=f'user{i}@example.com')
+
+    def middleware(self, view, **config):
+        with self.settings(QUERY_INSPECTOR={'ENABLED': True, 'REPEAT_THRESHOLD': 3, **config}):
+            return QueryInspectorMiddleware(view)
+
+    def test_repeated_queries_are_logged_with_their_location(self):
+        def view(request):
+            for pk in User.objects.values_list('pk', flat=True):
+                User.objects.get(pk=pk)  # one query per row
+            return HttpResponse()
+
+        with self.assertLogs('vibewise_project.query_inspector', 'WARNING') as logs:
+            self.middleware(view)(RequestFactory().get('/users/'))
+
+        record = logs.records[0]
+        self.assertEqual(record.query_count, 5)
+        [repeated] = record.repeated_queries
+        self.assertEqual(repeated['count'], 4)
+        self.assertIn('WHERE "accounts_user"."id" = %s', repeated['fingerprint'])
+        self.assertRegex(repeated['locations'][0], r'^api/tests\.py:\d+ \(view\) x4$')
+
+    def test_streaming_bodies_are_inspected_until_closed(self):
+        def rows():
+            for pk in User.objects.values_list('pk', flat=True):
+                yield f"{User.objects.get(pk=pk).email}\n"
+
+        view = lambda request: StreamingHttpResponse(rows())
+        with self.assertLogs('vibewise_project.query_inspector', 'WARNING') as logs:
+            response = self.middleware(view)(RequestFactory().get('/export/'))
+            self.assertEqual(logs.records, [])
+            b''.join(response.streaming_content)
+            response.close()
+
+        [record] = logs.records
+        self.assertEqual(record.query_count, 5)
+        self.assertEqual(record.repeated_queries[0]['count'], 4)
+
+    def test_fingerprints_ignore_literals_and_list_lengths(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE a IN (%s, %s) AND b = 'x' LIMIT 21"),
+            fingerprint("SELECT * FROM t WHERE a IN (%s, %s, %s) AND b = 'y' LIMIT 5"),
+        )
+        self.assertEqual(
+            fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+            fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)'),
+        )
+
+    def test_not_loaded_when_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            self.middleware(lambda request: HttpResponse(), ENABLED=False)
+
+
+class MemoryDiagnosticsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='ops@example.com', email='ops@example.com', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+        self.addCleanup(tracemalloc.stop)
+
+    def test_snapshot_diff_points_at_the_growth(self):
+        self.client.post('/admin/memory/tracing/', {'action': 'start'})
+        first = self.client.post('/admin/memory/snapshots/').json()['snapshots'][-1]['id']
+        retained = [bytearray(1024) for _ in range(2000)]  # noqa: F841
+        second = self.client.post('/admin/memory/snapshots/').json()['snapshots'][-1]['id']
+
+        diff = self.client.get(f'/admin/memory/snapshots/{first}/diff/', {'against': second}).json()
+        top = diff['top_growth'][0]
+        self.assertIn('api/tests.py', top['site'])
+        self.assertGreaterEqual(top['size_diff'], 2000 * 1024)
+
+        report = self.client.get('/admin/memory/', {'top': 5}).json()
+        self.assertTrue(report['tracemalloc']['tracing'])
+        self.assertEqual(len(report['top_allocations']), 5)
+        self.assertIn('spotify_search_cache', report['internal'])
+
+        self.client.post('/admin/memory/tracing/', {'action': 'stop'})
+        self.assertEqual(self.client.get(f'/admin/memory/snapshots/{first}/diff/').status_code, 404)
+
+    def test_object_count_is_opt_in(self):
+        self.assertNotIn('tracked_objects', self.client.get('/admin/memory/').json()['gc'])
+        report = self.client.get('/admin/memory/', {'objects': '1'}).json()
+        self.assertGreater(report['gc']['tracked_objects'], 0)
+
+    def test_signal_toggles_tracing_and_dumps_to_disk(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        previous = install_dump_signal(signal.SIGUSR2)
+        self.addCleanup(signal.signal, signal.SIGUSR2, previous)
+
+        def wait_for(condition):
+            deadline = time.monotonic() + 5
+            while not condition() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            return condition()
+
+        def report():
+            # The .json is written last
+            try:
+                return json.loads(next(directory.glob(f'memory-{os.getpid()}-*.json')).read_text())
+            except (StopIteration, ValueError):
+                return None
+
+        with self.settings(MEMORY_DUMPS_DIR=directory):
+            os.kill(os.getpid(), signal.SIGUSR2)
+            self.assertTrue(wait_for(tracemalloc.is_tracing))
+            retained = [bytearray(1024) for _ in range(2000)]  # noqa: F841
+            os.kill(os.getpid(), signal.SIGUSR2)
+            dumped = wait_for(report)
+
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertIn('api/tests.py', dumped['top_allocations'][0]['site'])
+        snapshot = tracemalloc.Snapshot.load(str(next(directory.glob('*.snapshot'))))
+        self.assertGreater(len(snapshot.traces), 0)
+
+    def test_snapshots_need_tracing(self):
+        self.assertEqual(self.client.post('/admin/memory/snapshots/').status_code, 409)
+        self.assertNotIn('top_allocations', self.client.get('/admin/memory/').json())
+
+    def test_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/admin/memory/').status_code, 302)
+        self.assertEqual(self.client.post('/admin/memory/tracing/', {'action': 'start'}).status_code, 302)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class RateLimitFilterTests(SimpleTestCase):
+
+    def test_old_windows_are_evicted(self):
+        rate_limit = RateLimitFilter(rate=1, per=60)
+        with mock.patch('vibewise_project.logutils.time.monotonic', return_value=1000):
+            for i in range(100):
+                rate_limit.filter(logging.makeLogRecord({'msg': f'user {i} logged in'}))
+        self.assertEqual(len(rate_limit._windows), 100)
+
+        with mock.patch('vibewise_project.logutils.time.monotonic', return_value=1200):
+            self.assertTrue(rate_limit.filter(logging.makeLogRecord({'msg': 'later'})))
+        self.assertEqual(list(rate_limit._windows), [(None, 0, 'later')])
+
+
+class QueuedJsonLoggingTests(SimpleTestCase):
+
+    def test_tracebacks_stay_out_of_the_message(self):
+        stream = StringIO()
+        output = logging.StreamHandler(stream)
+        output.setFormatter(JsonFormatter())
+        queued = QueueListenerHandler([output])
+        logger = logging.getLogger('vibewise_project.tests.queued')
+        logger.addHandler(queued)
+        self.addCleanup(logger.removeHandler, queued)
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("Export %s failed", 'users.csv')
+        queued.close()
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(entry['message'], 'Export users.csv failed')
+        self.assertIn('ZeroDivisionError', entry['exc_info'])
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """Routing decisions of vibewise_project.db_router, without a second database"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        patcher = mock.patch('vibewise_project.db_router.replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def route(self, request, view):
+        routed = {}
+
+        def get_response(request):
+            routed['alias'] = view()
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        return routed['alias'], PIN_COOKIE in response.cookies
+
+    @staticmethod
+    @replica_reads
+    def read_view():
+        return router.db_for_read(MoodDetectionResult)
+
+    def test_read_only_view_uses_replica(self):
+        self.assertEqual(self.route(self.factory.get('/'), self.read_view), ('replica', False))
+
+    def test_undecorated_view_uses_primary(self):
+        view = lambda: router.db_for_read(MoodDetectionResult)
+        self.assertEqual(self.route(self.factory.get('/'), view), ('default', False))
+
+    def test_recent_writer_is_pinned_to_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.route(request, self.read_view), ('default', False))
+
+    def test_unsafe_request_uses_primary_and_pins(self):
+        self.assertEqual(self.route(self.factory.post('/'), self.read_view), ('default', True))
+
+    @replica_reads
+    def write_then_read(self):
+        router.db_for_write(MoodDetectionResult)
+        return router.db_for_read(MoodDetectionResult)
+
+    def test_reads_after_a_write_use_primary(self):
+        self.assertEqual(self.route(self.factory.get('/'), self.write_then_read), ('default', True))
+
+    def test_sessions_stay_on_primary(self):
+        view = replica_reads(lambda: router.db_for_read(Session))
+        self.assertEqual(self.route(self.factory.get('/'), view), ('default', False))
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    """The production SQLite backend against a throwaway database file"""
+
+    alias = 'sqlite_backend_test'
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.name = str(Path(directory) / 'db.sqlite3')
+        self.wrapper = self.connect()
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (n INTEGER)')
+
+    def connect(self, **options):
+        settings_dict = {
+            **connection.settings_dict, 'ENGINE': 'vibewise_project.sqlite_backend',
+            'NAME': self.name, 'OPTIONS': options, 'TEST': {},
+        }
+        wrapper = SQLiteDatabaseWrapper(settings_dict, alias=self.alias)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    @contextmanager
+    def registered(self, wrapper):
+        # transaction.atomic() looks the connection up by alias (per thread)
+        connections[self.alias] = wrapper
+        try:
+            yield
+        finally:
+            del connections[self.alias]
+
+    def insert(self, wrapper):
+        with self.registered(wrapper), transaction.atomic(using=self.alias):
+            with wrapper.cursor() as cursor:
+                cursor.execute('INSERT INTO counter (n) VALUES (1)')
+
+    def count(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM counter')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied(self):
+        wrapper = self.connect(busy_timeout=1234)
+        with wrapper.cursor() as cursor:
+            figures = {}
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store'):
+                cursor.execute(f'PRAGMA {pragma}')
+                figures[pragma] = cursor.fetchone()[0]
+        self.assertEqual(figures, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 1234, 'temp_store': 2})
+
+    def test_transactions_begin_immediate(self):
+        other = sqlite3.connect(self.name, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        with self.registered(self.wrapper), transaction.atomic(using=self.alias):
+            # A deferred BEGIN would not hold SQLite's write lock yet
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+        other.execute('BEGIN IMMEDIATE')
+        other.execute('ROLLBACK')
+
+    def test_lock_is_released_on_commit_rollback_and_close(self):
+        lock = self.wrapper.writer_lock
+        with self.registered(self.wrapper):
+            with transaction.atomic(using=self.alias):
+                self.assertTrue(lock.stats()['locked'])
+            self.assertFalse(lock.stats()['locked'])
+
+            with self.assertRaises(ZeroDivisionError), transaction.atomic(using=self.alias):
+                self.assertTrue(lock.stats()['locked'])
+                1 / 0
+            self.assertFalse(lock.stats()['locked'])
+
+        self.wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        self.assertTrue(lock.stats()['locked'])
+        self.wrapper.close()
+        self.assertFalse(lock.stats()['locked'])
+
+    def test_failed_commit_keeps_the_lock_until_rollback(self):
+        lock = self.wrapper.writer_lock
+        with self.registered(self.wrapper), \
+                mock.patch.object(sqlite_base.DatabaseWrapper, '_commit', side_effect=OperationalError('busy')), \
+                mock.patch.object(SQLiteDatabaseWrapper, '_rollback', autospec=True) as rollback:
+            with self.assertRaises(OperationalError), transaction.atomic(using=self.alias):
+                pass
+            self.assertTrue(lock.stats()['locked'])
+            rollback.assert_called_once()
+        self.wrapper.rollback()
+        self.assertFalse(lock.stats()['locked'])
+
+    def test_writer_lock_timeout(self):
+        waiting = self.connect(busy_timeout=50)
+        waiting.writer_lock.acquire(1)
+        try:
+            with self.assertRaisesMessage(OperationalError, 'writer lock'):
+                self.insert(waiting)
+        finally:
+            waiting.writer_lock.release()
+        self.assertEqual(waiting.writer_lock.stats()['timeouts'], 1)
+        self.assertFalse(waiting.writer_lock.stats()['locked'])
+        self.assertEqual(self.count(), 0)
+
+    def test_concurrent_writers(self):
+        def write(_):
+            wrapper = SQLiteDatabaseWrapper(self.wrapper.settings_dict, alias=self.alias)
+            try:
+                for _ in range(25):
+                    self.insert(wrapper)
+            finally:
+                wrapper.close()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(write, range(4)))
+
+        self.assertEqual(self.count(), 100)
+        self.assertEqual(self.wrapper.writer_lock.stats()['timeouts'], 0)
+
+
+@tag('benchmark')
+@skipUnless(os.environ.get('API_BENCHMARKS'), 'set API_BENCHMARKS=1 to run the latency benchmarks')
+class LatencyBenchmarkTests(SeededAPITestCase):
+    """p95 latency budgets (milliseconds) for the read endpoints"""
+
+    BUDGETS_MS = {
+        '/api/mood/history/': 60,
+        '/api/mood/history/?page_size=100': 120,
+        '/api/spotify/playlists/': 60,
+        '/api/async/spotify/playlists/': 80,
+        '/api/spotify/status/': 30,
+        '/api/dashboard/stats/': 60,
+        '/api/profile/': 30,
+        '/api/auth/check_auth/': 30,
+    }
+
+    def measure(self, url):
+        self.client.get(url)  # warm up imports and connections
+        samples = []
+        for _ in range(LATENCY_RUNS):
+            cache.clear()
+            self.client.force_login(self.user)
+            started = time.perf_counter()
+            response = self.client.get(url)
+            samples.append((time.perf_counter() - started) * 1000)
+            self.assertEqual(response.status_code, 200)
+        cuts = statistics.quantiles(samples, n=20)
+        return {'p50': round(statistics.median(samples), 2), 'p95': round(cuts[18], 2)}
+
+    def test_read_endpoint_latency(self):
+        report = {}
+        for url, budget in self.BUDGETS_MS.items():
+            report[url] = self.measure(url)
+            report[url]['budget'] = budget * LATENCY_BUDGET_SCALE
+
+        if os.environ.get('API_LATENCY_REPORT'):
+            with open(os.environ['API_LATENCY_REPORT'], 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+
+        for url, figures in report.items():
+            with self.subTest(url=url):
+                self.assertLessEqual(figures['p95'], figures['budget'], figures)
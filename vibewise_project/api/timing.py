@@ -0,0 +1,141 @@
+"""
+Per-stage wall-clock timing for request pipelines
+
+Views wrapped in @server_timing get a StageTimer on the request (see
+request_timer) and report its stages in a Server-Timing header, which
+browser devtools and load tests can read. The same figures are added to
+the JSON body as ``timings`` when the request has ``?timings=1`` or
+API_DEBUG_TIMINGS is on.
+"""
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpRequest
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from . import metrics
+
+SERVER_TIMING_HEADER = 'Server-Timing'
+
+
+class StageTimer:
+    """Collect named stage durations; safe to record from worker threads"""
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._stages[name] = self._stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name, fn):
+        """Wrap ``fn`` so each call is recorded under ``name``"""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    async def measure(self, name, awaitable):
+        """Await ``awaitable`` and record its duration under ``name``"""
+        with self.stage(name):
+            return await awaitable
+
+    def total(self):
+        return time.perf_counter() - self._started
+
+    def durations(self):
+        """Stage durations in seconds"""
+        with self._lock:
+            return dict(self._stages)
+
+    def as_dict(self):
+        """Stage durations in milliseconds, plus the elapsed total"""
+        with self._lock:
+            timings = {name: round(seconds * 1000, 1) for name, seconds in self._stages.items()}
+        timings['total'] = round(self.total() * 1000, 1)
+        return timings
+
+    def summary(self):
+        return ', '.join(f"{name}={ms}ms" for name, ms in self.as_dict().items())
+
+    def server_timing(self, timings=None):
+        """Server-Timing header value, e.g. ``imdecode;dur=3.1, total;dur=12.0``"""
+        timings = self.as_dict() if timings is None else timings
+        return ', '.join(f"{name};dur={ms}" for name, ms in timings.items())
+
+
+def request_timer(request):
+    """The request's StageTimer (a throwaway one outside @server_timing views)"""
+    timer = getattr(request, 'stage_timer', None)
+    return timer if timer is not None else StageTimer()
+
+
+def timings_requested(request):
+    return getattr(settings, 'API_DEBUG_TIMINGS', False) or request.GET.get('timings') == '1'
+
+
+def with_timings(request, data, timings=None):
+    """``data`` plus the request's stage timings when the client asked for them"""
+    if timings_requested(request) and isinstance(data, dict) and 'timings' not in data:
+        data = {**data, 'timings': timings or request_timer(request).as_dict()}
+    return data
+
+
+def _find_request(args):
+    # View functions take the request first, view methods after self
+    for arg in args[:2]:
+        if isinstance(arg, (HttpRequest, Request)):
+            return arg
+    raise TypeError('server_timing could not find the request argument')
+
+
+def server_timing(view):
+    """
+    Give the view a request StageTimer and send its stages as Server-Timing
+    (and to the stage histogram in api.metrics). DRF responses also get the
+    ``timings`` debug field; async views, whose responses are already
+    rendered, add it with with_timings().
+    """
+    label = f'{view.__module__}.{view.__qualname__}'
+
+    def start(args):
+        request = _find_request(args)
+        request.stage_timer = StageTimer()
+        return request
+
+    def finish(request, response):
+        metrics.observe_stages(label, request.stage_timer.durations())
+        timings = request.stage_timer.as_dict()
+        response[SERVER_TIMING_HEADER] = request.stage_timer.server_timing(timings)
+        if isinstance(response, Response) and not response.is_rendered:
+            response.data = with_timings(request, response.data, timings)
+        return response
+
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            request = start(args)
+            return finish(request, await view(*args, **kwargs))
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        request = start(args)
+        return finish(request, view(*args, **kwargs))
+    return wrapper
@@ -3,7 +3,7 @@ API URL Configuration - COMPLETE VERSION
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, async_views
 
 # Create a router for ViewSets
 router = DefaultRouter()
@@ -18,4 +18,9 @@ urlpatterns = [
     # Additional views
     path('profile/', views.UserProfileView.as_view(), name='user-profile'),
     path('dashboard/stats/', views.DashboardStatsView.as_view(), name='dashboard-stats'),
+    
+    # Async Spotify endpoints (for ASGI deployments)
+    path('async/spotify/connect/', async_views.connect, name='async-spotify-connect'),
+    path('async/spotify/create_playlist/', async_views.create_playlist, name='async-spotify-create-playlist'),
+    path('async/spotify/playlists/', async_views.playlists, name='async-spotify-playlists'),
 ]
\ No newline at end of file
@@ -1,10 +1,11 @@
-import json
-import base64
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from django.contrib.auth import authenticate, login, logout
-from django.core.files.base import ContentFile
-from django.db import models
 from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import parse_etags, patch_vary_headers
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -12,11 +13,21 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
 from accounts.models import User, UserPreferences
 from mood_detection.models import MoodDetectionResult
+from mood_detection.rollups import archived_rollups, dashboard_stats
+from mood_detection.write_behind import save_detection
 from spotify_integration.models import SpotifyPlaylist
-from .serializers import (
-    UserSerializer, MoodDetectionSerializer, SpotifyPlaylistSerializer
-)
+from .serializers import UserSerializer, mood_detection_rows, spotify_playlist_rows
 from .services import MoodDetectionService, SpotifyService
+from .idempotency import run_once
+from .pagination import MoodArchivePagination, MoodHistoryPagination, PlaylistPagination
+from .renderers import fast_renderer_classes
+from .metrics import in_request_context, spotify_session
+from .timing import request_timer, server_timing
+from .response_cache import cache_per_user
+from .status_cache import get_status, status_etag
+from vibewise_project.db_router import replica_reads
+
+logger = logging.getLogger(__name__)
 
 class AuthViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
@@ -99,7 +110,7 @@ class AuthViewSet(viewsets.ViewSet):
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
-            print(f"Logout error: {e}")
+            logger.warning("Logout error: %s", e)
             return Response({
                 'success': False,
                 'error': str(e)
@@ -138,6 +149,7 @@ class MoodDetectionViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
     
     @action(detail=False, methods=['post'])
+    @server_timing
     def detect(self, request):
         """Detect mood from image - PRIVACY PROTECTED (NO IMAGE STORAGE)"""
         try:
@@ -148,7 +160,9 @@ class MoodDetectionViewSet(viewsets.ViewSet):
                     'authenticated': False
                 }, status=status.HTTP_401_UNAUTHORIZED)
             
-            image_data = request.data.get('image')
+            timer = request_timer(request)
+            with timer.stage('parse'):
+                image_data = request.data.get('image')
             save_image = request.data.get('save_image', False)  # Default: DON'T save
             
             if not image_data:
@@ -156,6 +170,18 @@ class MoodDetectionViewSet(viewsets.ViewSet):
                     'error': 'No image provided'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
+            # Optional client-generated id so a retried upload isn't stored twice
+            detection_uuid = request.data.get('detection_id')
+            if detection_uuid:
+                try:
+                    detection_uuid = uuid.UUID(str(detection_uuid))
+                except ValueError:
+                    return Response({
+                        'error': 'detection_id must be a UUID'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+            else:
+                detection_uuid = None
+            
             # Process base64 image
             if 'base64,' in image_data:
                 format, imgstr = image_data.split(';base64,')
@@ -166,24 +192,28 @@ class MoodDetectionViewSet(viewsets.ViewSet):
             
             # Use mood detection service
             mood_service = MoodDetectionService()
-            mood_result = mood_service.detect_mood_from_base64(imgstr)
+            mood_result = mood_service.detect_mood_from_base64(imgstr, timer=timer)
             
             if mood_result:
                 # ⚠️ PRIVACY: Save ONLY mood result, NOT the image
-                mood_detection = MoodDetectionResult.objects.create(
-                    user=request.user,
-                    mood=mood_result['mood'],
-                    confidence=mood_result['confidence']
-                    # image field is LEFT EMPTY for privacy
-                )
+                # (buffered and written in batches when MOOD_WRITE_BEHIND is on)
+                with timer.stage('save'):
+                    mood_detection = save_detection(
+                        request.user,
+                        mood_result['mood'],
+                        mood_result['confidence'],
+                        detection_uuid=detection_uuid
+                        # image field is LEFT EMPTY for privacy
+                    )
                 
-                print(f"✅ Mood detected for {request.user.email}: {mood_result['mood']} "
-                      f"(image NOT saved for privacy)")
+                logger.debug("✅ Mood detected for user %s: %s (image NOT saved for privacy)",
+                             request.user.pk, mood_result['mood'])
                 
                 return Response({
                     'mood': mood_result['mood'],
                     'confidence': mood_result['confidence'],
                     'id': mood_detection.id,
+                    'detection_id': str(mood_detection.uuid),
                     'message': 'Mood detected successfully',
                     'privacy': 'Image processed but not saved'
                 })
@@ -193,36 +223,53 @@ class MoodDetectionViewSet(viewsets.ViewSet):
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
                 
         except Exception as e:
-            print(f"Mood detection error: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Mood detection error: %s", e)
             return Response({
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], renderer_classes=fast_renderer_classes())
+    @cache_per_user('mood_history')
+    @replica_reads
     def history(self, request):
-        """Get mood detection history (without images for privacy)"""
-        moods = MoodDetectionResult.objects.filter(
-            user=request.user
-        ).order_by('-detected_at')[:20]
+        """Get mood detection history (without images for privacy), newest first.
         
-        return Response({
-            'results': MoodDetectionSerializer(moods, many=True).data
-        })
+        Follow ``next`` for older entries; ``page_size`` goes up to 100.
+        Once the raw detections run out, ``next`` continues into days that
+        were compacted into daily totals (entries with ``aggregated: true``).
+        """
+        archive = MoodArchivePagination()
+        if archive.is_archive_request(request):
+            rollups = archive.paginate_queryset(
+                archived_rollups(request.user).values('id', 'mood', 'day', 'count'), request
+            )
+            return Response(archive.get_paginated_data([
+                {'mood': rollup['mood'], 'day': rollup['day'], 'count': rollup['count'], 'aggregated': True}
+                for rollup in rollups
+            ]))
+        
+        paginator = MoodHistoryPagination()
+        moods = paginator.paginate_queryset(
+            mood_detection_rows.values(MoodDetectionResult.objects.filter(user=request.user)), request
+        )
+        data = paginator.get_paginated_data(mood_detection_rows.serialize(moods))
+        
+        if data['next'] is None and archived_rollups(request.user).exists():
+            data['next'] = archive.get_start_link(request, paginator.cursor_query_param)
+        return Response(data)
 
 
 class SpotifyViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
     
     @action(detail=False, methods=['post'])
+    @server_timing
     def connect(self, request):
         """Connect Spotify account"""
         code = request.data.get('code')
         redirect_uri = request.data.get('redirect_uri', settings.SPOTIFY_REDIRECT_URI)
         
-        print(f"Spotify connect - Code: {code[:20] if code else 'None'}...")
-        print(f"Redirect URI: {redirect_uri}")
+        logger.debug("Spotify connect - code present: %s, redirect URI: %s", bool(code), redirect_uri)
         
         if not code:
             return Response({
@@ -230,11 +277,14 @@ class SpotifyViewSet(viewsets.ViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
+            timer = request_timer(request)
             spotify_service = SpotifyService()
-            tokens = spotify_service.exchange_code_for_tokens(code, redirect_uri)
+            with timer.stage('token_exchange'):
+                tokens = spotify_service.exchange_code_for_tokens(code, redirect_uri)
             
-            spotify_user = spotify_service.get_user_profile(tokens['access_token'])
-            print(f"Spotify user: {spotify_user.get('id')}, {spotify_user.get('display_name')}")
+            with timer.stage('profile'):
+                spotify_user = spotify_service.get_user_profile(tokens['access_token'])
+            logger.info("Spotify user connected: %s", spotify_user.get('id'))
             
             email = spotify_user.get('email')
             spotify_id = spotify_user.get('id')
@@ -243,29 +293,31 @@ class SpotifyViewSet(viewsets.ViewSet):
             if not email:
                 email = f"{spotify_id}@spotify.user"
             
-            user, created = User.objects.get_or_create(
-                email=email,
-                defaults={
-                    'username': email,
-                    'name': display_name,
-                    'spotify_id': spotify_id,
-                    'spotify_access_token': tokens['access_token'],
-                    'spotify_refresh_token': tokens.get('refresh_token', '')
-                }
-            )
-            
-            if not created:
-                user.name = display_name
-                user.spotify_id = spotify_id
-                user.spotify_access_token = tokens['access_token']
-                user.spotify_refresh_token = tokens.get('refresh_token', '')
-                user.save()
-            else:
-                user.set_password(User.objects.make_random_password())
-                user.save()
-                UserPreferences.objects.get_or_create(user=user)
-            
-            login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+            with timer.stage('save_user'):
+                user, created = User.objects.get_or_create(
+                    email=email,
+                    defaults={
+                        'username': email,
+                        'name': display_name,
+                        'spotify_id': spotify_id,
+                        'spotify_access_token': tokens['access_token'],
+                        'spotify_refresh_token': tokens.get('refresh_token', '')
+                    }
+                )
+                
+                if not created:
+                    user.name = display_name
+                    user.spotify_id = spotify_id
+                    user.spotify_access_token = tokens['access_token']
+                    user.spotify_refresh_token = tokens.get('refresh_token', '')
+                    user.save()
+                else:
+                    user.set_password(User.objects.make_random_password())
+                    user.save()
+                    UserPreferences.objects.get_or_create(user=user)
+            
+            with timer.stage('login'):
+                login(request, user, backend='django.contrib.auth.backends.ModelBackend')
             
             return Response({
                 'message': 'Spotify connected successfully',
@@ -279,22 +331,26 @@ class SpotifyViewSet(viewsets.ViewSet):
             })
             
         except Exception as e:
-            import traceback
-            print(f"Spotify connection error: {e}")
-            traceback.print_exc()
+            logger.exception("Spotify connection error: %s", e)
             return Response({
                 'error': f'Failed to connect Spotify: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     @action(detail=False, methods=['post'])
-    def create_playlist(request):
+    @server_timing
+    def create_playlist(self, request):
+        """Create a mood playlist; duplicate clicks and client retries run once"""
+        mood = request.data.get('mood')
+        return run_once(
+            request, 'create_playlist', mood,
+            lambda: self._create_playlist(request, mood)
+        )
+    
+    def _create_playlist(self, request, mood):
         from spotify_integration.models import SpotifyUser, MoodDetectionResult, SpotifyPlaylist
-        from datetime import datetime
         import spotipy
         
         try:
-            mood = request.data.get('mood')
-            
             # Get Spotify auth from session
             spotify_data = request.session.get('spotify_auth', {})
             access_token = spotify_data.get('access_token')
@@ -303,61 +359,74 @@ class SpotifyViewSet(viewsets.ViewSet):
                 return Response({'error': 'Not authenticated'}, status=401)
             
             # Initialize Spotify
-            sp = spotipy.Spotify(auth=access_token)
-            user_profile = sp.current_user()
-            
-            # ✅ SAVE SPOTIFY USER
-            spotify_user, created = SpotifyUser.objects.update_or_create(
-                user=request.user,
-                defaults={
-                    'spotify_id': user_profile['id'],
-                    'display_name': user_profile.get('display_name', ''),
-                    'email': user_profile.get('email', ''),
-                    'access_token': access_token,
-                    'refresh_token': spotify_data.get('refresh_token', ''),
-                    'token_expires_at': datetime.fromtimestamp(spotify_data.get('expires_at', 0))
-                }
-            )
-            
-            # ✅ SAVE MOOD DETECTION
-            MoodDetectionResult.objects.create(
-                user=request.user,
-                mood=mood,
-                confidence=0.85
-            )
-            
-            # Create playlist on Spotify
+            sp = spotipy.Spotify(auth=access_token, requests_session=spotify_session())
             playlist_name = f"VibeWise - {mood.title()} Vibes"
-            new_playlist = sp.user_playlist_create(
-                user_profile['id'],
-                playlist_name,
-                public=True
-            )
+            timer = request_timer(request)
+            
+            # Stage 1: top tracks don't depend on anything, start them first
+            # Stage 2: the empty playlist only needs the profile; it is created
+            # once our rows are saved, so a failed save leaves nothing on the
+            # user's Spotify account, while the top tracks are still loading
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                top_tracks_future = pool.submit(
+                    in_request_context(timer.timed('top_tracks', sp.current_user_top_tracks)),
+                    limit=30, time_range='medium_term'
+                )
+                
+                with timer.stage('profile'):
+                    user_profile = sp.current_user()
+                
+                with timer.stage('save_user'):
+                    # ✅ SAVE SPOTIFY USER
+                    spotify_user, created = SpotifyUser.objects.update_or_create(
+                        user=request.user,
+                        defaults={
+                            'spotify_id': user_profile['id'],
+                            'display_name': user_profile.get('display_name', ''),
+                            'email': user_profile.get('email', ''),
+                            'country': user_profile.get('country', ''),
+                            'access_token': access_token,
+                            'refresh_token': spotify_data.get('refresh_token', ''),
+                            'token_expires_at': datetime.fromtimestamp(spotify_data.get('expires_at', 0))
+                        }
+                    )
+                    
+                    # ✅ SAVE MOOD DETECTION
+                    MoodDetectionResult.objects.create(
+                        user=request.user,
+                        mood=mood,
+                        confidence=0.85
+                    )
+                
+                playlist_future = pool.submit(
+                    in_request_context(timer.timed('create_playlist', sp.user_playlist_create)),
+                    user_profile['id'], playlist_name, public=True
+                )
+                
+                top_tracks = top_tracks_future.result()
+                new_playlist = playlist_future.result()
             
-            # Get user's top tracks
-            top_tracks = sp.current_user_top_tracks(limit=30, time_range='medium_term')
+            # Stage 3: add tracks; the count is what we added, no re-read needed
             track_uris = [track['uri'] for track in top_tracks['items']]
-            
-            # Add tracks to playlist
             if track_uris:
-                sp.playlist_add_items(new_playlist['id'], track_uris)
-            
-            # ✅ GET ACTUAL TRACK COUNT FROM SPOTIFY
-            playlist_info = sp.playlist(new_playlist['id'])
-            actual_tracks = playlist_info['tracks']['total']
+                with timer.stage('add_tracks'):
+                    sp.playlist_add_items(new_playlist['id'], track_uris)
+            actual_tracks = len(track_uris)
             
-            print(f"✅ Created playlist with {actual_tracks} tracks")
+            with timer.stage('save_playlist'):
+                SpotifyPlaylist.objects.create(
+                    user=request.user,
+                    spotify_id=new_playlist['id'],
+                    name=playlist_name,
+                    spotify_url=new_playlist['external_urls']['spotify'],
+                    total_tracks=actual_tracks,
+                    mood=mood,
+                    is_public=True
+                )
             
-            # ✅ SAVE WITH CORRECT TRACK COUNT
-            SpotifyPlaylist.objects.create(
-                user=request.user,
-                spotify_id=new_playlist['id'],
-                name=playlist_name,
-                spotify_url=new_playlist['external_urls']['spotify'],
-                total_tracks=actual_tracks,  # ← CORRECT COUNT!
-                mood=mood,
-                is_public=True
-            )
+            timings = timer.as_dict()
+            logger.info("Created playlist with %s tracks for user %s (%s)",
+                        actual_tracks, request.user.pk, timer.summary())
             
             return Response({
                 'success': True,
@@ -366,16 +435,18 @@ class SpotifyViewSet(viewsets.ViewSet):
                 'playlist': {
                     'name': playlist_name,
                     'total_tracks': actual_tracks
-                }
+                },
+                'timings': timings
             })
             
         except Exception as e:
-            print(f"Error: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error creating playlist: %s", e)
             return Response({'error': str(e)}, status=500)
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], renderer_classes=fast_renderer_classes())
+    @server_timing
+    @cache_per_user('playlists')
+    @replica_reads
     def playlists(self, request):
         """Get user's playlists"""
         if not request.user.is_authenticated:
@@ -383,25 +454,45 @@ class SpotifyViewSet(viewsets.ViewSet):
                 'error': 'Authentication required'
             }, status=status.HTTP_401_UNAUTHORIZED)
         
-        playlists = SpotifyPlaylist.objects.filter(user=request.user).order_by('-created_at')
-        return Response({
-            'playlists': SpotifyPlaylistSerializer(playlists, many=True).data
-        })
+        paginator = PlaylistPagination()
+        playlists = paginator.paginate_queryset(
+            spotify_playlist_rows.values(SpotifyPlaylist.objects.filter(user=request.user)), request
+        )
+        return Response(paginator.get_paginated_data(spotify_playlist_rows.serialize(playlists)))
 
-    @action(detail=False, methods=['get'])
-    def status(self, request):
-        """Check Spotify connection status"""
-        if request.user.is_authenticated and request.user.spotify_access_token:
+    @action(detail=False, methods=['get'], url_path=r'playlists/(?P<playlist_id>[^/.]+)/tracks',
+            renderer_classes=fast_renderer_classes())
+    @server_timing
+    def playlist_tracks(self, request, playlist_id):
+        """Items of one of the user's playlists, from the local mirror"""
+        if not request.user.is_authenticated:
             return Response({
-                'connected': True,
-                'user': {
-                    'name': request.user.name or request.user.username,
-                    'email': request.user.email,
-                    'spotify_id': request.user.spotify_id
-                }
-            })
+                'error': 'Authentication required'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+        
+        access_token = request.session.get('spotify_auth', {}).get('access_token')
+        with request_timer(request).stage('tracks'):
+            items = SpotifyService().get_playlist_tracks(access_token, playlist_id, user=request.user)
+        return Response({'items': items, 'total': len(items)})
+
+    # The session is read directly in get_status; skip loading the user
+    @action(detail=False, methods=['get'], authentication_classes=[])
+    @server_timing
+    def status(self, request):
+        """Check Spotify connection status (cached per user, supports If-None-Match)"""
+        data = get_status(request.session)
+        etag = status_etag(data)
+        # Weak comparison, as for If-None-Match in Django's conditional views
+        matches = {tag.removeprefix('W/') for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))}
+
+        if '*' in matches or etag in matches:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
         else:
-            return Response({'connected': False})
+            response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Cookie'])
+        return response
     
     @action(detail=False, methods=['post', 'get'])
     def logout(self, request):
@@ -424,9 +515,7 @@ class SpotifyViewSet(viewsets.ViewSet):
             })
             
         except Exception as e:
-            import traceback
-            print(f"Logout error: {e}")
-            traceback.print_exc()
+            logger.exception("Spotify logout error: %s", e)
             return Response({
                 'success': False,
                 'error': str(e)
@@ -462,26 +551,23 @@ class UserProfileView(APIView):
 
 class DashboardStatsView(APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = fast_renderer_classes()
     
+    @cache_per_user('dashboard_stats')
+    @replica_reads
     def get(self, request):
+        """Served from the per-user rollups (see mood_detection.rollups)"""
         user = request.user
-        now = datetime.now()
-        week_ago = now - timedelta(days=7)
-        
-        mood_stats = MoodDetectionResult.objects.filter(
-            user=user,
-            detected_at__gte=week_ago
-        ).values('mood').annotate(count=models.Count('mood'))
-        
-        playlist_count = SpotifyPlaylist.objects.filter(user=user).count()
+        # The rollups are per local day: today and the 6 before it
+        stats = dashboard_stats(user, since=timezone.localdate() - timedelta(days=6))
         
-        recent_moods = MoodDetectionResult.objects.filter(
-            user=user
+        recent_moods = mood_detection_rows.values(
+            MoodDetectionResult.objects.filter(user=user)
         ).order_by('-detected_at')[:5]
         
         return Response({
-            'mood_stats': list(mood_stats),
-            'playlist_count': playlist_count,
-            'recent_moods': MoodDetectionSerializer(recent_moods, many=True).data,
-            'total_detections': MoodDetectionResult.objects.filter(user=user).count()
+            'mood_stats': stats['mood_stats'],
+            'playlist_count': stats['playlist_count'],
+            'recent_moods': mood_detection_rows.serialize(recent_moods),
+            'total_detections': stats['total_detections']
         })
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+Read-replica routing
+
+When a ``replica`` database is configured (DATABASE_REPLICA_URL, or
+DATABASE_REPLICA_PATH for a second SQLite file locally), reads made by
+views decorated with @replica_reads, inside reading_from_replica(), or by
+GET requests to the admin go to it; everything else uses ``default``.
+
+Reads stay on the primary when:
+- the request is not a GET/HEAD/OPTIONS;
+- the client wrote within the last DATABASE_REPLICA_STICKY_SECONDS (a short
+  lived cookie set by ReplicaRoutingMiddleware), so users see their own
+  writes despite replication lag;
+- something was written earlier in the same request, or a transaction is
+  open on the primary;
+- the model is in PRIMARY_ONLY_MODELS (sessions, whose reads decide who
+  is logged in).
+
+Without a replica the middleware drops out and the router sends
+everything to ``default``.
+"""
+import asyncio
+import contextvars
+import functools
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from vibewise_project.middleware import HybridMiddleware
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+PRIMARY_ONLY_MODELS = {'sessions.session'}
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class _RequestState:
+    __slots__ = ('can_use_replica', 'replica', 'wrote')
+
+    def __init__(self, can_use_replica):
+        self.can_use_replica = can_use_replica
+        self.replica = False
+        self.wrote = False
+
+
+_request_state = contextvars.ContextVar('db_request_state', default=None)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if (state is None or not state.replica or state.wrote
+                or model._meta.label_lower in PRIMARY_ONLY_MODELS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and model._meta.label_lower not in PRIMARY_ONLY_MODELS:
+            # Read the rest of this request back from the primary
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+@contextmanager
+def reading_from_replica():
+    """Send reads in this block to the replica, if the current request allows it"""
+    state = _request_state.get()
+    if state is None or not state.can_use_replica:
+        yield
+        return
+    previous, state.replica = state.replica, True
+    try:
+        yield
+    finally:
+        state.replica = previous
+
+
+def replica_reads(view):
+    """Serve the reads of a read-only view (function, method or async) from the replica"""
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            with reading_from_replica():
+                return await view(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with reading_from_replica():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """
+    Tracks per request whether the replica may be used and pins clients to
+    the primary for a while after they write. Place it after
+    AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        if not replica_configured():
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.sticky_seconds = getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 10)
+        self.admin_prefix = getattr(settings, 'DATABASE_REPLICA_ADMIN_PREFIX', '/admin/')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = self._state(request)
+        token = _request_state.set(state)
+        try:
+            if self._admin_read(request, state):
+                # Resolve the lazy user (and session) on the primary first
+                self._resolve_user(request)
+                state.replica = True
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self._finish(request, state, response)
+
+    async def __acall__(self, request):
+        state = self._state(request)
+        token = _request_state.set(state)
+        try:
+            if self._admin_read(request, state):
+                await sync_to_async(self._resolve_user)(request)
+                state.replica = True
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self._finish(request, state, response)
+
+    @staticmethod
+    def _state(request):
+        safe = request.method in SAFE_METHODS
+        return _RequestState(can_use_replica=safe and PIN_COOKIE not in request.COOKIES)
+
+    def _admin_read(self, request, state):
+        return state.can_use_replica and request.path.startswith(self.admin_prefix)
+
+    @staticmethod
+    def _resolve_user(request):
+        user = getattr(request, 'user', None)
+        if user is not None:
+            user.is_authenticated
+
+    def _finish(self, request, state, response):
+        if request.method not in SAFE_METHODS or state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=self.sticky_seconds, httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
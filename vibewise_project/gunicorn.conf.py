@@ -0,0 +1,39 @@
+"""
+Gunicorn settings; from the directory above this one:
+
+    gunicorn -c vibewise_project/gunicorn.conf.py vibewise_project.wsgi
+
+Workers share Prometheus figures through PROMETHEUS_MULTIPROC_DIR (see
+api/metrics.py). It defaults to logs/prometheus/, is emptied before the
+master starts, so a previous run's counters aren't summed into this one,
+and a worker's live gauges are dropped when it exits.
+
+SIGUSR2 sent to a worker toggles its memory tracing (see memory.py).
+"""
+import os
+import shutil
+from pathlib import Path
+
+# Must be set before prometheus_client is first imported, here or in a worker
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', str(Path(__file__).resolve().parent / 'logs' / 'prometheus'))
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+
+
+def on_starting(server):
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def post_worker_init(worker):
+    from vibewise_project.memory import install_dump_signal
+
+    install_dump_signal()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
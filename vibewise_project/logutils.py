@@ -0,0 +1,145 @@
+"""
+Logging helpers used by the LOGGING config in settings.py
+
+QueueListenerHandler puts records on an in-memory queue and returns at once;
+a single background QueueListener thread does the slow stdout/file writes.
+RateLimitFilter drops repeats of the same message so a hot loop can't flood
+the logs, and JsonFormatter writes one JSON object per line.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else came from ``extra=``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Enqueue records and write them to ``handlers`` from a listener thread.
+
+    ``handlers`` are references to other configured handlers, e.g.
+    ``['cfg://handlers.file']``. dictConfig sets handlers up in name order,
+    so the referenced handlers must sort before this one.
+    """
+
+    def __init__(self, handlers, maxsize=10000, respect_handler_level=True):
+        super().__init__(queue.Queue(maxsize))
+        # Index access makes dictConfig resolve each cfg:// reference
+        handlers = [handlers[i] for i in range(len(handlers))]
+        for handler in handlers:
+            if not isinstance(handler, logging.Handler):
+                raise ValueError(f'Not a configured handler: {handler!r}')
+        self.dropped = 0
+        self.listener = QueueListener(
+            self.queue, *handlers, respect_handler_level=respect_handler_level
+        )
+        self.listener.start()
+        atexit.register(self.close)
+
+    def prepare(self, record):
+        # QueueHandler.prepare() folds the traceback into the message; keep it
+        # in exc_text so JsonFormatter can write it as a field of its own
+        exc_text = record.exc_text
+        if record.exc_info:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        message = record.getMessage()
+        record = copy.copy(record)
+        record.message = record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+    def enqueue(self, record):
+        # Never block a request thread; count what a full queue throws away
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None:
+            # Writes out everything still queued
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most ``rate`` records per ``per`` seconds for each message.
+
+    Messages are keyed by logger, line and unformatted template, so
+    "Search error: %s" counts as one message whatever the error. The first
+    record let through after suppression reports how many were dropped.
+    Records at ``exempt_level`` or above are never limited.
+
+    Windows that ended more than a period ago are swept once per period,
+    so messages formatted before logging (f-strings) don't pile up; a
+    suppressed count is lost if its message doesn't come back by then.
+    """
+
+    def __init__(self, rate=10, per=60, exempt_level=None):
+        super().__init__()
+        self.rate = rate
+        self.per = per
+        if isinstance(exempt_level, str):
+            exempt_level = logging.getLevelName(exempt_level)
+        self.exempt_level = exempt_level
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._next_sweep = 0
+
+    def filter(self, record):
+        if self.exempt_level is not None and record.levelno >= self.exempt_level:
+            return True
+
+        key = (record.name, record.lineno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            started, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.per:
+                started, count = now, 0
+            if count >= self.rate:
+                self._windows[key] = (started, count, suppressed + 1)
+                return False
+            self._windows[key] = (started, count + 1, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f'{record.msg} [{suppressed} similar messages suppressed]'
+        return True
+
+    def _sweep(self, now):
+        self._windows = {
+            key: window for key, window in self._windows.items() if now - window[0] < 2 * self.per
+        }
+        self._next_sweep = now + self.per
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including fields passed with ``extra=``"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
@@ -0,0 +1,301 @@
+"""
+Memory diagnostics for running workers (staff only, under /admin/memory/)
+
+- GET  /admin/memory/                    RSS, tracemalloc state, GC counts,
+                                         the sizes of our in-process caches
+                                         and pools and, while tracing, the
+                                         top allocation sites
+- POST /admin/memory/tracing/            action=start (frames=N) or stop
+- GET  /admin/memory/snapshots/          snapshots kept in this process
+- POST /admin/memory/snapshots/          take a snapshot
+- GET  /admin/memory/snapshots/<id>/diff/?against=<id>
+                                         growth since snapshot <id>, up to
+                                         the ``against`` snapshot or now
+
+Everything is per process: responses carry the pid, and under gunicorn
+successive requests may reach different workers. To follow one worker,
+signal it instead (gunicorn.conf.py installs the handler)::
+
+    kill -USR2 <pid>    # starts tracing in that worker
+    kill -USR2 <pid>    # writes memory-<pid>-<time>.json and .snapshot
+                        # to MEMORY_DUMPS_DIR, then stops tracing
+
+The .snapshot files load with tracemalloc.Snapshot.load() for offline
+comparison. Listings accept ``top`` (default 25) and ``group_by`` (lineno,
+filename or traceback); ``objects=1`` adds the number of objects the GC
+tracks, which walks the whole heap. tracemalloc sees Python and NumPy
+allocations, not OpenCV's own buffers; compare with RSS.
+"""
+import gc
+import itertools
+import json
+import logging
+import os
+import signal
+import threading
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+
+from api.async_spotify import pool_stats
+from api.idempotency import async_inflight_calls, inflight_calls
+from api.search_cache import search_cache
+from mood_detection.write_behind import buffer_stats
+from vibewise_project.sqlite_backend.base import writer_lock_stats
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+# Allocations made by tracemalloc itself and the import machinery
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+_snapshots = {}
+_snapshot_ids = itertools.count(1)
+_snapshots_lock = threading.Lock()
+
+
+def _rss():
+    figures = {}
+    try:
+        with open('/proc/self/statm') as statm:
+            figures['rss_bytes'] = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        figures['rss_bytes'] = None
+    if resource is not None:
+        # Kilobytes on Linux
+        figures['max_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return figures
+
+
+def _django_cache_stats():
+    cache = caches['default']
+    entries = getattr(cache, '_cache', None)  # LocMemCache
+    return {
+        'backend': type(cache).__name__,
+        'entries': len(entries) if isinstance(entries, dict) else None,
+    }
+
+
+def internal_stats():
+    """Sizes and counters of the caches and pools each worker keeps in memory"""
+    return {
+        'django_cache': _django_cache_stats(),
+        'spotify_search_cache': search_cache.stats(),
+        'spotify_async_pools': pool_stats(),
+        'inflight_calls': inflight_calls.stats(),
+        'async_inflight_calls': async_inflight_calls.stats(),
+        'mood_write_behind': buffer_stats(),
+        'sqlite_writer_locks': writer_lock_stats(),
+    }
+
+
+def take_snapshot():
+    """Keep a tracemalloc snapshot in this process; returns its id"""
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    keep = getattr(settings, 'MEMORY_SNAPSHOTS_KEPT', 5)
+    with _snapshots_lock:
+        snapshot_id = next(_snapshot_ids)
+        _snapshots[snapshot_id] = (datetime.now(timezone.utc), snapshot)
+        for old_id in sorted(_snapshots)[:-keep]:
+            del _snapshots[old_id]
+    return snapshot_id
+
+
+def _get_snapshot(snapshot_id):
+    with _snapshots_lock:
+        entry = _snapshots.get(snapshot_id)
+    if entry is None:
+        raise Http404(f'No snapshot {snapshot_id} in process {os.getpid()}')
+    return entry[1]
+
+
+def _site(stat):
+    frames = [f'{frame.filename}:{frame.lineno}' for frame in stat.traceback]
+    return frames if len(frames) > 1 else frames[0]
+
+
+def _statistic(stat):
+    return {'site': _site(stat), 'size': stat.size, 'count': stat.count}
+
+
+def _statistic_diff(stat):
+    return {
+        'site': _site(stat), 'size': stat.size, 'size_diff': stat.size_diff,
+        'count': stat.count, 'count_diff': stat.count_diff,
+    }
+
+
+def _listing_options(request):
+    group_by = request.GET.get('group_by', 'lineno')
+    if group_by not in GROUP_BY:
+        group_by = 'lineno'
+    try:
+        top = max(1, min(int(request.GET.get('top', 25)), 500))
+    except ValueError:
+        top = 25
+    return group_by, top
+
+
+def _tracing_state():
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'tracing': tracemalloc.is_tracing(),
+        'frames': tracemalloc.get_traceback_limit(),
+        'traced_bytes': current,
+        'traced_peak_bytes': peak,
+        'overhead_bytes': tracemalloc.get_tracemalloc_memory(),
+    }
+
+
+def _report():
+    return {
+        'pid': os.getpid(),
+        **_rss(),
+        'tracemalloc': _tracing_state(),
+        'gc': {'counts': gc.get_count(), 'garbage': len(gc.garbage)},
+        'internal': internal_stats(),
+    }
+
+
+def _stop_tracing():
+    # Snapshots are only comparable within one tracing session
+    tracemalloc.stop()
+    with _snapshots_lock:
+        _snapshots.clear()
+
+
+def dumps_dir():
+    return Path(getattr(settings, 'MEMORY_DUMPS_DIR', Path(settings.LOGS_DIR) / 'memory'))
+
+
+def toggle_dump():
+    """Start tracing, or write this process's report and snapshot to disk and stop"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        logger.info("Process %s started tracing allocations", os.getpid())
+        return None
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    report = _report()
+    report['top_allocations'] = [_statistic(stat) for stat in snapshot.statistics('lineno')[:100]]
+    _stop_tracing()
+
+    directory = dumps_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"memory-{os.getpid()}-{datetime.now():%Y%m%d-%H%M%S}"
+    snapshot.dump(str(path.with_suffix('.snapshot')))
+    path.with_suffix('.json').write_text(json.dumps(report, indent=2, cls=DjangoJSONEncoder))
+    logger.info("Process %s wrote %s.json and .snapshot", os.getpid(), path)
+    return path
+
+
+_dump_requested = threading.Event()
+
+
+def _dump_on_request():
+    while True:
+        _dump_requested.wait()
+        _dump_requested.clear()
+        try:
+            toggle_dump()
+        except Exception:
+            logger.exception("Memory dump of process %s failed", os.getpid())
+
+
+def install_dump_signal(signum=signal.SIGUSR2):
+    """Make ``signum`` toggle tracing and dump to disk; call from the main thread"""
+    # The handler only wakes a thread: locks, I/O and logging are not safe in it
+    threading.Thread(target=_dump_on_request, name='memory-dump', daemon=True).start()
+    return signal.signal(signum, lambda signum, frame: _dump_requested.set())
+
+
+@staff_member_required
+@require_GET
+def memory_report(request):
+    report = _report()
+    if request.GET.get('objects') == '1':
+        report['gc']['tracked_objects'] = len(gc.get_objects())
+    if tracemalloc.is_tracing():
+        group_by, top = _listing_options(request)
+        stats = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS).statistics(group_by)
+        report['top_allocations'] = [_statistic(stat) for stat in stats[:top]]
+    return JsonResponse(report)
+
+
+@staff_member_required
+@require_POST
+def memory_tracing(request):
+    """Start (``frames`` deep tracebacks, default 1) or stop tracemalloc"""
+    action = request.POST.get('action')
+    if action == 'start':
+        if not tracemalloc.is_tracing():
+            try:
+                frames = max(1, min(int(request.POST.get('frames', 1)), 50))
+            except ValueError:
+                frames = 1
+            tracemalloc.start(frames)
+    elif action == 'stop':
+        _stop_tracing()
+    else:
+        return JsonResponse({'error': "action must be 'start' or 'stop'"}, status=400)
+    return JsonResponse({'pid': os.getpid(), 'tracemalloc': _tracing_state()})
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def memory_snapshots(request):
+    if request.method == 'POST':
+        if not tracemalloc.is_tracing():
+            return JsonResponse({'error': 'tracemalloc is not tracing; start it first'}, status=409)
+        take_snapshot()
+
+    with _snapshots_lock:
+        snapshots = [
+            {'id': snapshot_id, 'taken_at': taken_at.isoformat(), 'traces': len(snapshot.traces)}
+            for snapshot_id, (taken_at, snapshot) in sorted(_snapshots.items())
+        ]
+    return JsonResponse({'pid': os.getpid(), 'snapshots': snapshots})
+
+
+@staff_member_required
+@require_GET
+def memory_diff(request, snapshot_id):
+    """Top allocation growth from snapshot ``snapshot_id`` to ``?against=`` (or now)"""
+    before = _get_snapshot(snapshot_id)
+    against = request.GET.get('against')
+    if against:
+        if not against.isdigit():
+            raise Http404('against must be a snapshot id')
+        after = _get_snapshot(int(against))
+    elif tracemalloc.is_tracing():
+        after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    else:
+        return JsonResponse({'error': 'tracemalloc is not tracing; pass against='}, status=409)
+
+    group_by, top = _listing_options(request)
+    stats = after.compare_to(before, group_by)
+    return JsonResponse({
+        'pid': os.getpid(),
+        'from': snapshot_id,
+        'to': int(against) if against else 'now',
+        'size_diff': sum(stat.size_diff for stat in stats),
+        'top_growth': [_statistic_diff(stat) for stat in stats[:top]],
+    })
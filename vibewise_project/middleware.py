@@ -0,0 +1,54 @@
+"""
+Base for project middleware that runs natively under both WSGI and ASGI
+
+Under ASGI Django runs a sync-only middleware in a thread, which stays
+blocked until the rest of the chain and the view have finished: one sync
+middleware is enough to tie up a thread for every async request.
+HybridMiddleware subclasses implement ``__call__`` for WSGI and
+``__acall__`` for ASGI, and start ``__call__`` with::
+
+    if self.is_async:
+        return self.__acall__(request)
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class HybridMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that stays async under ASGI: only requests for static files
+    go through a thread, everything else is awaited directly
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MoodDetectionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mood_detection'
+
+    def ready(self):
+        from . import signals  # noqa: F401
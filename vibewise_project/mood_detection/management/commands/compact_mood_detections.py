@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from mood_detection.retention import compact_detections, count_expired, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = ('Fold mood detections older than the retention horizon into daily aggregates '
+            'and delete them in batches (run periodically, e.g. nightly from cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'MOOD_RETENTION_DAYS', 90),
+            help='Keep this many days of raw detections'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=getattr(settings, 'MOOD_COMPACTION_BATCH_SIZE', 1000),
+            help='Rows deleted per transaction'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Seconds to sleep between batches'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report how many rows would be compacted'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options['days'])
+        self.stdout.write(f"Compacting detections before {cutoff:%Y-%m-%d %H:%M %Z}")
+
+        if options['dry_run']:
+            for label, count in count_expired(cutoff).items():
+                self.stdout.write(f"{label}: {count} rows would be compacted")
+            return
+
+        reclaimed = compact_detections(
+            cutoff, batch_size=options['batch_size'], pause=options['pause']
+        )
+        for label, count in reclaimed.items():
+            self.stdout.write(f"{label}: {count} rows reclaimed")
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Compaction finished, {sum(reclaimed.values())} rows reclaimed')
+        )
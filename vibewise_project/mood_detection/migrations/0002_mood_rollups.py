@@ -0,0 +1,74 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('mood_detection', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('mood', models.CharField(choices=[('happy', 'Happy'), ('sad', 'Sad'), ('angry', 'Angry'), ('neutral', 'Neutral'), ('surprised', 'Surprised'), ('fear', 'Fear'), ('disgust', 'Disgust'), ('excited', 'Excited'), ('confident', 'Confident'), ('motivated', 'Motivated'), ('dancing', 'Dancing'), ('romantic', 'Romantic'), ('peaceful', 'Peaceful'), ('energetic', 'Energetic'), ('melancholic', 'Melancholic'), ('playful', 'Playful')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Daily Mood Rollup',
+                'verbose_name_plural': 'Daily Mood Rollups',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserMoodTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_detections', models.PositiveIntegerField(default=0)),
+                ('playlist_count', models.PositiveIntegerField(default=0)),
+                ('last_detected_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'User Mood Totals',
+                'verbose_name_plural': 'User Mood Totals',
+            },
+        ),
+        migrations.AlterField(
+            model_name='mooddetectionresult',
+            name='image',
+            field=models.ImageField(blank=True, help_text='User image - NOT saved for privacy by default', null=True, upload_to='mood_images/'),
+        ),
+        migrations.AlterField(
+            model_name='mooddetectionresult',
+            name='mood',
+            field=models.CharField(choices=[('happy', 'Happy'), ('sad', 'Sad'), ('angry', 'Angry'), ('neutral', 'Neutral'), ('surprised', 'Surprised'), ('fear', 'Fear'), ('disgust', 'Disgust'), ('excited', 'Excited'), ('confident', 'Confident'), ('motivated', 'Motivated'), ('dancing', 'Dancing'), ('romantic', 'Romantic'), ('peaceful', 'Peaceful'), ('energetic', 'Energetic'), ('melancholic', 'Melancholic'), ('playful', 'Playful')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='mooddetectionresult',
+            index=models.Index(fields=['user', '-detected_at'], name='mood_detect_user_id_5ddf18_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mooddetectionresult',
+            index=models.Index(fields=['mood'], name='mood_detect_mood_53bc46_idx'),
+        ),
+        migrations.AddField(
+            model_name='usermoodtotals',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='mood_totals', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='mooddailyrollup',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mood_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='mooddailyrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'day', 'mood'), name='unique_user_day_mood'),
+        ),
+    ]
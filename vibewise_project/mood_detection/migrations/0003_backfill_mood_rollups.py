@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:06
+
+from django.db import migrations
+from django.db.models import Count, Max
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    MoodDetectionResult = apps.get_model('mood_detection', 'MoodDetectionResult')
+    MoodDailyRollup = apps.get_model('mood_detection', 'MoodDailyRollup')
+    UserMoodTotals = apps.get_model('mood_detection', 'UserMoodTotals')
+    SpotifyPlaylist = apps.get_model('spotify_integration', 'SpotifyPlaylist')
+
+    daily = (
+        MoodDetectionResult.objects
+        .annotate(day=TruncDate('detected_at'))
+        .values('user_id', 'day', 'mood')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    MoodDailyRollup.objects.bulk_create(
+        [MoodDailyRollup(**row) for row in daily.iterator()],
+        batch_size=1000,
+    )
+
+    totals = {}
+    for row in (MoodDetectionResult.objects.values('user_id')
+                .annotate(total=Count('id'), last=Max('detected_at')).order_by()):
+        totals[row['user_id']] = UserMoodTotals(
+            user_id=row['user_id'],
+            total_detections=row['total'],
+            last_detected_at=row['last'],
+        )
+    for row in SpotifyPlaylist.objects.values('user_id').annotate(total=Count('id')).order_by():
+        totals.setdefault(row['user_id'], UserMoodTotals(user_id=row['user_id']))
+        totals[row['user_id']].playlist_count = row['total']
+    UserMoodTotals.objects.bulk_create(totals.values(), batch_size=1000)
+
+
+def clear_rollups(apps, schema_editor):
+    apps.get_model('mood_detection', 'MoodDailyRollup').objects.all().delete()
+    apps.get_model('mood_detection', 'UserMoodTotals').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mood_detection', '0002_mood_rollups'),
+        ('spotify_integration', '0003_spotifyplaylisttrack'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, clear_rollups),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:20
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+def populate_uuids(apps, schema_editor):
+    MoodDetectionResult = apps.get_model('mood_detection', 'MoodDetectionResult')
+    pending = MoodDetectionResult.objects.filter(uuid__isnull=True).only('pk')
+    batch = []
+    for detection in pending.iterator(chunk_size=1000):
+        detection.uuid = uuid.uuid4()
+        batch.append(detection)
+        if len(batch) >= 1000:
+            MoodDetectionResult.objects.bulk_update(batch, ['uuid'])
+            batch = []
+    if batch:
+        MoodDetectionResult.objects.bulk_update(batch, ['uuid'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mood_detection', '0003_backfill_mood_rollups'),
+    ]
+
+    operations = [
+        # Nullable first so existing rows don't all get the same default
+        migrations.AddField(
+            model_name='mooddetectionresult',
+            name='uuid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_uuids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='mooddetectionresult',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='mooddetectionresult',
+            name='detected_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
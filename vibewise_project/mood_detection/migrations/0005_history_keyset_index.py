@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mood_detection', '0004_detection_uuid'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='mooddetectionresult',
+            name='mood_detect_user_id_5ddf18_idx',
+        ),
+        migrations.AddIndex(
+            model_name='mooddetectionresult',
+            index=models.Index(fields=['user', '-detected_at', '-id'], name='mood_detect_user_id_f4e5ba_idx'),
+        ),
+    ]
@@ -2,9 +2,14 @@
 Mood Detection Models - Privacy-Focused
 Images are optional and NOT required for privacy
 """
-from django.db import models
+import logging
+import uuid
+from django.db import models, transaction
+from django.utils import timezone
 from accounts.models import User
 
+logger = logging.getLogger(__name__)
+
 class MoodDetectionResult(models.Model):
     """Store mood detection results WITHOUT images for privacy"""
     
@@ -40,14 +45,19 @@ class MoodDetectionResult(models.Model):
         help_text='User image - NOT saved for privacy by default'
     )
     
-    detected_at = models.DateTimeField(auto_now_add=True)
+    # Stable public id, known before the row is written (see write_behind)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    
+    # Not auto_now_add: buffered detections keep the time they were made
+    detected_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-detected_at']
         verbose_name = 'Mood Detection Result'
         verbose_name_plural = 'Mood Detection Results'
         indexes = [
-            models.Index(fields=['user', '-detected_at']),
+            # Keyset pagination of a user's history (api.pagination)
+            models.Index(fields=['user', '-detected_at', '-id']),
             models.Index(fields=['mood']),
         ]
     
@@ -55,9 +65,54 @@ class MoodDetectionResult(models.Model):
         return f"{self.user.email} - {self.mood} ({self.confidence:.2f}) at {self.detected_at}"
     
     def save(self, *args, **kwargs):
-        """Override save to log privacy-protected saves"""
+        """Override save to log privacy-protected saves and keep rollups current"""
+        from .rollups import record_detections
+        
         if self.image:
-            print(f"⚠️ Saving mood result WITH image for {self.user.email}")
+            logger.info("⚠️ Saving mood result WITH image for user %s", self.user_id)
         else:
-            print(f"✅ Saving mood result WITHOUT image for {self.user.email} (privacy-protected)")
-        super().save(*args, **kwargs)
\ No newline at end of file
+            logger.debug("✅ Saving mood result WITHOUT image for user %s (privacy-protected)", self.user_id)
+        
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        
+        # New detections update the rollups in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            record_detections([self])
+
+
+class MoodDailyRollup(models.Model):
+    """Number of detections per user, day and mood"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mood_rollups')
+    day = models.DateField()
+    mood = models.CharField(max_length=20, choices=MoodDetectionResult.MOOD_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Daily Mood Rollup'
+        verbose_name_plural = 'Daily Mood Rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'mood'], name='unique_user_day_mood'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.day} {self.mood}: {self.count}"
+
+
+class UserMoodTotals(models.Model):
+    """Running per-user totals shown on the dashboard"""
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='mood_totals')
+    total_detections = models.PositiveIntegerField(default=0)
+    playlist_count = models.PositiveIntegerField(default=0)
+    last_detected_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        verbose_name = 'User Mood Totals'
+        verbose_name_plural = 'User Mood Totals'
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.total_detections} detections, {self.playlist_count} playlists"
\ No newline at end of file
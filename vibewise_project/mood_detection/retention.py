@@ -0,0 +1,137 @@
+"""
+Retention and compaction of raw mood detections
+
+Detections older than MOOD_RETENTION_DAYS are folded into daily aggregates
+and deleted, BATCH_SIZE rows per transaction, so the job can run while the
+site is live and simply resumes if it is interrupted.
+
+- mood_detection.MoodDetectionResult rows are already counted in
+  MoodDailyRollup when they are inserted (see rollups), so they are only
+  deleted.
+- spotify_integration.MoodDetectionResult rows are added to
+  MoodDetectionDailyAggregate in the same transaction that deletes them.
+
+The cutoff is the start of a local day, so each day is either entirely raw
+or entirely aggregated and readers can switch source at a day boundary.
+
+Batches go through QuerySet.delete(), so delete signals and cascades run,
+with the rollups kept (the rows stay counted there) and compacting() set:
+per-row receivers can leave their work to ``detections_compacted``, sent
+once per committed batch with the ids of the users whose rows went.
+"""
+import contextvars
+import functools
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from spotify_integration.models import (
+    MoodDetectionDailyAggregate, MoodDetectionResult as SpotifyMoodDetectionResult
+)
+from .models import MoodDetectionResult
+from .rollups import _increment, rollups_kept
+
+logger = logging.getLogger(__name__)
+
+# Sent after each committed batch with the model and the affected user ids
+detections_compacted = Signal()
+
+_compacting = contextvars.ContextVar('compacting', default=False)
+
+
+def compacting():
+    """True while compaction is deleting rows"""
+    return _compacting.get()
+
+
+def retention_cutoff(days=None, now=None):
+    """Start of the oldest local day that is kept raw"""
+    if days is None:
+        days = getattr(settings, 'MOOD_RETENTION_DAYS', 90)
+    start = timezone.localtime(now) - timedelta(days=days)
+    return start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _fold_spotify_detections(rows):
+    totals = defaultdict(lambda: [0, 0.0])
+    for row in rows:
+        key = (row['user_id'], timezone.localdate(row['detected_at']), row['mood'])
+        totals[key][0] += 1
+        totals[key][1] += row['confidence']
+
+    for (user_id, day, mood), (count, confidence_sum) in totals.items():
+        _increment(
+            MoodDetectionDailyAggregate,
+            {'user_id': user_id, 'day': day, 'mood': mood},
+            {'count': F('count') + count, 'confidence_sum': F('confidence_sum') + confidence_sum},
+            {'count': count, 'confidence_sum': confidence_sum},
+        )
+
+
+# Model -> function that records rows in the aggregates before they're deleted
+COMPACTED_MODELS = (
+    (MoodDetectionResult, None),
+    (SpotifyMoodDetectionResult, _fold_spotify_detections),
+)
+
+
+def _compact_model(model, fold, cutoff, batch_size, pause):
+    expired = model.objects.filter(detected_at__lt=cutoff).order_by('pk')
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                expired.values('pk', 'user_id', 'mood', 'confidence', 'detected_at')[:batch_size]
+            )
+            if not rows:
+                break
+            if fold is not None:
+                fold(rows)
+            token = _compacting.set(True)
+            try:
+                with rollups_kept():
+                    model.objects.filter(pk__in=[row['pk'] for row in rows]).delete()
+            finally:
+                _compacting.reset(token)
+            # Bound now: under an outer atomic() every batch's callback runs at the end
+            transaction.on_commit(functools.partial(
+                detections_compacted.send, sender=model, user_ids={row['user_id'] for row in rows}
+            ))
+
+        deleted += len(rows)
+        logger.debug("Compacted %s %s rows (%s so far)", len(rows), model._meta.label, deleted)
+        if len(rows) < batch_size:
+            break
+        if pause:
+            # Let replicas and other writers catch up between batches
+            time.sleep(pause)
+    return deleted
+
+
+def count_expired(cutoff):
+    return {
+        model._meta.label: model.objects.filter(detected_at__lt=cutoff).count()
+        for model, fold in COMPACTED_MODELS
+    }
+
+
+def compact_detections(cutoff=None, batch_size=None, pause=0):
+    """Fold and delete detections older than ``cutoff``; returns rows deleted per model"""
+    if cutoff is None:
+        cutoff = retention_cutoff()
+    if batch_size is None:
+        batch_size = getattr(settings, 'MOOD_COMPACTION_BATCH_SIZE', 1000)
+
+    reclaimed = {}
+    for model, fold in COMPACTED_MODELS:
+        reclaimed[model._meta.label] = _compact_model(model, fold, cutoff, batch_size, pause)
+
+    logger.info("Compacted mood detections older than %s: %s", cutoff.isoformat(), reclaimed)
+    return reclaimed
@@ -0,0 +1,199 @@
+"""
+Incrementally maintained mood rollups
+
+MoodDailyRollup and UserMoodTotals are updated in the same transaction as
+each detection insert, so the dashboard reads O(days) rows instead of
+scanning a user's whole detection history. Deleting a detection takes it
+back out (signals.detection_deleted), except while rollups_kept() is
+active: retention deletes rows whose counts must stay. Editing a stored
+detection's mood or time is not tracked; run rebuild_rollups afterwards.
+"""
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from spotify_integration.models import SpotifyPlaylist
+from .models import MoodDailyRollup, MoodDetectionResult, UserMoodTotals
+
+
+def _increment(model, lookup, updates, create_values):
+    """UPDATE ... SET col = col + n, creating the row on first use"""
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **create_values)
+    except IntegrityError:
+        # Created concurrently by another transaction
+        model.objects.filter(**lookup).update(**updates)
+
+
+def record_detections(detections):
+    """Fold newly inserted detections into the rollups (call inside the insert transaction)"""
+    daily = Counter()
+    totals = Counter()
+    latest = {}
+
+    for detection in detections:
+        day = timezone.localdate(detection.detected_at)
+        daily[(detection.user_id, day, detection.mood)] += 1
+        totals[detection.user_id] += 1
+        if detection.user_id not in latest or detection.detected_at > latest[detection.user_id]:
+            latest[detection.user_id] = detection.detected_at
+
+    with transaction.atomic():
+        for (user_id, day, mood), count in daily.items():
+            _increment(
+                MoodDailyRollup,
+                {'user_id': user_id, 'day': day, 'mood': mood},
+                {'count': F('count') + count},
+                {'count': count},
+            )
+
+        for user_id, count in totals.items():
+            _increment(
+                UserMoodTotals,
+                {'user_id': user_id},
+                {
+                    'total_detections': F('total_detections') + count,
+                    'last_detected_at': latest[user_id],
+                },
+                {'total_detections': count, 'last_detected_at': latest[user_id]},
+            )
+
+
+_keep_rollups = contextvars.ContextVar('keep_rollups', default=False)
+
+
+@contextmanager
+def rollups_kept():
+    """Delete detections without taking them out of the rollups"""
+    token = _keep_rollups.set(True)
+    try:
+        yield
+    finally:
+        _keep_rollups.reset(token)
+
+
+def forget_detection(detection):
+    """Take a deleted detection back out of the rollups"""
+    if _keep_rollups.get():
+        return
+    MoodDailyRollup.objects.filter(
+        user_id=detection.user_id, day=timezone.localdate(detection.detected_at), mood=detection.mood
+    ).update(count=Greatest(F('count') - 1, 0))
+    # last_detected_at is left as is
+    UserMoodTotals.objects.filter(user_id=detection.user_id).update(
+        total_detections=Greatest(F('total_detections') - 1, 0)
+    )
+
+
+def record_playlist_change(user_id, delta):
+    """Adjust the running playlist count by +1/-1"""
+    if delta > 0:
+        _increment(
+            UserMoodTotals,
+            {'user_id': user_id},
+            {'playlist_count': F('playlist_count') + delta},
+            {'playlist_count': delta},
+        )
+    else:
+        UserMoodTotals.objects.filter(user_id=user_id).update(
+            playlist_count=Greatest(F('playlist_count') + delta, 0)
+        )
+
+
+def dashboard_stats(user, since):
+    """Mood counts since ``since`` (a date) and the running totals"""
+    mood_stats = (
+        MoodDailyRollup.objects
+        .filter(user=user, day__gte=since)
+        .values('mood')
+        .annotate(count=Sum('count'))
+        .order_by()
+    )
+    totals = UserMoodTotals.objects.filter(user=user).first()
+
+    return {
+        'mood_stats': list(mood_stats),
+        'total_detections': totals.total_detections if totals else 0,
+        'playlist_count': totals.playlist_count if totals else 0,
+    }
+
+
+def archived_rollups(user):
+    """Rollups for days whose raw detections have all been compacted away"""
+    oldest = (
+        MoodDetectionResult.objects.filter(user=user)
+        .order_by('detected_at').values_list('detected_at', flat=True).first()
+    )
+    rollups = MoodDailyRollup.objects.filter(user=user)
+    if oldest is not None:
+        rollups = rollups.filter(day__lt=timezone.localdate(oldest))
+    return rollups
+
+
+def rebuild_rollups(user_ids):
+    """
+    Recompute rollups for the given users from the raw detections.
+    
+    Days older than a user's oldest raw detection have been compacted (see
+    retention) and only exist as rollups, so those are kept.
+    """
+    user_ids = list(user_ids)
+    detections = MoodDetectionResult.objects.filter(user_id__in=user_ids)
+
+    raw = {
+        row['user_id']: row
+        for row in detections.values('user_id').annotate(first=Min('detected_at'), last=Max('detected_at')).order_by()
+    }
+    daily = (
+        detections
+        .annotate(day=TruncDate('detected_at'))
+        .values('user_id', 'day', 'mood')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    playlists = dict(
+        SpotifyPlaylist.objects.filter(user_id__in=user_ids)
+        .values('user_id').annotate(total=Count('id')).order_by()
+        .values_list('user_id', 'total')
+    )
+
+    with transaction.atomic():
+        if raw:
+            rebuilt_days = Q()
+            for user_id, row in raw.items():
+                rebuilt_days |= Q(user_id=user_id, day__gte=timezone.localdate(row['first']))
+            MoodDailyRollup.objects.filter(rebuilt_days).delete()
+        MoodDailyRollup.objects.bulk_create(
+            [MoodDailyRollup(**row) for row in daily.iterator()],
+            batch_size=1000,
+        )
+
+        totals = dict(
+            MoodDailyRollup.objects.filter(user_id__in=user_ids)
+            .values('user_id').annotate(total=Sum('count')).order_by()
+            .values_list('user_id', 'total')
+        )
+        previous_last = dict(
+            UserMoodTotals.objects.filter(user_id__in=user_ids).values_list('user_id', 'last_detected_at')
+        )
+        UserMoodTotals.objects.filter(user_id__in=user_ids).delete()
+        UserMoodTotals.objects.bulk_create(
+            [
+                UserMoodTotals(
+                    user_id=user_id,
+                    total_detections=totals.get(user_id, 0),
+                    playlist_count=playlists.get(user_id, 0),
+                    last_detected_at=raw[user_id]['last'] if user_id in raw else previous_last.get(user_id),
+                )
+                for user_id in set(totals) | set(playlists) | set(previous_last)
+            ],
+            batch_size=1000,
+        )
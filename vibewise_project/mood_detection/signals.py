@@ -0,0 +1,25 @@
+"""
+Keep the rollups and the per-user playlist count in UserMoodTotals current
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from spotify_integration.models import SpotifyPlaylist
+from .models import MoodDetectionResult
+from .rollups import forget_detection, record_playlist_change
+
+
+@receiver(post_delete, sender=MoodDetectionResult)
+def detection_deleted(sender, instance, **kwargs):
+    forget_detection(instance)
+
+
+@receiver(post_save, sender=SpotifyPlaylist)
+def playlist_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_playlist_change(instance.user_id, 1)
+
+
+@receiver(post_delete, sender=SpotifyPlaylist)
+def playlist_deleted(sender, instance, **kwargs):
+    record_playlist_change(instance.user_id, -1)
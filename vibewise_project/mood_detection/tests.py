@@ -1,3 +1,180 @@
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import User
+from spotify_integration.models import (
+    MoodDetectionDailyAggregate, MoodDetectionResult as SpotifyMoodDetectionResult
+)
+from mood_detection.models import MoodDailyRollup, MoodDetectionResult, UserMoodTotals
+from mood_detection.retention import compact_detections, detections_compacted, retention_cutoff
+from mood_detection.rollups import archived_rollups, rebuild_rollups, rollups_kept
+from mood_detection.write_behind import DetectionBuffer, _insert, save_detection
+
+
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='r@example.com', email='r@example.com')
+        now = timezone.now()
+        self.cutoff = retention_cutoff(30, now)
+        for days_ago, mood in [(60, 'happy'), (60, 'sad'), (45, 'happy'), (1, 'calm')]:
+            detected_at = now - timedelta(days=days_ago)
+            MoodDetectionResult.objects.create(user=self.user, mood=mood, confidence=0.9, detected_at=detected_at)
+            SpotifyMoodDetectionResult.objects.filter(
+                pk=SpotifyMoodDetectionResult.objects.create(user=self.user, mood=mood, confidence=0.5).pk
+            ).update(detected_at=detected_at)
+        rebuild_rollups([self.user.pk])
+
+    def test_compaction_deletes_expired_rows_only(self):
+        reclaimed = compact_detections(self.cutoff, batch_size=2)
+
+        self.assertEqual(reclaimed, {
+            'mood_detection.MoodDetectionResult': 3,
+            'spotify_integration.MoodDetectionResult': 3,
+        })
+        self.assertEqual(MoodDetectionResult.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(SpotifyMoodDetectionResult.objects.filter(user=self.user).count(), 1)
+
+    def test_compacted_detections_are_aggregated(self):
+        compact_detections(self.cutoff)
+
+        aggregates = MoodDetectionDailyAggregate.objects.filter(user=self.user)
+        self.assertEqual(sum(a.count for a in aggregates), 3)
+        self.assertAlmostEqual(sum(a.confidence_sum for a in aggregates), 1.5)
+
+    def test_rebuild_keeps_compacted_days(self):
+        compact_detections(self.cutoff)
+        rebuild_rollups([self.user.pk])
+
+        self.assertEqual(UserMoodTotals.objects.get(user=self.user).total_detections, 4)
+        self.assertEqual(MoodDailyRollup.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(archived_rollups(self.user).count(), 3)
+
+    def test_each_batch_invalidates_its_users_once(self):
+        with mock.patch('api.signals.invalidate_user') as invalidate_user, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            compact_detections(self.cutoff, batch_size=2)
+
+        # Two batches per model, one callback each instead of one per row
+        self.assertEqual(len(callbacks), 4)
+        self.assertEqual(invalidate_user.call_args_list, [mock.call(self.user.pk)] * 4)
+
+    def test_batches_signal_their_own_users_inside_an_outer_transaction(self):
+        other = User.objects.create_user(username='o@example.com', email='o@example.com')
+        for _ in range(2):
+            MoodDetectionResult.objects.create(
+                user=other, mood='sad', confidence=0.5, detected_at=self.cutoff - timedelta(days=1)
+            )
+        compacted = []
+        receiver = lambda sender, user_ids, **kwargs: compacted.append((sender, user_ids))
+        detections_compacted.connect(receiver)
+        self.addCleanup(detections_compacted.disconnect, receiver)
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            compact_detections(self.cutoff, batch_size=3)
+
+        self.assertEqual(compacted[:2], [
+            (MoodDetectionResult, {self.user.pk}), (MoodDetectionResult, {other.pk}),
+        ])
+        self.assertEqual(compacted[2], (SpotifyMoodDetectionResult, {self.user.pk}))
+        # Compacted rows stay counted in the rollups
+        self.assertEqual(UserMoodTotals.objects.get(user=self.user).total_detections, 4)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('compact_mood_detections', days=30, stdout=out)
+        self.assertIn('6 rows reclaimed', out.getvalue())
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='d@example.com', email='d@example.com')
+        self.detections = [
+            MoodDetectionResult.objects.create(user=self.user, mood='happy', confidence=0.9) for _ in range(2)
+        ]
+
+    def test_deleted_detections_leave_the_rollups(self):
+        self.detections[0].delete()
+        self.assertEqual(MoodDailyRollup.objects.get(user=self.user, mood='happy').count, 1)
+        self.assertEqual(UserMoodTotals.objects.get(user=self.user).total_detections, 1)
+
+        MoodDetectionResult.objects.filter(user=self.user).delete()
+        self.assertEqual(MoodDailyRollup.objects.get(user=self.user, mood='happy').count, 0)
+        self.assertEqual(UserMoodTotals.objects.get(user=self.user).total_detections, 0)
+
+    def test_rollups_kept_while_compacting(self):
+        with rollups_kept():
+            self.detections[0].delete()
+        self.assertEqual(UserMoodTotals.objects.get(user=self.user).total_detections, 2)
+
+
+@mock.patch.object(DetectionBuffer, '_ensure_started')
+class WriteBehindTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='w@example.com', email='w@example.com')
+        cls.other = User.objects.create_user(username='o@example.com', email='o@example.com')
+
+    def detection(self, user=None, **fields):
+        return MoodDetectionResult(user=user or self.user, mood=fields.pop('mood', 'happy'),
+                                   confidence=fields.pop('confidence', 0.9), **fields)
+
+    def test_failed_batch_is_written_row_by_row_and_bad_rows_dropped(self, ensure_started):
+        buffer = DetectionBuffer(batch_size=10, flush_interval=60, max_retries=2)
+        bad = self.detection(confidence=None)  # NOT NULL
+        for detection in (self.detection(), bad, self.detection()):
+            buffer.add(detection)
+
+        with self.assertLogs('mood_detection.write_behind', 'ERROR'):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.stats()['pending'], 1)
+
+        with self.assertLogs('mood_detection.write_behind', 'ERROR') as logs:
+            self.assertEqual(buffer.flush(), 0)
+        self.assertIn(f'Dropping mood detection {bad.uuid}', logs.output[-1])
+        self.assertEqual(buffer.stats()['pending'], 0)
+        self.assertEqual(buffer.stats()['dropped'], 1)
+        self.assertEqual(MoodDetectionResult.objects.filter(user=self.user).count(), 2)
+
+    def test_full_buffer_saves_directly(self, ensure_started):
+        buffer = DetectionBuffer(batch_size=10, flush_interval=60, max_pending=1)
+        self.assertTrue(buffer.add(self.detection()))
+        with self.settings(MOOD_WRITE_BEHIND={'ENABLED': True}), \
+                mock.patch('mood_detection.write_behind.get_buffer', return_value=buffer):
+            detection = save_detection(self.user, 'sad', 0.8)
+        self.assertIsNotNone(detection.pk)
+        self.assertEqual(buffer.stats()['pending'], 1)
+
+    def test_buffered_duplicate_ids(self, ensure_started):
+        taken = MoodDetectionResult.objects.create(user=self.other, mood='sad', confidence=0.5).uuid
+        buffer = DetectionBuffer(batch_size=10, flush_interval=60)
+        with self.settings(MOOD_WRITE_BEHIND={'ENABLED': True}), \
+                mock.patch('mood_detection.write_behind.get_buffer', return_value=buffer):
+            mine = save_detection(self.user, 'happy', 0.9, detection_uuid=taken)
+            shared = uuid.uuid4()
+            first = save_detection(self.user, 'happy', 0.9, detection_uuid=shared)
+            # Queued by another user before the first was flushed
+            clash = save_detection(self.other, 'calm', 0.7, detection_uuid=shared)
+        self.assertNotEqual(mine.uuid, taken)
+
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(MoodDetectionResult.objects.get(uuid=shared).user, self.user)
+        self.assertEqual(MoodDetectionResult.objects.get(uuid=clash.uuid).user, self.other)
+        self.assertNotEqual(clash.uuid, first.uuid)
+
+    def test_concurrent_insert_of_the_same_id(self, ensure_started):
+        existing = MoodDetectionResult.objects.create(user=self.user, mood='sad', confidence=0.5)
 
-# Create your tests here.
+        self.assertEqual(_insert(self.detection(uuid=existing.uuid)), existing)
+        theirs = _insert(self.detection(user=self.other, uuid=existing.uuid))
+        self.assertNotEqual(theirs.uuid, existing.uuid)
+        self.assertEqual(MoodDetectionResult.objects.get(uuid=theirs.uuid).user, self.other)
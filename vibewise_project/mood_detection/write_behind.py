@@ -0,0 +1,273 @@
+"""
+Write-behind buffering of mood detection inserts
+
+With MOOD_WRITE_BEHIND['ENABLED'] the detect endpoint queues detections here
+instead of inserting them one by one. A background thread writes them with a
+single bulk_create every BATCH_SIZE rows or FLUSH_INTERVAL_MS milliseconds,
+whichever comes first, and anything still queued is flushed at interpreter
+exit. Each detection carries its UUID from the start, so the API can hand it
+out before the row exists.
+
+A batch that fails is written row by row, so one bad row doesn't hold back
+the others; rows that still fail are retried by later flushes up to
+MAX_RETRIES times, then dropped and logged. Once MAX_PENDING detections are
+queued (the database is down or can't keep up), new ones are saved directly
+by the request instead.
+
+bulk_create skips save() and post_save, so the flush updates the rollups
+itself and sends ``detections_flushed`` for cache invalidation.
+"""
+import atexit
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.dispatch import Signal
+
+from .models import MoodDetectionResult
+from .rollups import record_detections
+
+logger = logging.getLogger(__name__)
+
+# Sent after each committed flush with the list of written detections
+detections_flushed = Signal()
+
+DEFAULTS = {
+    'ENABLED': False,
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL_MS': 500,
+    'MAX_RETRIES': 3,
+    'MAX_PENDING': 10000,
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'MOOD_WRITE_BEHIND', {})}
+
+
+def is_enabled():
+    return bool(_config()['ENABLED'])
+
+
+class DetectionBuffer:
+    """Thread-safe queue of unsaved MoodDetectionResult instances"""
+
+    def __init__(self, batch_size, flush_interval, max_retries=3, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self._pending = []
+        # uuid -> failed writes, for rows waiting to be retried
+        self._attempts = {}
+        self._lock = threading.Lock()
+        # Serialises flushes so rows are written in the order they were queued
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._flushed = 0
+        self._batches = 0
+        self._failures = 0
+        self._dropped = 0
+
+    def add(self, detection):
+        """Queue a detection; it is written by the next flush. False when the buffer is full"""
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                return False
+            self._pending.append(detection)
+            full = len(self._pending) >= self.batch_size
+        self._ensure_started()
+        if full:
+            self._wakeup.set()
+        return True
+
+    def flush(self):
+        """Write everything queued so far; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                written = self._write(batch)
+            except Exception:
+                logger.exception("Failed to flush %s buffered mood detections, writing them one by one", len(batch))
+                with self._lock:
+                    self._failures += 1
+                written = self._write_rows(batch)
+            self._flushed += len(written)
+            self._batches += 1
+            return len(written)
+
+    def _write_rows(self, batch):
+        """Write rows one at a time; failed rows are requeued until MAX_RETRIES"""
+        written, retry = [], []
+        for detection in batch:
+            try:
+                written.extend(self._write([detection]))
+                self._attempts.pop(detection.uuid, None)
+                continue
+            except Exception:
+                attempts = self._attempts.get(detection.uuid, 0) + 1
+            if attempts < self.max_retries:
+                self._attempts[detection.uuid] = attempts
+                retry.append(detection)
+            else:
+                self._attempts.pop(detection.uuid, None)
+                self._dropped += 1
+                logger.error(
+                    "Dropping mood detection %s for user %s after %s failed writes",
+                    detection.uuid, detection.user_id, attempts, exc_info=True,
+                    extra={'detection_uuid': str(detection.uuid), 'user_id': detection.user_id},
+                )
+        if retry:
+            # In front, so the next flush keeps the original order
+            with self._lock:
+                self._pending[:0] = retry
+        return written
+
+    def _write(self, batch):
+        # Skip rows a retried flush already wrote and repeats of a client id
+        existing = dict(
+            MoodDetectionResult.objects
+            .filter(uuid__in=[detection.uuid for detection in batch])
+            .values_list('uuid', 'user_id')
+        )
+        new = {}
+        for detection in batch:
+            owner = existing.get(detection.uuid, new.get(detection.uuid, detection).user_id)
+            if owner != detection.user_id:
+                # Another user's id: store the detection under a fresh one
+                logger.warning("Detection id %s belongs to another user, storing a new id", detection.uuid)
+                detection.uuid = uuid.uuid4()
+            elif detection.uuid in existing:
+                continue
+            new.setdefault(detection.uuid, detection)
+        new = list(new.values())
+        if not new:
+            return []
+
+        with transaction.atomic():
+            MoodDetectionResult.objects.bulk_create(new, batch_size=self.batch_size)
+            record_detections(new)
+            transaction.on_commit(
+                lambda: detections_flushed.send(sender=MoodDetectionResult, detections=new)
+            )
+        logger.debug("Flushed %s mood detections", len(new))
+        return new
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='mood-write-behind', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            # The thread keeps its own connection; drop it if it went stale
+            close_old_connections()
+
+    def stop(self):
+        """Stop the flusher thread and write whatever is still queued"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'flushed': self._flushed,
+            'batches': self._batches,
+            'failures': self._failures,
+            'dropped': self._dropped,
+            'batch_size': self.batch_size,
+            'flush_interval_ms': int(self.flush_interval * 1000),
+        }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                config = _config()
+                _buffer = DetectionBuffer(
+                    batch_size=config['BATCH_SIZE'],
+                    flush_interval=config['FLUSH_INTERVAL_MS'] / 1000,
+                    max_retries=config['MAX_RETRIES'],
+                    max_pending=config['MAX_PENDING'],
+                )
+                atexit.register(_buffer.stop)
+    return _buffer
+
+
+def buffer_stats():
+    """The buffer's stats, or None when it hasn't been started in this process"""
+    return _buffer.stats() if _buffer is not None else None
+
+
+def save_detection(user, mood, confidence, detection_uuid=None):
+    """
+    Record a detection, buffered when write-behind is enabled.
+
+    Returns the MoodDetectionResult; its ``pk`` is None until flushed. A
+    client-supplied ``detection_uuid`` makes retries of the same detection
+    harmless in either mode: a detection already stored under it is
+    returned, and another user's id is replaced with a fresh one.
+    """
+    if detection_uuid is not None:
+        existing = MoodDetectionResult.objects.filter(uuid=detection_uuid).first()
+        if existing is not None:
+            if existing.user_id == user.pk:
+                return existing
+            # Someone else's id: don't replay it, just use a fresh one
+            detection_uuid = None
+
+    detection = MoodDetectionResult(user=user, mood=mood, confidence=confidence)
+    if detection_uuid is not None:
+        detection.uuid = detection_uuid
+
+    if is_enabled() and get_buffer().add(detection):
+        return detection
+    if detection_uuid is None:
+        detection.save()
+        return detection
+    return _insert(detection)
+
+
+def _insert(detection):
+    """Save ``detection`` under a client id, settling a concurrent insert of the same id"""
+    try:
+        with transaction.atomic():
+            detection.save()
+        return detection
+    except IntegrityError:
+        existing = MoodDetectionResult.objects.filter(uuid=detection.uuid).first()
+        if existing is None:
+            raise
+    if existing.user_id == detection.user_id:
+        return existing
+    detection.uuid = uuid.uuid4()
+    detection.save()
+    return detection
@@ -0,0 +1,234 @@
+"""
+Opt-in request profiling from live traffic (settings.PROFILING)
+
+ProfilingMiddleware samples the stack of the thread serving a request every
+INTERVAL_MS. The call tree is written to PROFILES_DIR (under LOGS_DIR) in
+collapsed-stack format, one ``frame;frame;frame count`` line per distinct
+stack, which speedscope and flamegraph.pl open directly. It does this for:
+
+- a SAMPLE_RATE fraction of requests;
+- every request slower than SLOW_MS, when set. All requests are then
+  sampled and only slow ones are kept, so pick a coarse INTERVAL_MS.
+
+Unlike cProfile this adds no per-call overhead, so it is cheap enough to
+leave on; work handed to other threads (executor pools, async_to_sync
+loops) shows up as the request thread waiting on it. File names carry the
+time, route and duration, and staff can list and download them from
+/admin/profiles/. Only the newest MAX_FILES profiles are kept.
+
+Profiles are written, and old ones pruned, by a background thread, so the
+disk never delays a response and a write error is only logged. Profiles
+that arrive while MAX_PENDING are already waiting are dropped.
+
+Requests served on an event loop (async views under ASGI) are not
+profiled: the loop's thread interleaves them, so its samples can't be
+attributed to one request.
+"""
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, Http404, JsonResponse
+from django.urls import reverse
+
+from vibewise_project.middleware import HybridMiddleware
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FILENAME = re.compile(r'^(?P<time>\d{8}-\d{6})-(?P<route>[\w.-]+?)-(?P<ms>\d+)ms-[0-9a-f]{6}\.folded$')
+
+
+def _config():
+    return getattr(settings, 'PROFILING', {})
+
+
+def profiles_dir():
+    return Path(getattr(settings, 'PROFILES_DIR', Path(settings.LOGS_DIR) / 'profiles'))
+
+
+class StackSampler:
+    """One daemon thread per process that samples the stacks of registered threads"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id, root_code):
+        with self._lock:
+            self._stacks[thread_id] = (root_code, Counter())
+            self._active.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        """The stacks collected for ``thread_id``, as {stack: samples}"""
+        with self._lock:
+            root_code, stacks = self._stacks.pop(thread_id)
+            if not self._stacks:
+                self._active.clear()
+        return stacks
+
+    def _run(self):
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                frames = sys._current_frames()
+                for thread_id, (root_code, stacks) in self._stacks.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_stack(frame, root_code)] += 1
+
+
+def _stack(frame, root_code):
+    # Leaf to root, stopping at the middleware so server frames are left out
+    names = []
+    while frame is not None and frame.f_code is not root_code:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def write_profile(stacks, route, seconds):
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    route = re.sub(r'[^\w.-]', '_', route)
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{route}-{round(seconds * 1000)}ms-{uuid.uuid4().hex[:6]}.folded"
+    path = directory / name
+    path.write_text(''.join(f'{stack} {count}\n' for stack, count in stacks.most_common()))
+    _prune(directory, _config().get('MAX_FILES', 200))
+    return path
+
+
+def _prune(directory, keep):
+    profiles = sorted(
+        (path for path in directory.iterdir() if PROFILE_FILENAME.match(path.name)),
+        key=lambda path: path.stat().st_mtime_ns, reverse=True
+    )
+    for path in profiles[keep:]:
+        path.unlink(missing_ok=True)
+
+
+class ProfileWriter:
+    """Daemon thread that writes profiles handed over by request threads"""
+
+    def __init__(self, max_pending=100):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def put(self, stacks, route, seconds):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profile-writer', daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((stacks, route, seconds))
+        except queue.Full:
+            logger.warning("Dropped the profile of a %s request, %s are waiting to be written",
+                           route, self._queue.maxsize)
+
+    def wait(self):
+        """Block until every queued profile has been handled"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            stacks, route, seconds = self._queue.get()
+            try:
+                write_profile(stacks, route, seconds)
+            except OSError:
+                logger.exception("Could not write the profile of a %s request", route)
+            finally:
+                self._queue.task_done()
+
+
+profile_writer = ProfileWriter(_config().get('MAX_PENDING', 100))
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """Profiles sampled and slow requests; place it right after MetricsMiddleware"""
+
+    def __init__(self, get_response):
+        config = _config()
+        if not config.get('ENABLED'):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.sample_rate = config.get('SAMPLE_RATE', 0.01)
+        slow_ms = config.get('SLOW_MS', 0)
+        self.slow_seconds = slow_ms / 1000 if slow_ms else None
+        self.sampler = StackSampler(config.get('INTERVAL_MS', 5) / 1000)
+
+    async def __acall__(self, request):
+        # Not profiled, see the module docstring
+        return await self.get_response(request)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_seconds is None:
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        self.sampler.start(thread_id, sys._getframe().f_code)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stacks = self.sampler.stop(thread_id)
+        elapsed = time.perf_counter() - start
+
+        if stacks and (sampled or elapsed >= self.slow_seconds):
+            match = getattr(request, 'resolver_match', None)
+            profile_writer.put(stacks, match.view_name if match is not None else 'unresolved', elapsed)
+        return response
+
+
+@staff_member_required
+def profile_list(request):
+    """Saved profiles, newest first"""
+    directory = profiles_dir()
+    profiles = []
+    if directory.is_dir():
+        for path in sorted(directory.iterdir(), key=lambda path: path.name, reverse=True):
+            match = PROFILE_FILENAME.match(path.name)
+            if match is None:
+                continue
+            profiles.append({
+                'filename': path.name,
+                'created_at': datetime.strptime(match['time'], '%Y%m%d-%H%M%S').isoformat(),
+                'route': match['route'],
+                'duration_ms': int(match['ms']),
+                'size': path.stat().st_size,
+                'url': reverse('admin_profile_download', args=[path.name]),
+            })
+    return JsonResponse({'profiles': profiles})
+
+
+@staff_member_required
+def profile_download(request, filename):
+    if not PROFILE_FILENAME.match(filename):
+        raise Http404('Unknown profile')
+
+    path = profiles_dir() / filename
+    if not path.is_file():
+        raise Http404('Profile not found')
+
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type='text/plain')
@@ -0,0 +1,224 @@
+"""
+Per-request SQL inspection for development and staging (settings.QUERY_INSPECTOR)
+
+QueryInspectorMiddleware records every statement a request runs and
+groups them by fingerprint: the SQL with literals and IN/VALUES lists
+collapsed, so ``WHERE id = 7`` and ``WHERE id = 8`` count as the same
+query. A fingerprint seen REPEAT_THRESHOLD times or more (an N+1: a
+query per row of something already loaded) is reported with the lines of
+our code that issued it.
+
+Each request logs a summary to the structured log ('vibewise_project'
+logger, JSON in django.log): a WARNING listing the repeated queries, or a
+DEBUG line when there were none. Disabled, the middleware is not loaded at
+all. The request's statements are collected through a context variable,
+so queries run from sync_to_async threads count; executor threads only
+when the work is wrapped with api.metrics.in_request_context().
+
+Streaming responses (CSV exports) run their queries while the body is
+iterated, after the middleware has returned: their content is wrapped so
+each chunk is produced with the request's collector active, and the
+summary is logged when the body is closed. File responses are logged
+straight away.
+"""
+import contextvars
+import logging
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends import utils as db_utils
+from django.db.backends.signals import connection_created
+from django.http import FileResponse
+
+from vibewise_project.middleware import HybridMiddleware
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+_REPEATED_ROWS = re.compile(r'(\([^()]*\))(?:\s*,\s*\1)+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """``sql`` with the parts that vary between otherwise identical queries replaced"""
+    sql = _STRING.sub('%s', sql)
+    sql = _NUMBER.sub('%s', sql)
+    # IN (%s, %s, %s) and multi-row VALUES lists of any length
+    sql = _PLACEHOLDER_LIST.sub('%s, ...', sql)
+    sql = _REPEATED_ROWS.sub(r'\1, ...', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+_PROJECT_DIR = str(Path(settings.BASE_DIR).resolve())
+_DB_UTILS = db_utils.__file__
+
+
+def _caller():
+    """file:line (function) of the innermost frame in our own code"""
+    # Skip the execute wrappers (ours and others) below Django's cursor
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename != _DB_UTILS:
+        frame = frame.f_back
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PROJECT_DIR) and 'site-packages' not in filename:
+            relative = filename[len(_PROJECT_DIR):].lstrip('/\\')
+            return f'{relative}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+    return None
+
+
+class RequestQueries:
+    """Statements run while serving one request, grouped by fingerprint"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.by_fingerprint = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            key = fingerprint(sql)
+            entry = self.by_fingerprint.get(key)
+            if entry is None:
+                entry = self.by_fingerprint[key] = {'count': 0, 'seconds': 0.0, 'locations': Counter()}
+            entry['count'] += 1
+            entry['seconds'] += elapsed
+            entry['locations'][_caller()] += 1
+
+    def repeated(self, threshold):
+        return sorted((
+            {
+                'fingerprint': key,
+                'count': entry['count'],
+                'time_ms': round(entry['seconds'] * 1000, 2),
+                'locations': [
+                    f'{location} x{count}' for location, count in entry['locations'].most_common()
+                ],
+            }
+            for key, entry in self.by_fingerprint.items()
+            if entry['count'] >= threshold
+        ), key=lambda query: query['count'], reverse=True)
+
+
+_current = contextvars.ContextVar('query_inspector', default=None)
+
+
+def _inspect(execute, sql, params, many, context):
+    queries = _current.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def install_inspector(sender, connection, **kwargs):
+    # connection_created fires again on reconnects
+    if _inspect not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_inspect)
+
+
+class QueryInspectorMiddleware(HybridMiddleware):
+    """Logs repeated (N+1) queries per request; enable with QUERY_INSPECTOR=True"""
+
+    def __init__(self, get_response):
+        config = getattr(settings, 'QUERY_INSPECTOR', {})
+        if not config.get('ENABLED'):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.threshold = config.get('REPEAT_THRESHOLD', 3)
+        connection_created.connect(install_inspector)
+        # Connections this thread already opened
+        for connection in connections.all(initialized_only=True):
+            install_inspector(None, connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        queries = RequestQueries()
+        token = _current.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, queries)
+
+    async def __acall__(self, request):
+        queries = RequestQueries()
+        token = _current.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, queries)
+
+    def _finish(self, request, response, queries):
+        if not response.streaming or isinstance(response, FileResponse):
+            self._log(request, response, queries)
+        elif response.is_async:
+            response.streaming_content = self._ainspect_stream(request, response, queries, response.streaming_content)
+        else:
+            response.streaming_content = self._inspect_stream(request, response, queries, response.streaming_content)
+        return response
+
+    def _inspect_stream(self, request, response, queries, content):
+        chunks = iter(content)
+        try:
+            while True:
+                token = _current.set(queries)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                yield chunk
+        finally:
+            # Exhausted, or closed early by the server
+            self._log(request, response, queries)
+
+    async def _ainspect_stream(self, request, response, queries, content):
+        chunks = aiter(content)
+        try:
+            while True:
+                token = _current.set(queries)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                yield chunk
+        finally:
+            self._log(request, response, queries)
+
+    def _log(self, request, response, queries):
+        repeated = queries.repeated(self.threshold)
+        match = getattr(request, 'resolver_match', None)
+        extra = {
+            'method': request.method,
+            'path': request.path,
+            'route': match.view_name if match is not None else None,
+            'status': response.status_code,
+            'query_count': queries.count,
+            'query_time_ms': round(queries.seconds * 1000, 2),
+            'repeated_queries': repeated,
+        }
+        if repeated:
+            logger.warning("%s %s ran %s queries, %s repeated: %s", request.method, request.path,
+                           queries.count, len(repeated), repeated[0]['fingerprint'], extra=extra)
+        else:
+            logger.debug("%s %s ran %s queries", request.method, request.path, queries.count, extra=extra)
@@ -38,13 +38,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'vibewise_project.profiling.ProfilingMiddleware',
+    'vibewise_project.query_inspector.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'vibewise_project.middleware.StaticFilesMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'vibewise_project.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,6 +91,77 @@ else:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+    if os.environ.get('SQLITE_PRODUCTION', 'False') == 'True':
+        # Single-node deployments: WAL, one serialized writer, persistent
+        # connections (see sqlite_backend/base.py)
+        DATABASES['default'].update({
+            'ENGINE': 'vibewise_project.sqlite_backend',
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+            },
+        })
+
+# Read replica for analytics and list reads (see db_router.py). Locally,
+# DATABASE_REPLICA_PATH can name a second SQLite file that
+# `manage.py sync_sqlite_replica` copies the primary into.
+if os.environ.get('DATABASE_REPLICA_URL'):
+    import dj_database_url
+    DATABASES['replica'] = dj_database_url.config(env='DATABASE_REPLICA_URL', conn_max_age=600)
+elif os.environ.get('DATABASE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DATABASE_REPLICA_PATH'],
+    }
+if 'replica' in DATABASES:
+    # Tests read and write a single database
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['vibewise_project.db_router.ReplicaRouter']
+
+# After a write, a client reads from the primary for this many seconds
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', 10))
+
+# Cache - Redis in production, local memory for development and tests
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+            'KEY_PREFIX': 'vibewise',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'vibewise',
+        }
+    }
+
+# Per-user cache for dashboard, history and playlist responses (seconds)
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+
+# Playlist contents are served from the local mirror; older than this
+# (seconds), it is checked against Spotify's snapshot_id first
+PLAYLIST_TRACKS_MAX_AGE = int(os.environ.get('PLAYLIST_TRACKS_MAX_AGE', 300))
+
+# Buffer mood detection inserts and write them in batches (mood_detection.write_behind)
+MOOD_WRITE_BEHIND = {
+    'ENABLED': os.environ.get('MOOD_WRITE_BEHIND', 'False') == 'True',
+    'BATCH_SIZE': int(os.environ.get('MOOD_WRITE_BEHIND_BATCH_SIZE', 100)),
+    'FLUSH_INTERVAL_MS': int(os.environ.get('MOOD_WRITE_BEHIND_FLUSH_MS', 500)),
+    # Rows failing this many flushes are dropped (and logged)
+    'MAX_RETRIES': int(os.environ.get('MOOD_WRITE_BEHIND_MAX_RETRIES', 3)),
+    # Beyond this many queued rows, requests save their detection directly
+    'MAX_PENDING': int(os.environ.get('MOOD_WRITE_BEHIND_MAX_PENDING', 10000)),
+}
+
+# Raw mood detections older than this are folded into daily aggregates and
+# deleted by the compact_mood_detections command
+MOOD_RETENTION_DAYS = int(os.environ.get('MOOD_RETENTION_DAYS', 90))
+MOOD_COMPACTION_BATCH_SIZE = int(os.environ.get('MOOD_COMPACTION_BATCH_SIZE', 1000))
 
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
@@ -145,6 +220,27 @@ SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID', 'f99dc779642f4540b550a32
 SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET', 'c1a4ac7a6a8d44baa04cff86a38a1c8d')
 SPOTIFY_REDIRECT_URI = os.environ.get('SPOTIFY_REDIRECT_URI', 'http://127.0.0.1:8000/callback/')
 
+# How long (seconds) a response is replayed for a repeated Idempotency-Key
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 600))
+# How long a worker's claim on a request lasts, and how long a duplicate
+# polls for its result before answering 409
+IDEMPOTENCY_LEASE = int(os.environ.get('IDEMPOTENCY_LEASE', 60))
+IDEMPOTENCY_WAIT = int(os.environ.get('IDEMPOTENCY_WAIT', 5))
+
+# Async Spotify client (api/async_spotify.py), one pool per event loop
+SPOTIFY_ASYNC_CLIENT = {
+    'MAX_CONNECTIONS': int(os.environ.get('SPOTIFY_MAX_CONNECTIONS', 100)),
+    'MAX_KEEPALIVE': 20,
+    'MAX_CONCURRENCY': int(os.environ.get('SPOTIFY_MAX_CONCURRENCY', 50)),
+    'TIMEOUT': 10.0,
+    'MAX_RETRIES': 2,
+}
+
+# Catalog search results kept in the default cache (track IDs/URIs only)
+SPOTIFY_SEARCH_CACHE = {
+    'TTL': int(os.environ.get('SPOTIFY_SEARCH_CACHE_TTL', 3600)),
+}
+
 # CORS Settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -174,6 +270,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
 # CSRF Trusted Origins
@@ -186,37 +283,133 @@ CSRF_TRUSTED_ORIGINS = [
 CELERY_BROKER_URL = 'redis://localhost:6379'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379'
 
+# Prometheus metrics at /metrics (api/metrics.py). Scrapers send
+# "Authorization: Bearer <token>" or come from one of METRICS_ALLOWED_IPS
+# (comma separated); with neither set the endpoint is only open under DEBUG.
+# gunicorn.conf.py sets up PROMETHEUS_MULTIPROC_DIR so the workers' figures are summed.
+METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
 # Create logs directory if it doesn't exist
 LOGS_DIR = BASE_DIR / 'logs'
 os.makedirs(LOGS_DIR, exist_ok=True)
 
+# Stack-sample a fraction of requests, and every request slower than SLOW_MS
+# when set, into PROFILES_DIR (see vibewise_project/profiling.py)
+PROFILING = {
+    'ENABLED': os.environ.get('PROFILING', 'False') == 'True',
+    'SAMPLE_RATE': float(os.environ.get('PROFILING_SAMPLE_RATE', 0.01)),
+    'SLOW_MS': int(os.environ.get('PROFILING_SLOW_MS', 0)),
+    'INTERVAL_MS': int(os.environ.get('PROFILING_INTERVAL_MS', 5)),
+    'MAX_FILES': int(os.environ.get('PROFILING_MAX_FILES', 200)),
+    'MAX_PENDING': int(os.environ.get('PROFILING_MAX_PENDING', 100)),
+}
+PROFILES_DIR = LOGS_DIR / 'profiles'
+
+# Admin background CSV exports; private, only served by the staff-only
+# admin/exports/<filename>/ view
+EXPORTS_ROOT = Path(os.environ.get('EXPORTS_ROOT', LOGS_DIR / 'exports'))
+# Background exports each worker runs at once; more are refused
+EXPORT_MAX_CONCURRENT = int(os.environ.get('EXPORT_MAX_CONCURRENT', 2))
+
+# Development/staging: log queries a request repeats REPEAT_THRESHOLD times
+# or more (N+1s), with where they were issued (vibewise_project/query_inspector.py)
+QUERY_INSPECTOR = {
+    'ENABLED': os.environ.get('QUERY_INSPECTOR', 'False') == 'True',
+    'REPEAT_THRESHOLD': int(os.environ.get('QUERY_INSPECTOR_REPEAT_THRESHOLD', 3)),
+}
+
+# tracemalloc snapshots each worker keeps for /admin/memory/ diffs (vibewise_project/memory.py)
+MEMORY_SNAPSHOTS_KEPT = int(os.environ.get('MEMORY_SNAPSHOTS_KEPT', 5))
+# Per-process reports and snapshots written on SIGUSR2
+MEMORY_DUMPS_DIR = LOGS_DIR / 'memory'
+
 # Logging
+# Request threads only enqueue records; the 'queue' handler's listener thread
+# does the console/file writes (see logutils.py). It must sort after the
+# handlers it references.
+# INFO unless asked for more: set APP_LOG_LEVEL and CONSOLE_LOG_LEVEL to DEBUG
+APP_LOG_LEVEL = os.environ.get('APP_LOG_LEVEL', 'INFO')
+CONSOLE_LOG_LEVEL = os.environ.get('CONSOLE_LOG_LEVEL', 'INFO')
+# Per-playlist Spotify tracing (api.services.spotify) is noisy; WARNING in production
+SPOTIFY_LOG_LEVEL = os.environ.get('SPOTIFY_LOG_LEVEL', 'INFO' if DEBUG else 'WARNING')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'vibewise_project.logutils.JsonFormatter',
+        },
+        'simple': {
+            'format': '%(asctime)s %(levelname)s %(name)s: %(message)s',
+        },
+    },
+    'filters': {
+        # At most 20 of the same message a minute; errors always get through
+        'rate_limit': {
+            '()': 'vibewise_project.logutils.RateLimitFilter',
+            'rate': 20,
+            'per': 60,
+            'exempt_level': 'ERROR',
+        },
+    },
     'handlers': {
         'file': {
             'level': 'INFO',
             'class': 'logging.FileHandler',
             'filename': LOGS_DIR / 'django.log',
+            'formatter': 'json',
         },
         'console': {
-            'level': 'INFO',
+            'level': CONSOLE_LOG_LEVEL,
             'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+        'queue': {
+            '()': 'vibewise_project.logutils.QueueListenerHandler',
+            'handlers': ['cfg://handlers.console', 'cfg://handlers.file'],
+            'filters': ['rate_limit'],
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['file', 'console'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': True,
         },
+        'api': {
+            'handlers': ['queue'],
+            'level': APP_LOG_LEVEL,
+            'propagate': False,
+        },
+        'api.services.spotify': {
+            'level': SPOTIFY_LOG_LEVEL,
+        },
+        'mood_detection': {
+            'handlers': ['queue'],
+            'level': APP_LOG_LEVEL,
+            'propagate': False,
+        },
+        'spotify_integration': {
+            'handlers': ['queue'],
+            'level': APP_LOG_LEVEL,
+            'propagate': False,
+        },
+        'vibewise_project': {
+            'handlers': ['queue'],
+            'level': APP_LOG_LEVEL,
+            'propagate': False,
+        },
     },
 }
 
 # Session Configuration
+SESSION_ENGINE = 'accounts.sessions'  # cached_db that skips unneeded writes
 SESSION_COOKIE_AGE = 86400  # 1 day
 SESSION_SAVE_EVERY_REQUEST = True
+# Unchanged sessions are written back (to extend their expiry) at most this often
+SESSION_REFRESH_INTERVAL = int(os.environ.get('SESSION_REFRESH_INTERVAL', 900))
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
 
@@ -229,6 +422,12 @@ if not DEBUG:
     SECURE_CONTENT_TYPE_NOSNIFF = True
     X_FRAME_OPTIONS = 'DENY'
 
+# Admin dashboard: above this many rows, Postgres planner estimates replace COUNT(*)
+ADMIN_STATS_ESTIMATE_MIN_ROWS = int(os.environ.get('ADMIN_STATS_ESTIMATE_MIN_ROWS', 100000))
+# Figures older than this (seconds) are recomputed by the dashboard itself,
+# in case the refresh_dashboard_stats cron job stops running
+ADMIN_STATS_MAX_AGE = int(os.environ.get('ADMIN_STATS_MAX_AGE', 3600))
+
 # Admin site customization
 ADMIN_SITE_HEADER = "VibeWise Admin Panel"
 ADMIN_SITE_TITLE = "VibeWise Admin"
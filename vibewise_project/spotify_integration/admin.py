@@ -1,11 +1,25 @@
 """
 Spotify Integration Admin Configuration
 """
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.conf import settings
-from django.http import HttpResponse
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from pathlib import Path
 import csv
-from .models import SpotifyUser, MoodDetectionResult, SpotifyPlaylist, SpotifyTrack
+import logging
+import os
+import secrets
+import threading
+import time
+from .models import (
+    SpotifyUser, MoodDetectionResult, MoodDetectionDailyAggregate, SpotifyPlaylist, SpotifyTrack
+)
+
+logger = logging.getLogger(__name__)
 
 # Customize admin site
 admin.site.site_header = getattr(settings, 'ADMIN_SITE_HEADER', 'VibeWise Admin')
@@ -13,24 +27,108 @@ admin.site.site_title = getattr(settings, 'ADMIN_SITE_TITLE', 'VibeWise Admin')
 admin.site.index_title = getattr(settings, 'ADMIN_INDEX_TITLE', 'Welcome to VibeWise Administration')
 
 
-# CSV Export Action
+# CSV Export Actions
+EXPORT_CHUNK_SIZE = 2000
+# A .part file this old belongs to an export lost in a worker restart
+STALE_PART_SECONDS = 3600
+
+# Background exports running in this process
+_export_slots = threading.BoundedSemaphore(getattr(settings, 'EXPORT_MAX_CONCURRENT', 2))
+
+
+def exports_dir():
+    """Background exports (they include tokens): never under MEDIA_ROOT or STATIC_ROOT"""
+    return Path(getattr(settings, 'EXPORTS_ROOT', Path(settings.LOGS_DIR) / 'exports'))
+
+
+class Echo:
+    """File-like object whose write() just hands the CSV line back"""
+    def write(self, value):
+        return value
+
+
+def _export_columns(model):
+    """The concrete columns; FKs export their id, under a ``<name>_id`` header"""
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def iter_csv_rows(queryset):
+    """Yield CSV lines, reading rows in chunks (server-side cursor on Postgres)"""
+    columns = _export_columns(queryset.model)
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in queryset.values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield writer.writerow(row)
+
+
 def export_to_csv(modeladmin, request, queryset):
     """Export selected items to CSV"""
     meta = modeladmin.model._meta
-    field_names = [field.name for field in meta.fields]
     
-    response = HttpResponse(content_type='text/csv')
+    response = StreamingHttpResponse(iter_csv_rows(queryset), content_type='text/csv')
     response['Content-Disposition'] = f'attachment; filename={meta}.csv'
+    return response
+
+export_to_csv.short_description = "Export to CSV"
+
+
+def _write_export(queryset, path):
+    """Background job: stream the export into EXPORTS_ROOT, then publish it"""
+    partial = path.with_suffix('.csv.part')
+    try:
+        with open(partial, 'w', newline='', encoding='utf-8') as f:
+            for line in iter_csv_rows(queryset):
+                f.write(line)
+        os.replace(partial, path)
+        logger.info("CSV export written to %s", path)
+    except Exception:
+        logger.exception("CSV export to %s failed", path)
+        partial.unlink(missing_ok=True)
+    finally:
+        connection.close()
+        _export_slots.release()
+
+
+def _remove_stale_parts(export_dir):
+    cutoff = time.time() - STALE_PART_SECONDS
+    for partial in export_dir.glob('*.csv.part'):
+        try:
+            if partial.stat().st_mtime < cutoff:
+                partial.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def export_to_csv_background(modeladmin, request, queryset):
+    """Write the export to a file in the background and link to it (staff only)"""
+    meta = modeladmin.model._meta
+    export_dir = exports_dir()
+    export_dir.mkdir(parents=True, exist_ok=True)
+    _remove_stale_parts(export_dir)
     
-    writer = csv.writer(response)
-    writer.writerow(field_names)
+    if not _export_slots.acquire(blocking=False):
+        modeladmin.message_user(
+            request, 'Too many exports are already running; try again when one has finished.', messages.WARNING
+        )
+        return
     
-    for obj in queryset:
-        writer.writerow([getattr(obj, field) for field in field_names])
+    # Unguessable, on top of the staff check in export_download
+    filename = f"{meta.app_label}-{meta.model_name}-{timezone.now():%Y%m%d-%H%M%S}-{secrets.token_hex(8)}.csv"
+    threading.Thread(
+        target=_write_export,
+        args=(queryset.all(), export_dir / filename),
+        name=f'csv-export-{filename}',
+        daemon=True,
+    ).start()
     
-    return response
+    url = reverse('admin_export_download', args=[filename])
+    modeladmin.message_user(
+        request,
+        format_html('Export started. It will be available at <a href="{}">{}</a> when finished.', url, filename),
+        messages.INFO,
+    )
 
-export_to_csv.short_description = "Export to CSV"
+export_to_csv_background.short_description = "Export to CSV (background job)"
 
 
 @admin.register(SpotifyUser)
@@ -39,7 +137,7 @@ class SpotifyUserAdmin(admin.ModelAdmin):
     search_fields = ['spotify_id', 'display_name', 'email']
     list_filter = ['country', 'created_at', 'last_login']
     readonly_fields = ['spotify_id', 'created_at', 'updated_at', 'last_login']
-    actions = [export_to_csv]
+    actions = [export_to_csv, export_to_csv_background]
     
     fieldsets = (
         ('User Information', {
@@ -66,7 +164,7 @@ class MoodDetectionResultAdmin(admin.ModelAdmin):
     list_filter = ['mood', 'detected_at']
     readonly_fields = ['detected_at']
     date_hierarchy = 'detected_at'
-    actions = [export_to_csv]
+    actions = [export_to_csv, export_to_csv_background]
     
     def confidence_percentage(self, obj):
         return f"{obj.confidence * 100:.1f}%"
@@ -84,7 +182,7 @@ class SpotifyPlaylistAdmin(admin.ModelAdmin):
     list_filter = ['mood', 'is_public', 'created_at']
     readonly_fields = ['spotify_id', 'spotify_url', 'created_at', 'updated_at']
     date_hierarchy = 'created_at'
-    actions = [export_to_csv]
+    actions = [export_to_csv, export_to_csv_background]
     
     fieldsets = (
         ('Playlist Information', {
@@ -109,7 +207,7 @@ class SpotifyTrackAdmin(admin.ModelAdmin):
     search_fields = ['name', 'artist', 'album']
     list_filter = ['popularity']
     readonly_fields = ['spotify_id']
-    actions = [export_to_csv]
+    actions = [export_to_csv, export_to_csv_background]
     
     fieldsets = (
         ('Track Information', {
@@ -118,4 +216,13 @@ class SpotifyTrackAdmin(admin.ModelAdmin):
         ('Audio Features', {
             'fields': ('popularity', 'energy', 'valence')
         }),
-    )
\ No newline at end of file
+    )
+
+@admin.register(MoodDetectionDailyAggregate)
+class MoodDetectionDailyAggregateAdmin(admin.ModelAdmin):
+    list_display = ['user', 'day', 'mood', 'count']
+    search_fields = ['user__email', 'mood']
+    list_filter = ['mood', 'day']
+    readonly_fields = ['user', 'day', 'mood', 'count', 'confidence_sum']
+    date_hierarchy = 'day'
+    actions = [export_to_csv, export_to_csv_background]
@@ -1,36 +1,50 @@
-from django.shortcuts import render
+import re
+from django.http import FileResponse, Http404
+from django.shortcuts import redirect, render
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import SpotifyUser, MoodDetectionResult, SpotifyPlaylist
-from django.db.models import Count
-from django.utils import timezone
-from datetime import timedelta
+from django.views.decorators.http import require_http_methods
+from vibewise_project.db_router import replica_reads
+from .models import SpotifyUser
+from .stats import get_dashboard_stats, refresh_dashboard_stats
 
 @staff_member_required
+@require_http_methods(['GET', 'POST'])
+@replica_reads
 def admin_dashboard(request):
-    # Total counts
-    total_users = SpotifyUser.objects.count()
-    total_detections = MoodDetectionResult.objects.count()
-    total_playlists = SpotifyPlaylist.objects.count()
+    # Precomputed figures, see spotify_integration.stats; POST recomputes them
+    if request.method == 'POST':
+        refresh_dashboard_stats()
+        return redirect('admin_dashboard')
+    stats = get_dashboard_stats()
     
-    # Users in last 7 days
-    week_ago = timezone.now() - timedelta(days=7)
-    new_users_week = SpotifyUser.objects.filter(created_at__gte=week_ago).count()
-    
-    # Most popular moods
-    popular_moods = MoodDetectionResult.objects.values('mood').annotate(
-        count=Count('mood')
-    ).order_by('-count')[:5]
-    
-    # Recent users
+    # Recent users (served by the created_at index)
     recent_users = SpotifyUser.objects.order_by('-created_at')[:10]
     
     context = {
-        'total_users': total_users,
-        'total_detections': total_detections,
-        'total_playlists': total_playlists,
-        'new_users_week': new_users_week,
-        'popular_moods': popular_moods,
+        'total_users': stats['total_users'],
+        'total_detections': stats['total_detections'],
+        'total_playlists': stats['total_playlists'],
+        'new_users_week': stats['new_users_week'],
+        'popular_moods': stats['popular_moods'],
         'recent_users': recent_users,
+        'stats_refreshed_at': min(stat.refreshed_at for stat in stats.values()),
     }
     
-    return render(request, 'admin/dashboard.html', context)
\ No newline at end of file
+    return render(request, 'admin/dashboard.html', context)
+
+
+EXPORT_FILENAME = re.compile(r'^[\w-]+\.csv$')
+
+@staff_member_required
+def export_download(request, filename):
+    """Download a finished background CSV export from EXPORTS_ROOT"""
+    from .admin import exports_dir
+    
+    if not EXPORT_FILENAME.match(filename):
+        raise Http404('Unknown export')
+    
+    path = exports_dir() / filename
+    if not path.is_file():
+        raise Http404('Export not found or still running')
+    
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename)
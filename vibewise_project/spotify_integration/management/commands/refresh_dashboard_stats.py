@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from spotify_integration.stats import refresh_dashboard_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the admin dashboard figures (run periodically, e.g. from cron)'
+    
+    def handle(self, *args, **options):
+        values = refresh_dashboard_stats()
+        
+        for key, (value, is_estimate) in values.items():
+            if key == 'popular_moods':
+                value = ', '.join(f"{row['mood']}={row['count']}" for row in value)
+            marker = ' (estimate)' if is_estimate else ''
+            self.stdout.write(f"{key}: {value}{marker}")
+        
+        self.stdout.write(
+            self.style.SUCCESS('Dashboard stats refreshed')
+        )
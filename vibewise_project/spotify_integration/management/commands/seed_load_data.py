@@ -0,0 +1,82 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from spotify_integration.seeding import SyntheticDataGenerator, analyze
+
+
+class Command(BaseCommand):
+    help = ('Generate synthetic users, detections, playlists and tracks for load and scale '
+            'testing (deterministic for a given --seed)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to create')
+        parser.add_argument(
+            '--detections-per-user', type=int, default=50,
+            help='Average mood detections per user (log-normally distributed)'
+        )
+        parser.add_argument(
+            '--playlists-per-user', type=int, default=3,
+            help='Average playlists per Spotify-connected user'
+        )
+        parser.add_argument('--tracks', type=int, default=5000, help='Size of the shared track catalogue')
+        parser.add_argument('--days', type=int, default=365, help='Days of history to spread activity over')
+        parser.add_argument(
+            '--spotify-ratio', type=float, default=0.6,
+            help='Share of users with a connected Spotify account'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Prefix of generated usernames and Spotify ids; use a new one to seed again'
+        )
+        parser.add_argument(
+            '--end-date', type=date.fromisoformat, default=None,
+            help='Last day of generated history, YYYY-MM-DD (default: today). '
+                 'Fix it to reproduce a data set exactly'
+        )
+        parser.add_argument(
+            '--password', default=None,
+            help='Password for every generated user (default: unusable password)'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT')
+        parser.add_argument(
+            '--users-per-chunk', type=int, default=500,
+            help='Users written per transaction'
+        )
+        parser.add_argument(
+            '--no-analyze', action='store_true',
+            help='Skip refreshing the planner statistics afterwards'
+        )
+
+    def handle(self, *args, **options):
+        generator = SyntheticDataGenerator(
+            users=options['users'],
+            detections_per_user=options['detections_per_user'],
+            playlists_per_user=options['playlists_per_user'],
+            tracks=options['tracks'],
+            days=options['days'],
+            spotify_ratio=options['spotify_ratio'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            end=options['end_date'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+            users_per_chunk=options['users_per_chunk'],
+        )
+        if generator.existing_rows():
+            raise CommandError(
+                f"Data with prefix '{options['prefix']}' already exists; pass a different --prefix"
+            )
+
+        def progress(done, total):
+            self.stdout.write(f"{done}/{total} users written")
+
+        counts = generator.generate(progress=progress)
+        for label, count in counts.items():
+            self.stdout.write(f"{label}: {count} rows")
+
+        if not options['no_analyze']:
+            analyze()
+        self.stdout.write(
+            self.style.SUCCESS(f'Seeded {sum(counts.values())} rows')
+        )
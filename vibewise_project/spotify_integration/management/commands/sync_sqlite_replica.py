@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from vibewise_project.db_router import REPLICA_ALIAS, replica_configured
+
+
+class Command(BaseCommand):
+    help = ('Copy the SQLite primary database into the SQLite replica file '
+            '(local stand-in for replication, see DATABASE_REPLICA_PATH)')
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError('No replica database configured, set DATABASE_REPLICA_PATH')
+
+        primary, replica = connections['default'], connections[REPLICA_ALIAS]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Only SQLite primaries and replicas can be synced this way')
+
+        # The backup API takes a consistent snapshot even while the site is writing
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        replica.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Replica {replica.settings_dict['NAME']} is up to date")
+        )
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotify_integration', '0002_spotifyplaylist_genres_used_spotifyplaylist_mood_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spotifyplaylist',
+            name='snapshot_id',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='spotifyplaylist',
+            name='tracks_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SpotifyPlaylistTrack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('added_at', models.DateTimeField(blank=True, null=True)),
+                ('playlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='spotify_integration.spotifyplaylist')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='playlist_items', to='spotify_integration.spotifytrack')),
+            ],
+            options={
+                'verbose_name': 'Spotify Playlist Track',
+                'verbose_name_plural': 'Spotify Playlist Tracks',
+                'ordering': ['playlist', 'position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='spotifyplaylisttrack',
+            constraint=models.UniqueConstraint(fields=('playlist', 'position'), name='unique_playlist_position'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotify_integration', '0003_spotifyplaylisttrack'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('value', models.JSONField(default=dict)),
+                ('is_estimate', models.BooleanField(default=False)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Dashboard Stat',
+                'verbose_name_plural': 'Dashboard Stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='spotifyuser',
+            index=models.Index(fields=['-created_at'], name='spotify_int_created_0fbdd8_idx'),
+        ),
+    ]
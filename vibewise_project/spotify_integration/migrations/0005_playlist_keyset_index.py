@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotify_integration', '0004_dashboardstat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='spotifyplaylist',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='spotify_int_user_id_0d8118_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('spotify_integration', '0005_playlist_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodDetectionDailyAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('mood', models.CharField(choices=[('happy', 'Happy'), ('sad', 'Sad'), ('angry', 'Angry'), ('neutral', 'Neutral'), ('surprised', 'Surprised'), ('fear', 'Fear'), ('disgust', 'Disgust'), ('excited', 'Excited'), ('confident', 'Confident'), ('motivated', 'Motivated'), ('dancing', 'Dancing'), ('romantic', 'Romantic'), ('peaceful', 'Peaceful'), ('energetic', 'Energetic'), ('melancholic', 'Melancholic'), ('playful', 'Playful')], max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0.0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mood_detection_aggregates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Mood Detection Daily Aggregate',
+                'verbose_name_plural': 'Mood Detection Daily Aggregates',
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mooddetectiondailyaggregate',
+            constraint=models.UniqueConstraint(fields=('user', 'day', 'mood'), name='unique_detection_aggregate'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotify_integration', '0006_mooddetectiondailyaggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spotifytrack',
+            name='artists',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
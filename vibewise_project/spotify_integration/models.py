@@ -30,6 +30,9 @@ class SpotifyUser(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Spotify User'
         verbose_name_plural = 'Spotify Users'
+        indexes = [
+            models.Index(fields=['-created_at']),
+        ]
     
     def __str__(self):
         return f"{self.display_name or self.spotify_id} ({self.email})"
@@ -82,6 +85,27 @@ class MoodDetectionResult(models.Model):
         return f"{self.user.email} - {self.mood} ({self.confidence:.2%})"
 
 
+class MoodDetectionDailyAggregate(models.Model):
+    """Per user, day and mood totals of detections compacted out of MoodDetectionResult"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mood_detection_aggregates')
+    day = models.DateField()
+    mood = models.CharField(max_length=50, choices=MoodDetectionResult.MOOD_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    confidence_sum = models.FloatField(default=0.0)
+    
+    class Meta:
+        ordering = ['-day']
+        verbose_name = 'Mood Detection Daily Aggregate'
+        verbose_name_plural = 'Mood Detection Daily Aggregates'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'mood'], name='unique_detection_aggregate'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.day} {self.mood}: {self.count}"
+
+
 class SpotifyPlaylist(models.Model):
     """Store Spotify playlist information"""
     
@@ -98,6 +122,10 @@ class SpotifyPlaylist(models.Model):
     mood = models.CharField(max_length=50, blank=True)
     genres_used = models.JSONField(blank=True, null=True)
     
+    # Local mirror of the playlist contents, see SpotifyPlaylistTrack
+    snapshot_id = models.CharField(max_length=100, blank=True)
+    tracks_synced_at = models.DateTimeField(blank=True, null=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -105,6 +133,10 @@ class SpotifyPlaylist(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Spotify Playlist'
         verbose_name_plural = 'Spotify Playlists'
+        indexes = [
+            # Keyset pagination of a user's playlists (api.pagination)
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.name}"
@@ -116,6 +148,7 @@ class SpotifyTrack(models.Model):
     spotify_id = models.CharField(max_length=100, unique=True)
     name = models.CharField(max_length=200)
     artist = models.CharField(max_length=200)
+    artists = models.JSONField(default=list, blank=True)  # Artist names, in Spotify's order
     album = models.CharField(max_length=200)
     duration_ms = models.IntegerField()
     preview_url = models.URLField(blank=True, null=True)
@@ -128,4 +161,40 @@ class SpotifyTrack(models.Model):
         verbose_name_plural = 'Spotify Tracks'
     
     def __str__(self):
-        return f"{self.name} by {self.artist}"
\ No newline at end of file
+        return f"{self.name} by {self.artist}"
+
+
+class SpotifyPlaylistTrack(models.Model):
+    """Ordered reference from a mirrored playlist to its tracks"""
+    
+    playlist = models.ForeignKey(SpotifyPlaylist, on_delete=models.CASCADE, related_name='items')
+    track = models.ForeignKey(SpotifyTrack, on_delete=models.CASCADE, related_name='playlist_items')
+    position = models.PositiveIntegerField()
+    added_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['playlist', 'position']
+        verbose_name = 'Spotify Playlist Track'
+        verbose_name_plural = 'Spotify Playlist Tracks'
+        constraints = [
+            models.UniqueConstraint(fields=['playlist', 'position'], name='unique_playlist_position'),
+        ]
+    
+    def __str__(self):
+        return f"{self.playlist.name} #{self.position}"
+
+
+class DashboardStat(models.Model):
+    """Precomputed global figure for the admin dashboard"""
+    
+    key = models.CharField(max_length=50, unique=True)
+    value = models.JSONField(default=dict)
+    is_estimate = models.BooleanField(default=False)
+    refreshed_at = models.DateTimeField()
+    
+    class Meta:
+        verbose_name = 'Dashboard Stat'
+        verbose_name_plural = 'Dashboard Stats'
+    
+    def __str__(self):
+        return f"{self.key} = {self.value}"
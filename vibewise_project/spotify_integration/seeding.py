@@ -0,0 +1,307 @@
+"""
+Synthetic data for load and scale testing (see the seed_load_data command)
+
+Generates users with preferences, Spotify profiles, mood detections,
+playlists and their tracks, shaped roughly like production:
+
+- activity per user is log-normal, so a few heavy users own a large share
+  of the detections;
+- detections follow a daily cycle (quiet nights, evening peak) and each
+  user leans towards a few moods;
+- track popularity is skewed, so some tracks are in many playlists.
+
+Rows are written with bulk_create, at most ``batch_size`` rows per INSERT
+and ``users_per_chunk`` users per transaction, so memory stays bounded
+whatever the totals. Every user gets its own Random seeded from
+(seed, user index), so the same options always produce the same data,
+whatever the chunk sizes.
+"""
+import logging
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, reset_queries, transaction
+from django.utils import timezone
+
+from accounts.models import User, UserPreferences
+from mood_detection.models import MoodDetectionResult
+from mood_detection.rollups import rebuild_rollups
+from .models import (
+    MoodDetectionResult as SpotifyMoodDetectionResult, SpotifyPlaylist, SpotifyPlaylistTrack,
+    SpotifyTrack, SpotifyUser
+)
+
+logger = logging.getLogger(__name__)
+
+# Share of detections per mood before each user's own bias
+MOOD_WEIGHTS = {
+    'happy': 22, 'neutral': 20, 'sad': 9, 'excited': 7, 'peaceful': 6, 'energetic': 5,
+    'confident': 5, 'motivated': 4, 'surprised': 4, 'angry': 3, 'melancholic': 3,
+    'playful': 3, 'romantic': 3, 'dancing': 2, 'fear': 2, 'disgust': 2,
+}
+
+# Relative activity per local hour, 00:00 to 23:00
+HOUR_WEIGHTS = [
+    2, 1, 1, 1, 1, 2, 4, 7, 9, 8, 7, 7,
+    8, 7, 6, 6, 7, 9, 11, 13, 14, 12, 8, 4,
+]
+
+GENRES = [
+    'pop', 'rock', 'hip-hop', 'electronic', 'indie', 'jazz', 'classical', 'r-n-b',
+    'latin', 'k-pop', 'metal', 'folk', 'ambient', 'soul', 'country', 'reggae',
+]
+
+# Models whose auto_now/auto_now_add timestamps are generated instead
+TIMESTAMPED = [
+    (User, ['created_at', 'updated_at']),
+    (SpotifyUser, ['created_at', 'updated_at']),
+    (SpotifyPlaylist, ['created_at', 'updated_at']),
+    (SpotifyMoodDetectionResult, ['detected_at']),
+]
+
+
+@contextmanager
+def explicit_timestamps():
+    """Let bulk_create keep the generated created_at/updated_at values"""
+    saved = []
+    for model, names in TIMESTAMPED:
+        for name in names:
+            field = model._meta.get_field(name)
+            saved.append((field, field.auto_now, field.auto_now_add))
+            field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class BulkWriter:
+    """Buffers unsaved instances and inserts them ``batch_size`` at a time"""
+
+    def __init__(self, model, batch_size, on_flush=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.pending = []
+        self.written = 0
+
+    def add(self, obj):
+        self.pending.append(obj)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        objs, self.pending = self.pending, []
+        self.model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.written += len(objs)
+        if self.on_flush is not None:
+            self.on_flush(objs)
+
+
+def _assign_pks(model, objs, key):
+    """Backends that can't return ids from a bulk insert: look them up by ``key``"""
+    if not objs or objs[0].pk is not None:
+        return
+    pks = dict(
+        model.objects.filter(**{f'{key}__in': [getattr(obj, key) for obj in objs]})
+        .values_list(key, 'pk')
+    )
+    for obj in objs:
+        obj.pk = pks[getattr(obj, key)]
+
+
+class SyntheticDataGenerator:
+
+    def __init__(self, users=1000, detections_per_user=50, playlists_per_user=3, tracks=5000,
+                 days=365, spotify_ratio=0.6, seed=0, prefix='load', end=None,
+                 password=None, batch_size=5000, users_per_chunk=500):
+        self.users = users
+        self.detections_per_user = detections_per_user
+        self.playlists_per_user = playlists_per_user
+        self.tracks = tracks
+        self.days = days
+        self.spotify_ratio = spotify_ratio
+        self.seed = seed
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.users_per_chunk = users_per_chunk
+        if end is None:
+            end = timezone.localdate()
+        # Generated times end at the start of ``end`` (a date) in the current timezone
+        self.end = timezone.make_aware(datetime.combine(end, time.min))
+        self.start = self.end - timedelta(days=days)
+        # One hash for every user; PBKDF2 per user would dominate the run
+        self.password_hash = make_password(password)
+
+        self.moods = list(MOOD_WEIGHTS)
+        self.mood_weights = list(MOOD_WEIGHTS.values())
+        self.counts = {}
+
+    def _rng(self, *key):
+        return random.Random(':'.join(str(part) for part in (self.seed, self.prefix) + key))
+
+    def existing_rows(self):
+        """Rows left by an earlier run with the same prefix"""
+        return (
+            User.objects.filter(username__startswith=f'{self.prefix}-user-').exists()
+            or SpotifyTrack.objects.filter(spotify_id__startswith=f'{self.prefix}-track-').exists()
+        )
+
+    def _random_time(self, rng, since):
+        """A time after ``since`` following the daily activity cycle"""
+        span_days = max((self.end - since).days, 1)
+        day = self.end - timedelta(days=rng.randrange(span_days) + 1)
+        hour = rng.choices(range(24), weights=HOUR_WEIGHTS)[0]
+        return day + timedelta(hours=hour, seconds=rng.randrange(3600))
+
+    def _count(self, label, n):
+        self.counts[label] = self.counts.get(label, 0) + n
+
+    def generate(self, progress=None):
+        """Write everything; returns the number of rows per model"""
+        with explicit_timestamps():
+            track_pks = self._write_tracks()
+            for first in range(0, self.users, self.users_per_chunk):
+                last = min(first + self.users_per_chunk, self.users)
+                with transaction.atomic():
+                    user_pks = self._write_users(first, last, track_pks)
+                    rebuild_rollups(user_pks)
+                # With DEBUG on, every INSERT would stay in connection.queries
+                reset_queries()
+                if progress is not None:
+                    progress(last, self.users)
+        return self.counts
+
+    def _write_tracks(self):
+        rng = self._rng('tracks')
+        writer = BulkWriter(SpotifyTrack, self.batch_size)
+        with transaction.atomic():
+            for i in range(self.tracks):
+                writer.add(SpotifyTrack(
+                    spotify_id=f'{self.prefix}-track-{i}',
+                    name=f'Track {i}',
+                    artist=f'Artist {rng.randrange(max(self.tracks // 10, 1))}',
+                    album=f'Album {rng.randrange(max(self.tracks // 5, 1))}',
+                    duration_ms=rng.randint(120_000, 360_000),
+                    popularity=min(int(rng.expovariate(1 / 30)), 100),
+                    energy=round(rng.random(), 3),
+                    valence=round(rng.random(), 3),
+                ))
+            writer.flush()
+        self._count('spotify_integration.SpotifyTrack', writer.written)
+        # Ordered by id, so the most "popular" indexes are stable across runs
+        return list(
+            SpotifyTrack.objects.filter(spotify_id__startswith=f'{self.prefix}-track-')
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    def _write_users(self, first, last, track_pks):
+        users = []
+        plans = []
+        for index in range(first, last):
+            rng = self._rng('user', index)
+            joined = self._random_time(rng, self.start)
+            connected = rng.random() < self.spotify_ratio
+            email = f'{self.prefix}-user-{index}@example.com'
+            users.append(User(
+                username=email, email=email, name=f'Load User {index}', password=self.password_hash,
+                date_joined=joined, created_at=joined, updated_at=joined,
+                spotify_id=f'{self.prefix}-spotify-{index}' if connected else None,
+                spotify_access_token='synthetic-token' if connected else None,
+                spotify_refresh_token='synthetic-refresh' if connected else None,
+            ))
+            plans.append((index, rng, joined, connected))
+
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        _assign_pks(User, users, 'username')
+        self._count('accounts.User', len(users))
+
+        preferences = BulkWriter(UserPreferences, self.batch_size)
+        profiles = BulkWriter(SpotifyUser, self.batch_size)
+        detections = BulkWriter(MoodDetectionResult, self.batch_size)
+        spotify_detections = BulkWriter(SpotifyMoodDetectionResult, self.batch_size)
+        playlist_tracks = BulkWriter(SpotifyPlaylistTrack, self.batch_size)
+
+        def write_items(playlists):
+            _assign_pks(SpotifyPlaylist, playlists, 'spotify_id')
+            if not track_pks:
+                return
+            for playlist in playlists:
+                rng = self._rng('playlist', playlist.spotify_id)
+                for position in range(playlist.total_tracks):
+                    # Squaring skews picks towards the first (popular) tracks
+                    track_pk = track_pks[int(len(track_pks) * rng.random() ** 2)]
+                    playlist_tracks.add(SpotifyPlaylistTrack(
+                        playlist_id=playlist.pk, track_id=track_pk, position=position,
+                        added_at=playlist.created_at,
+                    ))
+
+        playlists = BulkWriter(SpotifyPlaylist, self.batch_size, on_flush=write_items)
+
+        for user, (index, rng, joined, connected) in zip(users, plans):
+            preferences.add(UserPreferences(
+                user_id=user.pk, preferred_genres=rng.sample(GENRES, rng.randint(1, 3)),
+                mood_detection_enabled=rng.random() < 0.95, auto_create_playlists=rng.random() < 0.7,
+            ))
+
+            # Each user leans towards some moods
+            weights = [weight * rng.uniform(0.3, 1.7) for weight in self.mood_weights]
+            # Log-normal with mean 1: most users are light, a few very active
+            for _ in range(int(self.detections_per_user * rng.lognormvariate(-0.5, 1.0))):
+                detections.add(MoodDetectionResult(
+                    user_id=user.pk,
+                    mood=rng.choices(self.moods, weights=weights)[0],
+                    confidence=round(0.5 + 0.49 * rng.betavariate(5, 2), 2),
+                    uuid=uuid.UUID(int=rng.getrandbits(128), version=4),
+                    detected_at=self._random_time(rng, joined),
+                ))
+
+            if not connected:
+                continue
+            profiles.add(SpotifyUser(
+                user_id=user.pk, spotify_id=user.spotify_id, display_name=user.name,
+                email=user.email, country=rng.choice(['US', 'GB', 'IN', 'DE', 'BR', 'JP']),
+                access_token='synthetic-token', refresh_token='synthetic-refresh',
+                token_expires_at=self.end + timedelta(hours=1),
+                created_at=joined, updated_at=joined, last_login=self.end,
+            ))
+            for number in range(int(self.playlists_per_user * rng.lognormvariate(-0.5, 1.0))):
+                mood = rng.choices(self.moods, weights=weights)[0]
+                created_at = self._random_time(rng, joined)
+                # The detection each playlist was generated from
+                spotify_detections.add(SpotifyMoodDetectionResult(
+                    user_id=user.pk, mood=mood, confidence=round(rng.uniform(0.6, 0.99), 2),
+                    detected_at=created_at,
+                ))
+                playlists.add(SpotifyPlaylist(
+                    user_id=user.pk,
+                    spotify_id=f'{self.prefix}-playlist-{index}-{number}',
+                    name=f'VibeWise - {mood.title()} Vibes',
+                    description=f'Generated for a {mood} mood',
+                    spotify_url=f'https://open.spotify.com/playlist/{self.prefix}-{index}-{number}',
+                    total_tracks=rng.randint(15, 30),
+                    mood=mood,
+                    genres_used=rng.sample(GENRES, 2),
+                    created_at=created_at,
+                    updated_at=created_at,
+                ))
+
+        for writer in (preferences, profiles, detections, spotify_detections, playlists, playlist_tracks):
+            writer.flush()
+            self._count(writer.model._meta.label, writer.written)
+        return [user.pk for user in users]
+
+
+def analyze():
+    """Refresh planner statistics so local query plans match production's"""
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        logger.info("Skipping ANALYZE on %s", connection.vendor)
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
@@ -0,0 +1,132 @@
+"""
+Precomputed global figures for the admin dashboard
+
+refresh_dashboard_stats() runs from the refresh_dashboard_stats management
+command and stores the results in DashboardStat. Schedule it with cron,
+e.g. ``*/15 * * * * python manage.py refresh_dashboard_stats``; should it
+stop, the dashboard recomputes figures older than ADMIN_STATS_MAX_AGE.
+On Postgres, large tables use the planner's estimates (pg_class.reltuples,
+pg_stats) instead of COUNT(*) / GROUP BY scans; SQLite and small tables
+get exact numbers. Detection figures include the rows compacted into
+MoodDetectionDailyAggregate (see mood_detection.retention).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import (
+    DashboardStat, MoodDetectionDailyAggregate, MoodDetectionResult, SpotifyPlaylist, SpotifyUser
+)
+
+STAT_KEYS = ('total_users', 'total_detections', 'total_playlists', 'new_users_week', 'popular_moods')
+
+
+def _estimate_min_rows():
+    return getattr(settings, 'ADMIN_STATS_ESTIMATE_MIN_ROWS', 100000)
+
+
+def _estimated_rows(model):
+    """Planner row estimate on Postgres, None when unavailable"""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+            [model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    # reltuples is -1 until the table has been vacuumed/analyzed
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def row_count(model):
+    """(count, is_estimate) - estimated only for very large Postgres tables"""
+    estimate = _estimated_rows(model)
+    if estimate is not None and estimate >= _estimate_min_rows():
+        return estimate, True
+    return model.objects.count(), False
+
+
+def compacted_mood_counts():
+    """{mood: count} of detections that only exist as daily aggregates"""
+    return dict(
+        MoodDetectionDailyAggregate.objects.values('mood')
+        .annotate(total=Sum('count')).order_by()
+        .values_list('mood', 'total')
+    )
+
+
+def _merge_mood_counts(rows, extra, limit):
+    counts = {row['mood']: row['count'] for row in rows}
+    for mood, count in extra.items():
+        counts[mood] = counts.get(mood, 0) + count
+    ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    return [{'mood': mood, 'count': count} for mood, count in ranked[:limit]]
+
+
+def detection_count():
+    """(count, is_estimate) of raw plus compacted detections"""
+    count, is_estimate = row_count(MoodDetectionResult)
+    return count + sum(compacted_mood_counts().values()), is_estimate
+
+
+def popular_moods(limit=5):
+    """(rows, is_estimate) of the most detected moods"""
+    compacted = compacted_mood_counts()
+    estimate = _estimated_rows(MoodDetectionResult)
+    if estimate is not None and estimate >= _estimate_min_rows():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT most_common_vals::text::text[], most_common_freqs FROM pg_stats "
+                "WHERE schemaname = current_schema() AND tablename = %s AND attname = 'mood'",
+                [MoodDetectionResult._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row and row[0]:
+            moods = [
+                {'mood': mood, 'count': int(freq * estimate)}
+                for mood, freq in zip(row[0], row[1])
+            ]
+            return _merge_mood_counts(moods, compacted, limit), True
+
+    moods = MoodDetectionResult.objects.values('mood').annotate(
+        count=Count('mood')
+    ).order_by('-count')
+    return _merge_mood_counts(moods, compacted, limit), False
+
+
+def refresh_dashboard_stats():
+    """Recompute every dashboard figure and store it"""
+    week_ago = timezone.now() - timedelta(days=7)
+
+    values = {
+        'total_users': row_count(SpotifyUser),
+        'total_detections': detection_count(),
+        'total_playlists': row_count(SpotifyPlaylist),
+        'new_users_week': (SpotifyUser.objects.filter(created_at__gte=week_ago).count(), False),
+        'popular_moods': popular_moods(),
+    }
+
+    now = timezone.now()
+    for key, (value, is_estimate) in values.items():
+        DashboardStat.objects.update_or_create(
+            key=key,
+            defaults={'value': value, 'is_estimate': is_estimate, 'refreshed_at': now}
+        )
+    return values
+
+
+def get_dashboard_stats(refresh=False):
+    """Stored figures by key, computed on first use and when stale"""
+    stats = {stat.key: stat for stat in DashboardStat.objects.filter(key__in=STAT_KEYS)}
+    stale_before = timezone.now() - timedelta(seconds=getattr(settings, 'ADMIN_STATS_MAX_AGE', 3600))
+    if (refresh or len(stats) < len(STAT_KEYS)
+            or any(stat.refreshed_at < stale_before for stat in stats.values())):
+        refresh_dashboard_stats()
+        stats = {stat.key: stat for stat in DashboardStat.objects.filter(key__in=STAT_KEYS)}
+    return stats
@@ -1,3 +1,209 @@
-from django.test import TestCase
+import csv
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.db.models import Sum
+from django.http import Http404
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django.views.static import serve
+
+from accounts.models import User
+from mood_detection.models import MoodDetectionResult, UserMoodTotals
+from spotify_integration.models import (
+    DashboardStat, SpotifyPlaylist, SpotifyPlaylistTrack, SpotifyTrack, SpotifyUser
+)
+from spotify_integration.admin import _write_export, export_to_csv, export_to_csv_background
+from spotify_integration.seeding import SyntheticDataGenerator
+from spotify_integration.stats import STAT_KEYS, get_dashboard_stats
+
+
+class SeedLoadDataTests(TestCase):
+    options = dict(users=30, detections_per_user=20, playlists_per_user=2, tracks=50,
+                   end=date(2026, 1, 1), batch_size=40)
+
+    def snapshot(self):
+        return (
+            list(User.objects.order_by('username').values_list('username', 'date_joined', 'spotify_id')),
+            list(MoodDetectionResult.objects.order_by('uuid').values_list('uuid', 'mood', 'confidence', 'detected_at')),
+            list(SpotifyPlaylist.objects.order_by('spotify_id').values_list('spotify_id', 'mood', 'created_at')),
+            list(SpotifyPlaylistTrack.objects.order_by('playlist__spotify_id', 'position')
+                 .values_list('playlist__spotify_id', 'position', 'track__spotify_id')),
+        )
+
+    def test_same_seed_gives_same_data_whatever_the_chunking(self):
+        SyntheticDataGenerator(seed=7, users_per_chunk=7, **self.options).generate()
+        first = self.snapshot()
+        User.objects.all().delete()
+        SpotifyTrack.objects.all().delete()
+        SyntheticDataGenerator(seed=7, users_per_chunk=30, **self.options).generate()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_rollups_match_generated_detections(self):
+        counts = SyntheticDataGenerator(seed=1, users_per_chunk=10, **self.options).generate()
+
+        self.assertEqual(counts['accounts.User'], 30)
+        self.assertEqual(counts['mood_detection.MoodDetectionResult'], MoodDetectionResult.objects.count())
+        self.assertEqual(
+            UserMoodTotals.objects.aggregate(total=Sum('total_detections'))['total'],
+            MoodDetectionResult.objects.count()
+        )
+        self.assertEqual(
+            UserMoodTotals.objects.aggregate(total=Sum('playlist_count'))['total'],
+            SpotifyPlaylist.objects.count()
+        )
+
+    def test_command_refuses_an_existing_prefix(self):
+        out = StringIO()
+        call_command('seed_load_data', users=3, tracks=5, no_analyze=True, stdout=out)
+        self.assertIn('accounts.User: 3 rows', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('seed_load_data', users=3, tracks=5, stdout=StringIO())
+
+
+class DashboardStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', email='staff@example.com', is_staff=True)
+        cls.add_spotify_user('first')
+
+    @staticmethod
+    def add_spotify_user(name):
+        user = User.objects.create_user(username=name, email=f'{name}@example.com')
+        SpotifyUser.objects.create(user=user, spotify_id=name, access_token='t', token_expires_at=timezone.now())
+
+    def test_command_stores_every_figure(self):
+        out = StringIO()
+        call_command('refresh_dashboard_stats', stdout=out)
+        self.assertEqual(set(DashboardStat.objects.values_list('key', flat=True)), set(STAT_KEYS))
+        self.assertIn('total_users: 1', out.getvalue())
+
+    def test_stale_figures_are_recomputed(self):
+        call_command('refresh_dashboard_stats', stdout=StringIO())
+        self.add_spotify_user('second')
+        self.assertEqual(get_dashboard_stats()['total_users'].value, 1)
+
+        DashboardStat.objects.filter(key='new_users_week').update(refreshed_at=timezone.now() - timedelta(hours=2))
+        with self.settings(ADMIN_STATS_MAX_AGE=3600):
+            self.assertEqual(get_dashboard_stats()['total_users'].value, 2)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_refresh_is_a_post_behind_csrf(self):
+        call_command('refresh_dashboard_stats', stdout=StringIO())
+        self.add_spotify_user('second')
+
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.staff)
+        client.get('/admin/dashboard/?refresh=1')
+        self.assertEqual(client.post('/admin/dashboard/').status_code, 403)
+        self.assertEqual(DashboardStat.objects.get(key='total_users').value, 1)
+
+        client.get('/admin/dashboard/')
+        response = client.post('/admin/dashboard/', {'csrfmiddlewaretoken': client.cookies['csrftoken'].value})
+        self.assertRedirects(response, '/admin/dashboard/')
+        self.assertEqual(DashboardStat.objects.get(key='total_users').value, 2)
+
+
+class BackgroundExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', email='staff@example.com', is_staff=True)
+
+    def setUp(self):
+        self.exports_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.exports_root, ignore_errors=True)
+        override = self.settings(EXPORTS_ROOT=self.exports_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def run_action(self, action, slots=None):
+        request = RequestFactory().post('/admin/spotify_integration/spotifyuser/')
+        request.user = self.staff
+        modeladmin = admin.site._registry[SpotifyUser]
+        slots = slots or threading.BoundedSemaphore(2)
+        with mock.patch('spotify_integration.admin.threading.Thread') as thread, \
+                mock.patch('spotify_integration.admin._export_slots', slots), \
+                mock.patch.object(modeladmin, 'message_user') as message_user:
+            response = action(modeladmin, request, SpotifyUser.objects.all())
+        return response, thread, message_user
+
+    def start_export(self):
+        response, thread, message_user = self.run_action(export_to_csv_background)
+        path = thread.call_args.kwargs['args'][1]
+        path.write_text('spotify_id,access_token\n')
+        return path
+
+    def test_streaming_export(self):
+        SpotifyUser.objects.create(
+            user=self.staff, spotify_id='staff-spotify', access_token='token', token_expires_at=timezone.now()
+        )
+        response, thread, message_user = self.run_action(export_to_csv)
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][:3], ['id', 'user_id', 'spotify_id'])
+        self.assertEqual(rows[1][1:3], [str(self.staff.pk), 'staff-spotify'])
+        self.assertEqual(len(rows), 2)
+
+    def test_concurrent_exports_are_capped(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        response, thread, message_user = self.run_action(export_to_csv_background, slots)
+        thread.assert_not_called()
+        self.assertEqual(message_user.call_args.args[2], messages.WARNING)
+
+    def test_failed_export_leaves_no_part_file(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+
+        def rows(queryset):
+            yield 'id\n'
+            raise DatabaseError('connection lost')
+
+        path = self.exports_root / 'failed.csv'
+        with mock.patch('spotify_integration.admin.iter_csv_rows', rows), \
+                mock.patch('spotify_integration.admin._export_slots', slots), \
+                self.assertLogs('spotify_integration.admin', 'ERROR'):
+            _write_export(SpotifyUser.objects.all(), path)
+        self.assertEqual(list(self.exports_root.iterdir()), [])
+        self.assertTrue(slots.acquire(blocking=False))
+
+    def test_parts_left_by_a_restart_are_removed(self):
+        stale, running = self.exports_root / 'stale.csv.part', self.exports_root / 'running.csv.part'
+        for partial in (stale, running):
+            partial.write_text('id\n')
+        os.utime(stale, (time.time() - 7200, time.time() - 7200))
+        self.run_action(export_to_csv_background)
+        self.assertFalse(stale.exists())
+        self.assertTrue(running.exists())
+
+    def test_exports_are_private_with_unguessable_names(self):
+        path = self.start_export()
+        self.assertEqual(path.parent, self.exports_root)
+        self.assertRegex(path.name, r'^spotify_integration-spotifyuser-\d{8}-\d{6}-[0-9a-f]{16}\.csv$')
+
+        # What static(MEDIA_URL) serves when DEBUG is on
+        with self.assertRaises(Http404):
+            serve(RequestFactory().get(f'/media/exports/{path.name}'), f'exports/{path.name}',
+                  document_root=settings.MEDIA_ROOT)
+        self.assertEqual(self.client.get(f'/media/exports/{path.name}').status_code, 404)
+
+    def test_download_is_staff_only(self):
+        path = self.start_export()
+        url = f'/admin/exports/{path.name}/'
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'spotify_id,access_token\n')
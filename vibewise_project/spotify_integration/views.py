@@ -1,11 +1,15 @@
 # Add to api/views.py or spotify_integration/views.py
 
+import logging
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.contrib.auth.decorators import login_required
 from spotify_integration.models import SpotifyPlaylist, SpotifyUser, MoodDetectionResult
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+from api.metrics import spotify_session
+
+logger = logging.getLogger(__name__)
 
 @api_view(['GET'])
 def get_user_playlists(request):
@@ -18,7 +22,7 @@ def get_user_playlists(request):
             return Response({'playlists': []})
         
         # Initialize Spotify client
-        sp = spotipy.Spotify(auth=spotify_user.access_token)
+        sp = spotipy.Spotify(auth=spotify_user.access_token, requests_session=spotify_session())
         
         # Get user's VibeWise playlists from database
         db_playlists = SpotifyPlaylist.objects.filter(user=request.user).order_by('-created_at')
@@ -46,7 +50,7 @@ def get_user_playlists(request):
                     'created_at': playlist.created_at.isoformat(),
                 })
             except Exception as e:
-                print(f"Error fetching playlist {playlist.spotify_id}: {e}")
+                logger.warning("Error fetching playlist %s: %s", playlist.spotify_id, e)
                 # Use database value as fallback
                 playlists_data.append({
                     'id': playlist.id,
@@ -65,7 +69,7 @@ def get_user_playlists(request):
         })
         
     except Exception as e:
-        print(f"Error in get_user_playlists: {e}")
+        logger.exception("Error in get_user_playlists: %s", e)
         return Response({'error': str(e)}, status=500)
 
 
@@ -116,7 +120,7 @@ def create_mood_playlist(request):
         spotify_user.save()
         
         # Initialize Spotify client
-        sp = spotipy.Spotify(auth=access_token)
+        sp = spotipy.Spotify(auth=access_token, requests_session=spotify_session())
         
         # Get user's Spotify profile
         user_profile = sp.current_user()
@@ -189,7 +193,5 @@ def create_mood_playlist(request):
         })
         
     except Exception as e:
-        print(f"Error creating playlist: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error creating playlist: %s", e)
         return Response({'error': str(e)}, status=500)
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""
+SQLite backend for single-node production (ENGINE = 'vibewise_project.sqlite_backend')
+
+Django's stock SQLite settings suit development: rollback journal, so
+readers block behind a writer, and writers that collide inside
+transactions fail with "database is locked". This wrapper:
+
+- switches every connection to WAL with synchronous=NORMAL, a busy_timeout
+  and memory-mapped reads (tunable through OPTIONS, see PRAGMA_DEFAULTS);
+- starts transactions with BEGIN IMMEDIATE, so a transaction takes the
+  write lock up front instead of failing when it upgrades from reading;
+- funnels writes from all threads of the process through one WriterLock
+  per database file: transactions hold it from BEGIN to COMMIT/ROLLBACK
+  and autocommit INSERT/UPDATE/DELETE statements for their duration.
+  Threads queue on the lock instead of spinning in SQLite's busy handler,
+  and plain SELECTs never wait for it.
+
+Every atomic() block takes the writer lock, read-only ones included: a
+transaction can't know up front whether it will write, and upgrading a
+deferred one later is what fails with "database is locked". Keep reads
+out of atomic() (ATOMIC_REQUESTS stays off) so they don't queue behind
+writers. The lock is released once COMMIT or ROLLBACK has succeeded, or
+when the connection is closed; a failed COMMIT leaves the transaction
+open and the lock held until Django rolls it back.
+
+Pair it with CONN_MAX_AGE so threads keep their connection between
+requests; WAL readers then reuse the page cache and mmap.
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base as sqlite3_base
+
+# PRAGMA name -> default; override any of them in DATABASES[...]['OPTIONS']
+PRAGMA_DEFAULTS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,         # ms
+    'mmap_size': 256 * 1024 ** 2,  # bytes
+    'cache_size': -64000,          # KiB when negative
+    'temp_store': 'MEMORY',
+}
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLAC')
+
+
+class WriterLock:
+    """Process-wide lock for one database file, with contention counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.acquired = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def acquire(self, timeout):
+        if self._lock.acquire(blocking=False):
+            waited = 0.0
+        else:
+            start = time.perf_counter()
+            acquired = self._lock.acquire(timeout=timeout)
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.contended += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+                if not acquired:
+                    self.timeouts += 1
+            if not acquired:
+                raise OperationalError(f'database is locked (waited {waited:.1f}s for the writer lock)')
+        with self._stats_lock:
+            self.acquired += 1
+
+    def release(self):
+        self._lock.release()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'acquired': self.acquired,
+                'contended': self.contended,
+                'timeouts': self.timeouts,
+                'wait_seconds': round(self.wait_seconds, 6),
+                'max_wait_seconds': round(self.max_wait_seconds, 6),
+                'locked': self._lock.locked(),
+            }
+
+
+_writer_locks = {}
+_writer_locks_guard = threading.Lock()
+
+
+def get_writer_lock(name):
+    with _writer_locks_guard:
+        if name not in _writer_locks:
+            _writer_locks[name] = WriterLock()
+        return _writer_locks[name]
+
+
+def writer_lock_stats():
+    """Contention figures per database file"""
+    with _writer_locks_guard:
+        locks = dict(_writer_locks)
+    return {str(name): lock.stats() for name, lock in locks.items()}
+
+
+class SerializedCursor(sqlite3_base.SQLiteCursorWrapper):
+    """Takes the writer lock around autocommit writes"""
+
+    def __init__(self, connection, wrapper):
+        super().__init__(connection)
+        self.wrapper = wrapper
+
+    def _locked(self, query):
+        return (
+            not self.connection.in_transaction
+            and query.lstrip()[:6].upper() in WRITE_STATEMENTS
+        )
+
+    def execute(self, query, params=None):
+        if not self._locked(query):
+            return super().execute(query, params)
+        with self.wrapper.holding_writer_lock():
+            return super().execute(query, params)
+
+    def executemany(self, query, param_list):
+        if not self._locked(query):
+            return super().executemany(query, param_list)
+        with self.wrapper.holding_writer_lock():
+            return super().executemany(query, param_list)
+
+
+class DatabaseWrapper(sqlite3_base.DatabaseWrapper):
+    # Whether this connection's open transaction holds the writer lock
+    _writer_lock_held = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {
+            name: kwargs.pop(name, default) for name, default in PRAGMA_DEFAULTS.items()
+        }
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            if name == 'journal_mode' and self.is_in_memory_db():
+                continue
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    @property
+    def writer_lock(self):
+        return get_writer_lock(self.settings_dict['NAME'])
+
+    def _writer_lock_timeout(self):
+        # Queue on the lock for as long as SQLite would retry a busy database
+        busy_timeout = self.settings_dict['OPTIONS'].get('busy_timeout', PRAGMA_DEFAULTS['busy_timeout'])
+        return busy_timeout / 1000
+
+    @contextmanager
+    def holding_writer_lock(self):
+        self.writer_lock.acquire(self._writer_lock_timeout())
+        try:
+            yield
+        finally:
+            self.writer_lock.release()
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=functools.partial(SerializedCursor, wrapper=self))
+
+    def _start_transaction_under_autocommit(self):
+        self.writer_lock.acquire(self._writer_lock_timeout())
+        self._writer_lock_held = True
+        try:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        except Exception:
+            self._release_writer_lock()
+            raise
+
+    def _release_writer_lock(self):
+        if self._writer_lock_held:
+            self._writer_lock_held = False
+            self.writer_lock.release()
+
+    def _commit(self):
+        result = super()._commit()
+        self._release_writer_lock()
+        return result
+
+    def _rollback(self):
+        result = super()._rollback()
+        self._release_writer_lock()
+        return result
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_writer_lock()
@@ -15,14 +15,9 @@ class AuthManager {
         console.log('✅ Auth ready');
     }
 
-    async checkAuthStatus() {
+    async checkAuthStatus(refresh = false) {
         try {
-            const response = await fetch('/api/spotify/status/', {
-                credentials: 'same-origin',
-                cache: 'no-cache'
-            });
-            
-            const data = await response.json();
+            const data = await Utils.getSpotifyStatus({ refresh });
             
             if (data.connected && data.user) {
                 this.isLoggedIn = true;
@@ -118,6 +113,7 @@ class AuthManager {
                 // Clear local state
                 this.isLoggedIn = false;
                 this.userData = null;
+                Utils.clearSpotifyStatus();
                 
                 // Clear storage
                 sessionStorage.clear();
@@ -4,11 +4,7 @@ console.log('Auth check loaded');
 const AuthCheck = {
     async checkSpotifyConnection() {
         try {
-            const response = await fetch('/api/spotify/status/', {
-                credentials: 'same-origin'
-            });
-            
-            const data = await response.json();
+            const data = await Utils.getSpotifyStatus();
             return data.connected || false;
         } catch (error) {
             console.error('Error checking Spotify connection:', error);
@@ -5,6 +5,7 @@ let video = null;
 let canvas = null;
 let stream = null;
 let authCheckInProgress = false; // Prevent duplicate checks
+let playlistRequestKey = null; // Idempotency key for the current mood result
 
 // Initialize camera on page load
 document.addEventListener('DOMContentLoaded', function() {
@@ -123,12 +124,7 @@ async function quickAuthCheck() {
     try {
         if (!window.authManager) return false;
         
-        const response = await fetch('/api/spotify/status/', {
-            credentials: 'same-origin',
-            cache: 'no-cache'
-        });
-        
-        const data = await response.json();
+        const data = await Utils.getSpotifyStatus();
         
         if (!data.connected) {
             showMessage('Session expired. Please login again.', 'error');
@@ -338,6 +334,9 @@ function displayMoodResult(result) {
     const emoji = moodEmojis[result.mood] || '😊';
     const confidence = (result.confidence * 100).toFixed(1);
     
+    // Retries and double-clicks for this result reuse the same key
+    playlistRequestKey = Utils.generateId();
+    
     const resultContainer = document.getElementById('moodResult');
     if (resultContainer) {
         resultContainer.innerHTML = `
@@ -376,7 +375,8 @@ function createPlaylistForMood(mood) {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
-            'X-CSRFToken': csrfToken
+            'X-CSRFToken': csrfToken,
+            'Idempotency-Key': playlistRequestKey || Utils.generateId()
         },
         credentials: 'same-origin',
         body: JSON.stringify({ mood: mood })
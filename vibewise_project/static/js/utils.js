@@ -49,6 +49,41 @@ class Utils {
         return Date.now().toString(36) + Math.random().toString(36).substr(2);
     }
 
+    // Spotify connection status, shared by every script on the page.
+    // Concurrent callers get the same request and the answer is reused for
+    // STATUS_MAX_AGE ms; pass { refresh: true } to ask the server again.
+    static getSpotifyStatus(options = {}) {
+        const fresh = Utils._statusFetchedAt &&
+            Date.now() - Utils._statusFetchedAt < Utils.STATUS_MAX_AGE;
+
+        if (Utils._statusPromise && !options.refresh && (fresh || !Utils._statusFetchedAt)) {
+            return Utils._statusPromise;
+        }
+
+        Utils._statusFetchedAt = null;
+        Utils._statusPromise = fetch('/api/spotify/status/', {
+            credentials: 'same-origin',
+            cache: 'no-cache' // revalidates with the ETag, usually a 304
+        })
+            .then(response => response.json())
+            .then(data => {
+                Utils._statusFetchedAt = Date.now();
+                return data;
+            })
+            .catch(error => {
+                Utils._statusPromise = null;
+                throw error;
+            });
+
+        return Utils._statusPromise;
+    }
+
+    // Forget the shared status, e.g. after logging out
+    static clearSpotifyStatus() {
+        Utils._statusPromise = null;
+        Utils._statusFetchedAt = null;
+    }
+
     // Get mood emoji
     static getMoodEmoji(mood) {
         const emojis = {
@@ -119,6 +154,10 @@ class Utils {
     }
 }
 
+Utils.STATUS_MAX_AGE = 30000;
+Utils._statusPromise = null;
+Utils._statusFetchedAt = null;
+
 // Music Background
 class MusicBackground {
     static init() {
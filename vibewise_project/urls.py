@@ -3,15 +3,29 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
-from spotify_integration.admin_views import admin_dashboard
+from api.metrics import metrics_view
+from spotify_integration.admin_views import admin_dashboard, export_download
+from vibewise_project.memory import memory_diff, memory_report, memory_snapshots, memory_tracing
+from vibewise_project.profiling import profile_download, profile_list
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    # Before admin.site.urls, whose catch-all view would shadow it
     path('admin/dashboard/', admin_dashboard, name='admin_dashboard'),
+    path('admin/exports/<str:filename>/', export_download, name='admin_export_download'),
+    path('admin/profiles/', profile_list, name='admin_profiles'),
+    path('admin/profiles/<str:filename>/', profile_download, name='admin_profile_download'),
+    path('admin/memory/', memory_report, name='admin_memory'),
+    path('admin/memory/tracing/', memory_tracing, name='admin_memory_tracing'),
+    path('admin/memory/snapshots/', memory_snapshots, name='admin_memory_snapshots'),
+    path('admin/memory/snapshots/<int:snapshot_id>/diff/', memory_diff, name='admin_memory_diff'),
+    path('admin/', admin.site.urls),
     
     # API endpoints
     path('api/', include('api.urls')),
     
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
+    
     # Frontend pages
     path('', TemplateView.as_view(template_name='index.html'), name='index'),
     path('login/', TemplateView.as_view(template_name='login.html'), name='login'),